@@ -24,6 +24,7 @@ import sys
 from cloudinstall import pegasus
 from cloudinstall.juju.client import JujuClient
 from cloudinstall.juju import JujuState
+from cloudinstall.charms.relations import RelationPlan
 
 log = logging.getLogger('cloudinstall.charms')
 
@@ -45,27 +46,38 @@ class CharmBase:
     deploy_priority = sys.maxsize
     allow_multi_units = False
     optional = False
+    # Seconds a deploy is expected to take, see DeployScheduler
+    deploy_estimate = 30
 
-    def __init__(self, juju_state=None, machine=None):
+    def __init__(self, juju_state=None, machine=None, juju_client=None,
+                 single=None):
         """ initialize
 
         :param state: :class:JujuState
         :param machine: :class:Machine
+        :param juju_client: (optional) :class:JujuClient to share
+        :param bool single: (optional) single system install or not,
+                            the installed mode from pegasus when omitted
         """
         self.charm_path = None
         self.exposed = False
         self.juju_state = juju_state
         assert isinstance(self.juju_state, JujuState)
         self.machine = machine
-        self.client = JujuClient()
+        self.client = juju_client or JujuClient()
+        self.single = single
 
     @property
     def is_single(self):
-        return pegasus.SINGLE_SYSTEM
+        if self.single is None:
+            return pegasus.SINGLE_SYSTEM
+        return self.single
 
     @property
     def is_multi(self):
-        return pegasus.MULTI_SYSTEM
+        if self.single is None:
+            return pegasus.MULTI_SYSTEM
+        return not self.single
 
     def openstack_password(self):
         PASSWORD_FILE = expanduser('~/.cloud-install/openstack.passwd')
@@ -102,11 +114,14 @@ class CharmBase:
             return class_.charm_name
         return class_.__name__.lower()
 
-    def setup(self, _id=None):
-        """ Deploy charm and configuration options
+    def deploy_settings(self, _id=None):
+        """ Settings the charm is deployed with, see JujuClient.deploy
 
-        The default should be sufficient but if more functionality
-        is needed this should be overridden.
+        Override in charm specific to change them, setup() and bundles
+        both use these.
+
+        :param str _id: (optional) machine to deploy to
+        :rtype: dict
         """
         kwds = {}
         kwds['machine_id'] = _id
@@ -118,27 +133,40 @@ class CharmBase:
             kwds['machine_id'] = None
             kwds['instances'] = 1
             kwds['constraints'] = self.constraints
-            self.client.deploy(self.charm_name, kwds)
-        else:
-            self.client.deploy(self.charm_name, kwds)
+        return kwds
+
+    def setup(self, _id=None):
+        """ Deploy charm and configuration options
+
+        The default should be sufficient but if more functionality
+        is needed this should be overridden.
+        """
+        self.client.deploy(self.charm_name, self.deploy_settings(_id))
+
+    def relation_endpoints(self, charm):
+        """ Endpoints relating this charm to another one
+
+        Override in charm specific to pick the endpoints.
+
+        :param str charm: name of the other charm
+        :returns: (endpoint of this charm, endpoint of the other)
+        :rtype: tuple
+        """
+        return (self.charm_name, charm)
+
+    def relate(self, charm):
+        """ Add a relation between this charm and another one
+
+        :param str charm: name of the other charm
+        """
+        self.client.add_relation(*self.relation_endpoints(charm))
 
     def set_relations(self):
         """ Setup charm relations
 
-        Override in charm specific.
+        Adds the missing ones concurrently, see RelationPlan.
         """
-        if len(self.related) > 0:
-            services = self.juju_state.service(self.charm_name)
-            for charm in self.related:
-                try:
-                    if not self.is_related(charm, services.relations) \
-                       and len(list(services.relations)) != 0:
-                        self.client.add_relation(self.charm_name,
-                                                 charm)
-                except:
-                    log.exception("Ignoring exception in set_relations.")
-                    log.debug("No relations "
-                              "found for {c}".format(c=self.charm_name))
+        RelationPlan([self.__class__]).apply(self.juju_state, self.client)
 
     def post_proc(self):
         """ Perform any post processing
@@ -0,0 +1,168 @@
+#
+# bundle.py - Charm set as a juju-deployer bundle
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Renders charm classes into a bundle and deploys it in one go """
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import yaml
+
+from cloudinstall.charms import CHARM_CONFIG
+from cloudinstall.charms.registry import registry
+from cloudinstall.charms.relations import RelationPlan
+from cloudinstall.juju import JujuState
+from cloudinstall.utils import get_command_output
+
+log = logging.getLogger('cloudinstall.charms.bundle')
+
+BUNDLE_NAME = 'openstack'
+BUNDLE_SERIES = 'trusty'
+
+# Seconds juju-deployer gets to deploy the bundle
+BUNDLE_TIMEOUT = 3600
+
+
+def constraints_string(constraints):
+    """ Constraints as juju takes them on the command line
+
+    :param dict constraints: e.g. {'mem': '4G'}
+    :returns: e.g. 'mem=4G'
+    :rtype: str
+    """
+    return " ".join("{k}={v}".format(k=k, v=v)
+                    for k, v in sorted(constraints.items()))
+
+
+def bundle(charm_classes, juju_state=None, machine_id=None,
+           name=BUNDLE_NAME, series=BUNDLE_SERIES):
+    """ juju-deployer bundle for a set of charms
+
+    Each charm contributes what its setup() would deploy, see
+    CharmBase.deploy_settings, with options from CHARM_CONFIG. The
+    relations come from a RelationPlan.
+
+    :param list charm_classes: CharmBase subclasses
+    :param juju_state: (optional) :class:JujuState passed to the charms
+    :param str machine_id: (optional) where charms that aren't isolated
+                           go, e.g. 'lxc:1'
+    :param str name: (optional) name of the deployment
+    :param str series: (optional) ubuntu series of the charms
+    :rtype: dict
+    """
+    juju_state = juju_state or JujuState({})
+    services = {}
+    charms = {}
+    for charm_class in charm_classes:
+        charm = charm_class(juju_state=juju_state)
+        charms[charm.name()] = charm
+        settings = charm.deploy_settings(machine_id)
+        service = dict(charm="cs:{series}/{charm}".format(
+            series=series, charm=charm.charm_name),
+            num_units=int(settings.get('instances', 1)))
+        if settings.get('machine_id'):
+            service['to'] = str(settings['machine_id'])
+        if settings.get('constraints'):
+            service['constraints'] = constraints_string(
+                settings['constraints'])
+        options = CHARM_CONFIG.get(charm.charm_name)
+        if 'configfile' in settings and options:
+            service['options'] = dict(options)
+        services[charm.name()] = service
+
+    relations = [list(charms[a].relation_endpoints(b)) for a, b in
+                 RelationPlan(charm_classes).missing(services=services)]
+    return {name: dict(series=series,
+                       services=services,
+                       relations=relations)}
+
+
+def render(document):
+    """ Bundle document as YAML
+
+    :rtype: str
+    """
+    return yaml.safe_dump(document, default_flow_style=False)
+
+
+def apply(document, name=BUNDLE_NAME, timeout=BUNDLE_TIMEOUT):
+    """ Deploy a whole bundle with a single juju-deployer run
+
+    Services that are already deployed are left alone by juju-deployer.
+
+    :param dict document: bundle, see bundle()
+    :param str name: (optional) deployment in the bundle to deploy
+    :param int timeout: (optional) seconds to wait for juju-deployer
+    :returns: (success, juju-deployer output)
+    :rtype: tuple
+    """
+    fd, path = tempfile.mkstemp(prefix='cloud-install-', suffix='.yaml')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(render(document))
+        cmd = "juju-deployer -c {path} {name}".format(path=path, name=name)
+        log.debug("Deploying bundle: {cmd}".format(cmd=cmd))
+        ret, out, _, _ = get_command_output(cmd, timeout=timeout)
+        if ret:
+            log.warning("Bundle deploy error ({cmd}): {out}".format(
+                cmd=cmd, out=out))
+        return (ret == 0, out)
+    finally:
+        os.remove(path)
+
+
+def main(argv=None):
+    """ Command line entry point, see cloud-bundle --help
+
+    :returns: exit status, 0 once the bundle is written or deployed
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        description="Print the OpenStack charms as a juju-deployer "
+        "bundle, or deploy them all at once.")
+    parser.add_argument('--to', metavar='MACHINE',
+                        help="placement of charms sharing the controller, "
+                        "e.g. lxc:1")
+    parser.add_argument('--optional', action='store_true',
+                        help="include optional charms")
+    parser.add_argument('--name', default=BUNDLE_NAME,
+                        help="deployment name (default: %(default)s)")
+    parser.add_argument('--series', default=BUNDLE_SERIES,
+                        help="charm series (default: %(default)s)")
+    parser.add_argument('--apply', action='store_true',
+                        help="deploy the bundle with juju-deployer")
+    parser.add_argument('--timeout', type=int, default=BUNDLE_TIMEOUT,
+                        help="seconds to wait for juju-deployer "
+                        "(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.optional:
+        charm_classes = registry().by_priority()
+    else:
+        charm_classes = registry().required()
+    document = bundle(charm_classes, machine_id=args.to, name=args.name,
+                      series=args.series)
+
+    if not args.apply:
+        sys.stdout.write(render(document))
+        return 0
+    ok, out = apply(document, args.name, args.timeout)
+    print(out)
+    return 0 if ok else 1
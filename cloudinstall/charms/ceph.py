@@ -37,8 +37,8 @@ class CharmCeph(CharmBase):
     def has_quorum(self):
         return len(list(self.state[2].machines_allocated())) >= 3
 
-    def setup(self):
-        """ Custom setup for ceph """
+    def setup(self, _id=None):
+        """ Custom setup for ceph, always on machines of its own """
         if not self.has_quorum():
             log.debug("Insufficient machines allocated - ceph can't deploy.")
             return
@@ -46,7 +46,9 @@ class CharmCeph(CharmBase):
             log.debug("Ceph not currently supported on single installs")
             return
 
-        self.client.deploy(self.charm_name,
-                           dict(instances=self.default_instances))
+        self.client.deploy(self.charm_name, self.deploy_settings())
+
+    def deploy_settings(self, _id=None):
+        return dict(instances=self.default_instances)
 
 __charm_class__ = CharmCeph
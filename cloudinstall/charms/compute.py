@@ -30,13 +30,12 @@ class CharmNovaCompute(CharmBase):
                    'root-disk': '10G'}
     allow_multi_units = True
 
-    def set_relations(self):
-        super(CharmNovaCompute, self).set_relations()
-        services = self.juju_state.service(self.charm_name)
-        for charm in self.related:
-            if not self.is_related(charm, services.relations) \
-               and 'rabbitmq-server' in charm:
-                self.client.add_relation("{c}:amqp".format(c=self.charm_name),
-                                         "rabbitmq-server:amqp")
+    deploy_estimate = 300
+
+    def relation_endpoints(self, charm):
+        if charm == 'rabbitmq-server':
+            return ("{c}:amqp".format(c=self.charm_name),
+                    "rabbitmq-server:amqp")
+        return super(CharmNovaCompute, self).relation_endpoints(charm)
 
 __charm_class__ = CharmNovaCompute
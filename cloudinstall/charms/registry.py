@@ -0,0 +1,189 @@
+#
+# registry.py - Known charm classes
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Discovers charm classes once and keeps them sorted for the gui """
+
+from importlib import import_module
+from operator import attrgetter
+import logging
+import pkgutil
+import threading
+
+import cloudinstall.charms
+
+log = logging.getLogger('cloudinstall.charms.registry')
+
+# Third party packages list extra charm modules or classes under this
+# entry point group
+ENTRY_POINT_GROUP = 'cloudinstall.charms'
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class CharmRegistry:
+    """ Charm classes from the modules of cloudinstall.charms and from
+    entry point plugins
+
+    Each module defines its class as `__charm_class__`. Modules are
+    imported once, on first use.
+    """
+
+    def __init__(self, package=cloudinstall.charms,
+                 entry_point_group=ENTRY_POINT_GROUP):
+        """ Constructor
+
+        :param package: package holding the charm modules
+        :param str entry_point_group: (optional) entry point group of
+                                      plugin charms, None for none
+        """
+        self.package = package
+        self.entry_point_group = entry_point_group
+        self._lock = threading.Lock()
+        self._charm_classes = None
+
+    def _scan(self):
+        """ Charm classes of the package's modules
+
+        :rtype: list
+        """
+        charm_classes = []
+        for (_, mname, _) in pkgutil.iter_modules(self.package.__path__):
+            module = import_module(self.package.__name__ + '.' + mname)
+            if hasattr(module, '__charm_class__'):
+                charm_classes.append(module.__charm_class__)
+        return charm_classes
+
+    def _plugins(self):
+        """ Charm classes registered by other packages
+
+        An entry point names either a charm class or a module with a
+        `__charm_class__`.
+
+        :rtype: list
+        """
+        if not self.entry_point_group:
+            return []
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        charm_classes = []
+        for ep in pkg_resources.iter_entry_points(self.entry_point_group):
+            try:
+                obj = ep.load()
+            except Exception:
+                log.exception("Unable to load charm plugin {ep}".format(ep=ep))
+                continue
+            charm_classes.append(getattr(obj, '__charm_class__', obj))
+        return charm_classes
+
+    def _load(self):
+        charm_classes = self._scan()
+        names = set(c.name() for c in charm_classes)
+        for c in self._plugins():
+            if c.name() in names:
+                log.debug("Ignoring plugin charm {c}, already "
+                          "known".format(c=c.name()))
+                continue
+            names.add(c.name())
+            charm_classes.append(c)
+        return sorted(charm_classes, key=lambda c: c.name())
+
+    @property
+    def charm_classes(self):
+        """ All charm classes, by name
+
+        :rtype: list
+        """
+        if self._charm_classes is None:
+            with self._lock:
+                if self._charm_classes is None:
+                    charm_classes = self._load()
+                    self._by_priority = sorted(
+                        charm_classes, key=attrgetter('deploy_priority'))
+                    self._required = [c for c in self._by_priority
+                                      if not c.optional]
+                    self._optional = [c for c in self._by_priority
+                                      if c.optional]
+                    self._multi_units = [c for c in charm_classes
+                                         if c.allow_multi_units]
+                    self._charm_classes = charm_classes
+        return self._charm_classes
+
+    def by_priority(self):
+        """ All charm classes in deploy_priority order
+
+        :rtype: list
+        """
+        self.charm_classes
+        return list(self._by_priority)
+
+    def required(self):
+        """ Charm classes deployed by default, in deploy_priority order
+
+        :rtype: list
+        """
+        self.charm_classes
+        return list(self._required)
+
+    def optional(self):
+        """ Optional charm classes, in deploy_priority order
+
+        :rtype: list
+        """
+        self.charm_classes
+        return list(self._optional)
+
+    def multi_units(self):
+        """ Charm classes that can have units added, by name
+
+        :rtype: list
+        """
+        self.charm_classes
+        return list(self._multi_units)
+
+    def charm_class(self, name):
+        """ Charm class by charm name
+
+        :param str name: charm name
+        :returns: charm class or None
+        """
+        for c in self.charm_classes:
+            if c.name() == name:
+                return c
+        return None
+
+    def refresh(self):
+        """ Forget the charm classes, they are discovered again on next
+        use
+        """
+        with self._lock:
+            self._charm_classes = None
+
+
+def registry():
+    """ Shared charm registry, discovered once per process
+
+    :rtype: CharmRegistry()
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = CharmRegistry()
+    return _registry
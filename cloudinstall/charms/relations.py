@@ -0,0 +1,126 @@
+#
+# relations.py - Relations between charms
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Plans the relations of all charms at once and adds the missing ones """
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+from cloudinstall.juju.client import JujuClient
+
+log = logging.getLogger('cloudinstall.charms.relations')
+
+# Relations added at the same time
+RELATION_WORKERS = 8
+
+
+def juju_relations(juju_state):
+    """ Pairs of services related in juju
+
+    :param juju_state: :class:JujuState
+    :returns: set of frozenset({service, service})
+    :rtype: set
+    """
+    related = set()
+    for service in juju_state.services:
+        for relation in service.relations:
+            for charm in relation.charms:
+                if charm != service.service_name:
+                    related.add(frozenset((service.service_name, charm)))
+    return related
+
+
+class RelationPlan:
+    """ Every relation the charms ask for, once each
+
+    A relation listed by both of its charms is kept for the charm that
+    comes first, which also picks its endpoints through relate().
+    """
+
+    def __init__(self, charm_classes):
+        """ Constructor
+
+        :param list charm_classes: CharmBase subclasses, in the order
+                                   they should get to add relations
+        """
+        self.charm_classes = {c.name(): c for c in charm_classes}
+        self.relations = []
+        seen = set()
+        for charm_class in charm_classes:
+            for other in charm_class.related:
+                pair = frozenset((charm_class.name(), other))
+                if len(pair) == 2 and pair not in seen:
+                    seen.add(pair)
+                    self.relations.append((charm_class.name(), other))
+
+    def missing(self, existing=(), services=None):
+        """ Planned relations that don't exist yet
+
+        :param existing: pairs of service names already related
+        :param services: (optional) names of the services that exist,
+                         relations need both of theirs
+        :rtype: list of (name, name)
+        """
+        existing = set(frozenset(pair) for pair in existing)
+        return [pair for pair in self.relations
+                if frozenset(pair) not in existing and
+                (services is None or set(pair) <= set(services))]
+
+    def diff(self, juju_state):
+        """ Planned relations missing from juju between deployed services
+
+        :param juju_state: :class:JujuState
+        :rtype: list of (name, name)
+        """
+        services = [s.service_name for s in juju_state.services]
+        return self.missing(juju_relations(juju_state), services)
+
+    def apply(self, juju_state, juju_client=None,
+              max_workers=RELATION_WORKERS):
+        """ Add the relations juju is missing, concurrently
+
+        Relations go through the first charm's relate().
+
+        :param juju_state: :class:JujuState
+        :param juju_client: (optional) :class:JujuClient to use
+        :param int max_workers: (optional) relations added at once
+        :returns: { (name, name): (success, seconds taken) }
+        :rtype: dict
+        """
+        def relate(pair):
+            start = time.time()
+            charm = self.charm_classes[pair[0]](juju_state=juju_state,
+                                                juju_client=juju_client)
+            try:
+                charm.relate(pair[1])
+                ok = True
+            except Exception:
+                log.exception("Relating {a} and {b} failed".format(
+                    a=pair[0], b=pair[1]))
+                ok = False
+            return (ok, time.time() - start)
+
+        pairs = self.diff(juju_state)
+        if not pairs:
+            return {}
+        juju_client = juju_client or JujuClient()
+        log.debug("Adding relations {p}".format(p=pairs))
+        workers = max(1, min(max_workers, len(pairs)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(pairs, executor.map(relate, pairs)))
@@ -30,14 +30,14 @@ class CharmSwift(CharmBase):
     isolate = True
     allow_multi_units = True
 
-    def setup(self):
-        """Custom setup for swift-storage to get replicas from config"""
+    def deploy_settings(self, _id=None):
+        """Custom settings for swift-storage to get replicas from config"""
         if 'swift-proxy' in CHARM_CONFIG:
             num_replicas = CHARM_CONFIG.get('replicas',
                                             self.default_replicas)
         else:
             num_replicas = self.default_replicas
 
-        self.client.deploy(self.charm_name, dict(instances=num_replicas))
+        return dict(instances=num_replicas)
 
 __charm_class__ = CharmSwift
@@ -0,0 +1,318 @@
+#
+# deploy.py - Concurrent charm deployment
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Deploys charms in dependency order, independent ones side by side """
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+from cloudinstall.charms.relations import RelationPlan
+
+log = logging.getLogger('cloudinstall.deploy')
+
+# Charms deployed at the same time
+DEPLOY_WORKERS = 4
+
+# Times a failed step is tried again, and seconds to wait before that
+DEPLOY_RETRIES = 2
+DEPLOY_RETRY_DELAY = 10
+
+
+class DeployScheduler:
+    """ Deploys charm classes following a dependency graph
+
+    A charm waits for every charm with a lower deploy_priority and for
+    the charms it lists in `related`, unless those list it back, then
+    the charm with the lower priority or name goes first. Charms whose
+    dependencies are deployed run concurrently on a bounded pool. A
+    relation is added as soon as both of its charms are deployed, and
+    a charm is finished with post_proc() once all its relations are.
+
+    A step that raises is tried again `retries` times, then recorded in
+    `failed`; nothing that depends on it runs.
+
+    With `wait_for_services`, a charm only counts as deployed once
+    observe() is told its service exists, rather than when its deploy
+    call returns.
+    """
+
+    def __init__(self, charm_classes, deploy, relate, finish=None,
+                 deployed=(), related=(), workers=DEPLOY_WORKERS,
+                 retries=DEPLOY_RETRIES, retry_delay=DEPLOY_RETRY_DELAY,
+                 wait_for_services=False, sleep=time.sleep):
+        """ Constructor
+
+        :param list charm_classes: CharmBase subclasses to set up
+        :param deploy: called with a charm class to deploy it
+        :param relate: called with two charm classes to relate them
+        :param finish: (optional) called with a charm class once it and
+                       its relations are in place
+        :param deployed: (optional) names of charms already deployed
+        :param related: (optional) pairs of names already related
+        :param int workers: (optional) deployments run at the same time
+        :param int retries: (optional) times a failed step is retried
+        :param float retry_delay: (optional) seconds before a retry
+        :param bool wait_for_services: (optional) wait for observe() to
+                                       report services as deployed
+        :param sleep: (optional) called with `retry_delay` to wait before
+                      a retry, for a simulated clock
+        """
+        self.charms = {c.name(): c for c in charm_classes}
+        self.deploy_charm = deploy
+        self.relate_charms = relate
+        self.finish_charm = finish
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.wait_for_services = wait_for_services
+        self.sleep = sleep
+        self.deps = self._dependencies()
+        self.order = self._topological_order()
+        self.relations = self._relations(related)
+
+        self.deployed = set(n for n in deployed if n in self.charms)
+        self.finished = set()
+        self.durations = {}
+        # (step, charm name or pair): error, for steps out of retries
+        self.failed = {}
+        self._attempts = {}
+        self._requested = {}
+        self._finishing = set()
+        self._started = set(self.deployed)
+        self._relations_done = set()
+        self._relations_started = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._executor = None
+        self._pending = 0
+
+    def _dependencies(self):
+        """ Names of the charms each charm waits for
+
+        :rtype: dict
+        """
+        def first(a, b):
+            return (a.deploy_priority, a.name()) < \
+                (b.deploy_priority, b.name())
+
+        deps = {name: set() for name in self.charms}
+        for name, charm in self.charms.items():
+            for other_name, other in self.charms.items():
+                if other.deploy_priority < charm.deploy_priority:
+                    deps[name].add(other_name)
+                elif other_name in charm.related and \
+                        other.deploy_priority == charm.deploy_priority:
+                    if name not in other.related or first(other, charm):
+                        deps[name].add(other_name)
+        return deps
+
+    def _topological_order(self):
+        """ Charm names, each after the charms it waits for
+
+        :raises ValueError: if charms wait on each other
+        :rtype: list
+        """
+        order = []
+        done = set()
+        remaining = sorted(self.charms, key=lambda n: (
+            self.charms[n].deploy_priority, n))
+        while remaining:
+            ready = [n for n in remaining if self.deps[n] <= done]
+            if not ready:
+                raise ValueError("Charm dependencies form a cycle: "
+                                 "{c}".format(c=remaining))
+            for n in ready:
+                order.append(n)
+                done.add(n)
+                remaining.remove(n)
+        return order
+
+    def _relations(self, existing):
+        """ Relations to add between the scheduled charms, once each
+
+        :rtype: list of (name, name)
+        """
+        plan = RelationPlan([self.charms[n] for n in self.order])
+        return plan.missing(existing, services=self.charms)
+
+    def estimate(self, name):
+        """ Seconds a charm is expected to take to deploy
+
+        Measured durations replace the charm's deploy_estimate.
+
+        :rtype: float
+        """
+        return self.durations.get(name, self.charms[name].deploy_estimate)
+
+    def critical_path(self):
+        """ Longest chain of charms that must deploy one after another
+
+        :returns: (estimated seconds, charm names in order)
+        :rtype: tuple
+        """
+        longest = {}
+        for name in self.order:
+            before = (0, [])
+            for d in self.deps[name]:
+                if longest[d][0] > before[0]:
+                    before = longest[d]
+            longest[name] = (before[0] + self.estimate(name),
+                             before[1] + [name])
+        if not longest:
+            return (0, [])
+        return max(longest.values(), key=lambda p: p[0])
+
+    @property
+    def done(self):
+        """ Has every charm been deployed, related and finished?
+
+        :rtype: bool
+        """
+        return len(self.finished) == len(self.charms)
+
+    @property
+    def active(self):
+        """ Steps running, or handed to a worker thread that is free to
+        run them
+
+        :rtype: int
+        """
+        with self._lock:
+            return min(self._pending, self.workers)
+
+    def start(self):
+        """ Start deploying in the background """
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        with self._lock:
+            self._schedule()
+
+    def wait(self, timeout=None):
+        """ Wait until no step is running
+
+        :param float timeout: (optional) seconds to wait
+        :returns: False if steps are still running
+        :rtype: bool
+        """
+        return self._idle.wait(timeout)
+
+    def run(self):
+        """ Deploy everything and wait for it to finish """
+        self.start()
+        self.wait()
+        self._executor.shutdown()
+
+    def observe(self, services):
+        """ Services juju reports, charms whose deploy call returned
+        count as deployed once their service is among them
+
+        :param services: service names
+        """
+        with self._lock:
+            for name in set(services) & set(self._requested):
+                start = self._requested.pop(name)
+                self.durations[name] = time.time() - start
+                self.deployed.add(name)
+            self._schedule()
+
+    def _submit(self, step, key):
+        self._pending += 1
+        self._idle.clear()
+        self._executor.submit(self._run_task, step, key)
+
+    def _run_task(self, step, key):
+        """ Run one step, recording or retrying it if it fails
+
+        :param str step: 'deploy', 'relate' or 'finish'
+        :param key: charm name, or pair of names for 'relate'
+        """
+        try:
+            getattr(self, '_' + step)(key)
+        except Exception as e:
+            log.exception("Deployment step {step} {key} failed".format(
+                step=step, key=key))
+            with self._lock:
+                attempts = self._attempts.get((step, key), 0) + 1
+                self._attempts[(step, key)] = attempts
+                retry = attempts <= self.retries
+                if not retry:
+                    self.failed[(step, key)] = e
+            if retry:
+                self.sleep(self.retry_delay)
+            with self._lock:
+                if retry:
+                    self._started_for(step).discard(key)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._schedule()
+
+    def _started_for(self, step):
+        return dict(deploy=self._started,
+                    relate=self._relations_started,
+                    finish=self._finishing)[step]
+
+    def _schedule(self):
+        """ Submit whatever has become possible, called under the lock """
+        for name in self.order:
+            if name not in self._started and self.deps[name] <= self.deployed:
+                self._started.add(name)
+                self._submit('deploy', name)
+
+        for pair in self.relations:
+            if pair not in self._relations_started and \
+               set(pair) <= self.deployed:
+                self._relations_started.add(pair)
+                self._submit('relate', pair)
+
+        for name in self.order:
+            if name in self._finishing or name not in self.deployed:
+                continue
+            if all(p in self._relations_done for p in self.relations
+                   if name in p):
+                self._finishing.add(name)
+                self._submit('finish', name)
+
+        if self._pending == 0:
+            self._idle.set()
+
+    def _deploy(self, name):
+        start = time.time()
+        self.deploy_charm(self.charms[name])
+        with self._lock:
+            if self.wait_for_services:
+                self._requested[name] = start
+                return
+            self.durations[name] = time.time() - start
+            self.deployed.add(name)
+        log.debug("Deployed {c} in {t:.1f}s".format(
+            c=name, t=self.durations[name]))
+
+    def _finish(self, name):
+        if self.finish_charm:
+            self.finish_charm(self.charms[name])
+        with self._lock:
+            self.finished.add(name)
+
+    def _relate(self, pair):
+        self.relate_charms(*[self.charms[n] for n in pair])
+        with self._lock:
+            self._relations_done.add(pair)
@@ -18,20 +18,21 @@
 
 """ Pegasus - gui interface to Ubuntu Cloud Installer """
 
-from operator import attrgetter
 from os import write, close, path, getenv
 from traceback import format_exc
 import re
 import threading
 import logging
-from importlib import import_module
-import pkgutil
+import time
 
 from urwid import (AttrWrap, AttrMap, Text, Columns, Overlay, LineBox,
                    ListBox, Filler, Button, BoxAdapter, Frame, WidgetWrap,
                    SimpleListWalker, Edit, CheckBox, RadioButton, IntEdit,
                    MainLoop, ExitMainLoop)
 
+from cloudinstall.charms.registry import registry as charm_registry
+from cloudinstall.charms.relations import juju_relations
+from cloudinstall.deploy import DeployScheduler, DEPLOY_WORKERS
 from cloudinstall.juju.client import JujuClient
 from cloudinstall import pegasus
 from cloudinstall import utils
@@ -78,17 +79,38 @@ class ControllerOverlay(Overlay):
     NODE_SETUP = "Your node has been correctly detected. " \
                  "Please wait until setup is complete "
 
-    def __init__(self, underlying, command_runner):
+    def __init__(self, underlying, command_runner, charm_classes=None,
+                 deploy_workers=DEPLOY_WORKERS, single=None,
+                 sleep=time.sleep):
+        """ Constructor
+
+        :param underlying: widget shown beneath the overlay
+        :param command_runner: :class:CommandRunner
+        :param list charm_classes: (optional) charms to set up, the
+                                   required charms of the registry when
+                                   omitted
+        :param int deploy_workers: (optional) charms deployed at once
+        :param bool single: (optional) single system install or not,
+                            the installed mode from pegasus when omitted
+        :param sleep: (optional) how deployment retries wait, see
+                      DeployScheduler
+        """
         self.underlying = underlying
         self.command_runner = command_runner
+        self.charm_classes = charm_classes
+        self.deploy_workers = deploy_workers
+        self.single = single
+        self.sleep = sleep
         self.done = False
         self.machine = None
         self.deployed_charm_classes = []
         self.finalized_charm_classes = []
+        self.scheduler = None
+        self.juju_state = None
         self.single_net_configured = False
         self.lxc_root_tarball_configured = False
         self.info_text = Text(self.NODE_WAIT
-                              if pegasus.SINGLE_SYSTEM
+                              if self.is_single
                               else self.PXE_BOOT)
         w = LineBox(Filler(self.info_text))
         w = AttrWrap(w, "dialog")
@@ -100,6 +122,18 @@ class ControllerOverlay(Overlay):
                          'middle',
                          5)
 
+    @property
+    def is_single(self):
+        if self.single is None:
+            return pegasus.SINGLE_SYSTEM
+        return self.single
+
+    @property
+    def is_multi(self):
+        if self.single is None:
+            return pegasus.MULTI_SYSTEM
+        return not self.single
+
     def process(self, juju_state, maas_state):
         """ Process a node list. Returns True if the overlay still needs to be
         shown, false otherwise. """
@@ -113,15 +147,9 @@ class ControllerOverlay(Overlay):
         return continue_
 
     def _process(self, juju_state, maas_state):
-        import cloudinstall.charms
-
-        charm_modules = [import_module('cloudinstall.charms.' + mname)
-                         for (_, mname, _) in
-                         pkgutil.iter_modules(cloudinstall.charms.__path__)]
-
-        charm_classes = sorted([m.__charm_class__ for m in charm_modules
-                                if not m.__charm_class__.optional],
-                               key=attrgetter('deploy_priority'))
+        charm_classes = self.charm_classes
+        if charm_classes is None:
+            charm_classes = charm_registry().required()
 
         if self.machine is None:
             self.machine = self.get_controller_machine(juju_state, maas_state)
@@ -129,7 +157,7 @@ class ControllerOverlay(Overlay):
             if self.machine is None:
                 return True     # keep polling
 
-            if pegasus.SINGLE_SYSTEM and not self.single_net_configured:
+            if self.is_single and not self.single_net_configured:
                 self.configure_lxc_network()
 
             # Speed up things if we go ahead and download the rootfs image
@@ -144,76 +172,91 @@ class ControllerOverlay(Overlay):
             log.debug("starting install on "
                       "machine {mid}".format(mid=self.machine.machine_id))
 
-        undeployed_charm_classes = [c for c in charm_classes
-                                    if c not in self.deployed_charm_classes]
-
-        if len(undeployed_charm_classes) > 0:
-            self.info_text.set_text("Deploying charms")
-            log.debug("Deploying charms")
-            for charm_class in undeployed_charm_classes:
-                charm = charm_class(juju_state=juju_state)
-                log.debug("checking if {c} is deployed:".format(c=charm))
-
-                service_names = [s.service_name for s in juju_state.services]
-                if charm.name() in service_names:
-                    log.debug("{c} is already deployed, skipping"
-                              "".format(c=charm))
-                    self.deployed_charm_classes.append(charm_class)
-                    continue
-
-                log.debug("Deploying {c}".format(c=charm))
-
-                if charm.isolate:
-                    charm.setup()
-                else:
-                    # Hardcode lxc on same machine as they are
-                    # created on-demand.
-                    charm.setup(_id='lxc:{mid}'.format(
-                        mid=self.machine.machine_id))
-                self.deployed_charm_classes.append(charm_class)
-
-        unfinalized_charm_classes = [c for c in self.deployed_charm_classes
-                                     if c not in self.finalized_charm_classes]
-
-        if len(unfinalized_charm_classes) > 0:
-            self.info_text.set_text("Setting charm relations")
-            log.debug("Setting charm relations")
-            for charm_class in unfinalized_charm_classes:
-
-                charm = charm_class(juju_state=juju_state)
-
-                if juju_state.service(charm.charm_name) is None:
-                    # Juju doesn't see the service related to this
-                    # charm yet, so defer setting its relations.
-                    log.debug("service not up yet for charm {c}".format(
-                        c=charm.charm_name))
-                    continue
-
-                log.debug("calling set_relations() for charm {c}".format(
-                    c=charm.charm_name))
-                charm.set_relations()
-                charm.post_proc()
-                self.finalized_charm_classes.append(charm_class)
+        # charms are always built from the latest state polled
+        self.juju_state = juju_state
+        if self.scheduler is None:
+            self.start_deployment(charm_classes, juju_state)
+        else:
+            self.scheduler.observe(s.service_name
+                                   for s in juju_state.services)
+
+        self.deployed_charm_classes = [c for c in charm_classes
+                                       if c.name() in self.scheduler.deployed]
+        self.finalized_charm_classes = [c for c in charm_classes if c.name()
+                                        in self.scheduler.finished]
 
         log.debug("at end of process(), deployed_charm_classes={d}"
                   "finalized_charm_classes={f}".format(
                       d=self.deployed_charm_classes,
                       f=self.finalized_charm_classes))
 
-        if len(self.finalized_charm_classes) == len(charm_classes):
+        if self.scheduler.done:
             log.debug("Charm setup done.")
             return False
+        elif self.scheduler.failed:
+            failed = sorted(str(key) for _, key in self.scheduler.failed)
+            self.info_text.set_text("Unable to set up {f}, see the "
+                                    "log for details".format(
+                                        f=", ".join(failed)))
+            return True
         else:
             log.debug("Polling will continue until all charms are finalized.")
             return True
 
+    def start_deployment(self, charm_classes, juju_state):
+        """ Deploy, relate and finish charms in the background
+
+        :param list charm_classes: charms to set up
+        :param juju_state: :class:JujuState when deployment starts
+        """
+        deployed = [c.name() for c in charm_classes
+                    if juju_state.service(c.name()) is not None]
+        related = juju_relations(juju_state)
+        self.scheduler = DeployScheduler(charm_classes,
+                                         deploy=self._deploy_charm,
+                                         relate=self._relate_charms,
+                                         finish=self._finish_charm,
+                                         deployed=deployed,
+                                         related=related,
+                                         workers=self.deploy_workers,
+                                         wait_for_services=True,
+                                         sleep=self.sleep)
+        secs, path = self.scheduler.critical_path()
+        log.debug("Deploying charms, critical path {path} estimated at "
+                  "{secs}s".format(path=path, secs=secs))
+        self.info_text.set_text("Deploying charms "
+                                "(about {secs}s)".format(secs=int(secs)))
+        self.scheduler.start()
+
+    def _charm(self, charm_class):
+        return charm_class(juju_state=self.juju_state,
+                           juju_client=self.command_runner.client,
+                           single=self.single)
+
+    def _deploy_charm(self, charm_class):
+        charm = self._charm(charm_class)
+        log.debug("Deploying {c}".format(c=charm))
+        if charm.isolate:
+            charm.setup()
+        else:
+            # Hardcode lxc on same machine as they are
+            # created on-demand.
+            charm.setup(_id='lxc:{mid}'.format(
+                mid=self.machine.machine_id))
+
+    def _relate_charms(self, charm_class, other_class):
+        self._charm(charm_class).relate(other_class.name())
+
+    def _finish_charm(self, charm_class):
+        self._charm(charm_class).post_proc()
+
     def get_controller_machine(self, juju_state, maas_state):
 
         allocated = list(juju_state.machines_allocated())
         log.debug("Allocated machines: "
                   "{machines}".format(machines=allocated))
 
-        if pegasus.MULTI_SYSTEM:
+        if self.is_multi:
             maas_allocated = list(maas_state.machines_allocated())
             if len(allocated) == 0 and len(maas_allocated) == 0:
                 err_msg = "No machines allocated to juju. " \
@@ -228,7 +271,7 @@ class ControllerOverlay(Overlay):
             else:
                 return self.get_started_machine(allocated)
 
-        elif pegasus.SINGLE_SYSTEM:
+        elif self.is_single:
             return self.get_started_machine(allocated)
 
         return None
@@ -287,12 +330,7 @@ class AddCharmDialog(Overlay):
     """ Adding charm dialog """
 
     def __init__(self, underlying, juju_state, destroy, command_runner=None):
-        import cloudinstall.charms
-        charm_modules = [import_module('cloudinstall.charms.' + mname)
-                         for (_, mname, _) in
-                         pkgutil.iter_modules(cloudinstall.charms.__path__)]
-        charm_classes = [m.__charm_class__ for m in charm_modules
-                         if m.__charm_class__.allow_multi_units]
+        charm_classes = charm_registry().multi_units()
 
         self.cr = command_runner
         self.underlying = underlying
@@ -342,12 +380,7 @@ class AddCharmDialog(Overlay):
 
 class ChangeStateDialog(Overlay):
     def __init__(self, underlying, juju_state, on_success, on_cancel):
-        import cloudinstall.charms
-        charm_modules = [import_module('cloudinstall.charms.' + mname)
-                         for (_, mname, _) in
-                         pkgutil.iter_modules(cloudinstall.charms.__path__)]
-        charm_classes = sorted([m.__charm_class__ for m in charm_modules],
-                               key=attrgetter('deploy_priority'))
+        charm_classes = charm_registry().by_priority()
 
         self.boxes = []
         first_index = 0
@@ -521,6 +554,8 @@ class NodeViewMode(Frame):
         self.ticks_left = 0
         self.juju_state = None
         self.maas_state = None
+        self.shown_state = None
+        self.service_nodes = {}
         self.nodes = ListWithHeader(NODE_HEADER)
         self.loop = loop
 
@@ -579,8 +614,17 @@ class NodeViewMode(Frame):
         :param maas_state: maas polled state
         :type maas_state MaasState()
         """
-        nodes = [Node(s, self.open_dialog)
-                 for s in juju_state.services]
+        # Only rebuild the nodes of services that changed
+        diff = juju_state.diff(self.shown_state)
+        for name in diff.services_touched():
+            self.service_nodes.pop(name, None)
+        nodes = []
+        for s in juju_state.services:
+            if s.service_name not in self.service_nodes:
+                self.service_nodes[s.service_name] = Node(s,
+                                                          self.open_dialog)
+            nodes.append(self.service_nodes[s.service_name])
+        self.shown_state = juju_state
 
         if self.target == self.controller_overlay:
             continue_polling = self.controller_overlay.process(juju_state,
@@ -613,6 +657,9 @@ class NodeViewMode(Frame):
         self.loop.draw_screen()
 
     def tick(self):
+        if pegasus.juju_state_changed():
+            # The AllWatcher saw a change, don't wait out the interval
+            self.ticks_left = 0
         if self.ticks_left == 0:
             self.ticks_left = self.poll_interval
             log.debug("NodeViewMode tick() calling refresh_states()")
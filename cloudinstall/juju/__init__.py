@@ -18,15 +18,95 @@
 
 """ Represents a juju status """
 
+import json
 import logging
 import yaml
 
 from cloudinstall.machine import Machine
 from cloudinstall.service import Service
 
+# libyaml's loader is much faster, fall back when it isn't built in
+try:
+    from yaml import CSafeLoader as StatusLoader
+except ImportError:
+    from yaml import SafeLoader as StatusLoader
+
 log = logging.getLogger(__name__)
 
 
+def load_status(raw):
+    """ Parse the output of __juju status__
+
+    Accepts both the default YAML output and `--format=json`, which is
+    considerably quicker to parse.
+
+    :param raw: status text or a file-like object containing it
+    :returns: parsed status
+    :rtype: dict
+    """
+    if hasattr(raw, 'read'):
+        raw = raw.read()
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8')
+    if raw.lstrip().startswith('{'):
+        return json.loads(raw)
+    return yaml.load(raw, Loader=StatusLoader)
+
+
+class JujuStateDiff:
+    """ Differences between two juju states
+
+    `added` and `removed` map each kind ('machines', 'services', 'units'
+    or 'relations') to a list of ids. `changed` maps each kind to
+    { id: { field: (old, new) } }. Relations are identified by
+    (service, relation name, related service) and are only ever added
+    or removed.
+    """
+
+    KINDS = ['machines', 'services', 'units', 'relations']
+
+    def __init__(self):
+        self.added = {kind: [] for kind in self.KINDS}
+        self.removed = {kind: [] for kind in self.KINDS}
+        self.changed = {kind: {} for kind in self.KINDS}
+
+    def compare(self, kind, old, new):
+        """ Record differences between two { id: fields } dicts """
+        for key, fields in new.items():
+            if key not in old:
+                self.added[kind].append(key)
+                continue
+            old_fields = old[key]
+            if fields == old_fields:
+                continue
+            self.changed[kind][key] = {
+                f: (old_fields.get(f), fields.get(f))
+                for f in set(fields) | set(old_fields)
+                if old_fields.get(f) != fields.get(f)}
+        self.removed[kind].extend(k for k in old if k not in new)
+
+    def services_touched(self):
+        """ Names of services that changed themselves or in their units
+
+        :rtype: set
+        """
+        names = set(self.added['services'] + self.removed['services'])
+        names.update(self.changed['services'])
+        for units in [self.added['units'], self.removed['units'],
+                      self.changed['units']]:
+            names.update(u.split('/')[0] for u in units)
+        return names
+
+    def __bool__(self):
+        return any(self.added[k] or self.removed[k] or self.changed[k]
+                   for k in self.KINDS)
+
+    def __repr__(self):
+        return "<JujuStateDiff added={a} removed={r} " \
+            "changed={c}>".format(a=self.added, r=self.removed,
+                                  c=self.changed)
+
+
 class JujuState:
     """ Represents a global Juju state """
 
@@ -34,10 +114,45 @@ class JujuState:
         """ Builds a JujuState from a file-like object containing the raw
         output from __juju status__
 
-        :param raw_yaml: YAML object
+        :param raw_yaml: YAML or JSON status, or an already parsed status
+                         dict
         """
-        self._yaml = yaml.load(raw_yaml)
+        if isinstance(raw_yaml, dict):
+            self._yaml = raw_yaml
+        else:
+            self._yaml = load_status(raw_yaml)
         self.valid_states = ['pending', 'started', 'down']
+        self._relation_endpoints = {}
+        self._indexed = False
+
+    def _build_indexes(self):
+        """ Index machines, services and units for constant time lookups
+
+        Built on first use; the wrappers are shared by every lookup
+        until the state changes.
+        """
+        self._machine_index = {}
+        for machine_id, machine in (self._yaml.get('machines') or
+                                    {}).items():
+            if '0' == machine_id:
+                continue
+            self._machine_index[machine_id] = Machine(machine_id, machine)
+
+        self._service_index = {}
+        self._unit_index = {}
+        self._machine_units = {}
+        for name, service in (self._yaml.get('services') or {}).items():
+            s = Service(name, service)
+            self._service_index[name] = s
+            for u in s.units:
+                self._unit_index[u.unit_name] = u
+                self._machine_units.setdefault(u.machine_id, []).append(u)
+        self._indexed = True
+
+    def _index(self, name):
+        if not self._indexed:
+            self._build_indexes()
+        return getattr(self, name)
 
     def machine(self, machine_id):
         """ Return single machine state
@@ -46,22 +161,16 @@ class JujuState:
         :returns: machine
         :rtype: cloudinstall.machine.Machine()
         """
-        try:
-            return next(filter(lambda x: x.machine_id == machine_id,
-                               self.machines()))
-        except StopIteration:
-            return Machine(-1, {})
+        return self._index('_machine_index').get(machine_id,
+                                                 Machine(-1, {}))
 
     def machines(self):
         """ Machines property
 
         :returns: machines known to juju (except bootstrap)
-        :rtype: generator
+        :rtype: iter
         """
-        for machine_id, machine in self._yaml['machines'].items():
-            if '0' == machine_id:
-                continue
-            yield Machine(machine_id, machine)
+        return iter(self._index('_machine_index').values())
 
     def machines_allocated(self):
         """ Machines allocated property
@@ -79,18 +188,195 @@ class JujuState:
         :returns: a service entry or None
         :rtype: Service()
         """
-        try:
-            return next(filter(lambda s: s.service_name == name,
-                               self.services))
-        except StopIteration:
-            return None
+        return self._index('_service_index').get(name)
 
     @property
     def services(self):
         """ Juju services property
 
         :returns: Service() of all loaded services
-        :rtype: generator
+        :rtype: iter
+        """
+        return iter(self._index('_service_index').values())
+
+    def unit(self, name):
+        """ Return a single unit entry
+
+        :param str name: unit name, e.g. 'mysql/0'
+        :returns: a unit entry or None
+        :rtype: Unit()
+        """
+        return self._index('_unit_index').get(name)
+
+    def units_on_machine(self, machine_id):
+        """ Units deployed to a machine or container
+
+        :param str machine_id: machine id, e.g. '1/lxc/0'
+        :returns: units on that machine
+        :rtype: list
         """
-        for name, service in self._yaml.get('services', {}).items():
-            yield Service(name, service)
+        return list(self._index('_machine_units').get(machine_id, []))
+
+    def diff(self, previous):
+        """ What changed since a previous state
+
+        Runs in linear time over both states.
+
+        :param previous: older state to compare against, or None
+        :type previous: JujuState
+        :returns: machines, services, units and relations that were
+                  added, removed or changed
+        :rtype: JujuStateDiff
+        """
+        diff = JujuStateDiff()
+        old = previous._flatten() if previous else {}
+        new = self._flatten()
+        for kind in JujuStateDiff.KINDS:
+            diff.compare(kind, old.get(kind, {}), new[kind])
+        return diff
+
+    def _flatten(self):
+        """ Status entries keyed by id, without nested collections """
+        machines = {}
+        pending = list((self._yaml.get('machines') or {}).items())
+        while pending:
+            machine_id, machine = pending.pop()
+            if '0' == machine_id:
+                continue
+            machine = machine or {}
+            pending.extend((machine.get('containers') or {}).items())
+            machines[machine_id] = {k: v for k, v in machine.items()
+                                    if k != 'containers'}
+
+        services = {}
+        units = {}
+        relations = {}
+        for name, service in (self._yaml.get('services') or {}).items():
+            service = service or {}
+            services[name] = {k: v for k, v in service.items()
+                              if k not in ['units', 'relations']}
+            units.update(service.get('units') or {})
+            for relation_name, charms in (service.get('relations') or
+                                          {}).items():
+                for charm in charms:
+                    relations[(name, relation_name, charm)] = {}
+        return {'machines': machines, 'services': services,
+                'units': units, 'relations': relations}
+
+    def apply_deltas(self, deltas):
+        """ Update state in-place from AllWatcher deltas
+
+        Deltas are translated into the layout of __juju status__ so the
+        rest of the state API is unaffected.
+
+        :param list deltas: [entity, 'change' or 'remove', info] triples
+                            as returned by AllWatcher.Next
+        """
+        self._indexed = False
+        if not self._yaml.get('machines'):
+            self._yaml['machines'] = {}
+        if not self._yaml.get('services'):
+            self._yaml['services'] = {}
+
+        relations_changed = False
+        for entity, change, info in deltas:
+            if entity == 'machine':
+                self._machine_delta(change, info)
+            elif entity == 'service':
+                self._service_delta(change, info)
+            elif entity == 'unit':
+                self._unit_delta(change, info)
+            elif entity == 'relation':
+                self._relation_delta(change, info)
+                relations_changed = True
+
+        if relations_changed:
+            self._rebuild_relations()
+
+    def _machine_siblings(self, machine_id):
+        """ Dict holding a machine, nested under its host for containers """
+        parts = machine_id.split('/')
+        if len(parts) < 3:
+            return self._yaml['machines']
+        host = '/'.join(parts[:-2])
+        host_entry = self._machine_siblings(host).setdefault(host, {})
+        return host_entry.setdefault('containers', {})
+
+    def _machine_delta(self, change, info):
+        siblings = self._machine_siblings(info['Id'])
+        if change == 'remove':
+            siblings.pop(info['Id'], None)
+            return
+        entry = siblings.setdefault(info['Id'], {})
+        entry['agent-state'] = info.get('Status', '')
+        if info.get('StatusInfo'):
+            entry['agent-state-info'] = info['StatusInfo']
+        else:
+            entry.pop('agent-state-info', None)
+        entry['instance-id'] = info.get('InstanceId', '')
+        entry['series'] = info.get('Series', '')
+        addresses = [a['Value'] for a in info.get('Addresses') or []
+                     if a.get('NetworkScope') == 'public'] + \
+                    [a['Value'] for a in info.get('Addresses') or []]
+        if addresses:
+            entry['dns-name'] = addresses[0]
+        hardware = info.get('HardwareCharacteristics') or {}
+        specs = []
+        if hardware.get('Arch'):
+            specs.append('arch={v}'.format(v=hardware['Arch']))
+        if hardware.get('CpuCores'):
+            specs.append('cpu-cores={v}'.format(v=hardware['CpuCores']))
+        if hardware.get('Mem'):
+            specs.append('mem={v}M'.format(v=hardware['Mem']))
+        if hardware.get('RootDisk'):
+            specs.append('root-disk={v}M'.format(v=hardware['RootDisk']))
+        if specs:
+            entry['hardware'] = ' '.join(specs)
+
+    def _service_delta(self, change, info):
+        services = self._yaml['services']
+        if change == 'remove':
+            services.pop(info['Name'], None)
+            return
+        entry = services.setdefault(info['Name'], {})
+        entry['charm'] = info.get('CharmURL', '')
+        entry['exposed'] = info.get('Exposed', False)
+
+    def _unit_delta(self, change, info):
+        services = self._yaml['services']
+        if change == 'remove':
+            units = services.get(info['Service'], {}).get('units', {})
+            units.pop(info['Name'], None)
+            return
+        service = services.setdefault(info['Service'], {})
+        entry = service.setdefault('units', {}).setdefault(info['Name'], {})
+        entry['agent-state'] = info.get('Status', '')
+        if info.get('StatusInfo'):
+            entry['agent-state-info'] = info['StatusInfo']
+        else:
+            entry.pop('agent-state-info', None)
+        entry['machine'] = info.get('MachineId', '')
+        if info.get('PublicAddress'):
+            entry['public-address'] = info['PublicAddress']
+
+    def _relation_delta(self, change, info):
+        if change == 'remove':
+            self._relation_endpoints.pop(info['Key'], None)
+        else:
+            self._relation_endpoints[info['Key']] = info.get('Endpoints', [])
+
+    def _rebuild_relations(self):
+        """ Regenerate each service's relations from the relation deltas """
+        services = self._yaml['services']
+        for service in services.values():
+            service.pop('relations', None)
+        for endpoints in self._relation_endpoints.values():
+            names = [e['ServiceName'] for e in endpoints]
+            for e in endpoints:
+                others = [n for n in names if n != e['ServiceName']]
+                if not others:
+                    others = [e['ServiceName']]     # peer relation
+                service = services.setdefault(e['ServiceName'], {})
+                related = service.setdefault('relations', {}).setdefault(
+                    e['Relation']['Name'], [])
+                related.extend(n for n in others if n not in related)
@@ -16,111 +16,380 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-# TODO: Make use of python3-websocket once
-# https://github.com/liris/websocket-client/pull/76 is merged.
-# from ws4py.client.threadedclient import WebSocketClient
-# import json
-# import time
+from itertools import count
+import json
 import logging
+import os
+import re
+from shlex import quote
+import threading
+import time
+
+from ws4py.client.threadedclient import WebSocketClient
+import yaml
 
 from cloudinstall.utils import get_command_output
 
 log = logging.getLogger(__name__)
 
-# class JujuWS(WebSocketClient):
-#     def opened(self):
-#         creds = {'Type': 'Admin',
-#                  'Request': 'Login',
-#                  'RequestId': 1,
-#                  'Params' : { 'AuthTag' : 'user-admin',
-#                               'Password' : self.juju_pass}}
-#         self.send(json.dumps(creds))
+JUJU_HOME = os.path.expanduser(os.getenv('JUJU_HOME', '~/.juju'))
+
+# Seconds to wait for the api server to answer a single request
+CALL_TIMEOUT = 300
+
+# Seconds to wait after a failed connection attempt before trying the
+# api server again; calls made in the meantime go through the juju cli.
+RECONNECT_DELAY = 30
+
+
+class JujuError(Exception):
+    """ Error reported by, or while talking to, the juju api server """
+
+
+class JujuConnectionError(JujuError):
+    """ The request never reached the juju api server, so it is safe to
+    make it some other way
+    """
+
+
+def environment_name():
+    """ Name of the currently selected juju environment
+
+    Follows the same precedence as the juju cli: `JUJU_ENV`, then the
+    environment picked with `juju switch`, then the default from
+    environments.yaml.
+
+    :returns: environment name or None
+    :rtype: str
+    """
+    env_name = os.getenv('JUJU_ENV')
+    if env_name:
+        return env_name
+
+    current = os.path.join(JUJU_HOME, 'current-environment')
+    if os.path.isfile(current):
+        with open(current) as f:
+            return f.read().strip()
+
+    environments = os.path.join(JUJU_HOME, 'environments.yaml')
+    if os.path.isfile(environments):
+        with open(environments) as f:
+            return yaml.safe_load(f).get('default')
+    return None
+
+
+def api_credentials(env_name=None):
+    """ Api server address and admin credentials of an environment
+
+    Read from the .jenv file written by `juju bootstrap`.
+
+    :param str env_name: (optional) environment name
+    :returns: (url, password) or None if the environment is not
+              bootstrapped
+    :rtype: tuple
+    """
+    env_name = env_name or environment_name()
+    if env_name is None:
+        return None
+    jenv = os.path.join(JUJU_HOME, 'environments',
+                        '{env}.jenv'.format(env=env_name))
+    if not os.path.isfile(jenv):
+        return None
+    with open(jenv) as f:
+        info = yaml.safe_load(f)
+    servers = info.get('state-servers', [])
+    if not servers:
+        return None
+    url = 'wss://{server}/'.format(server=servers[0])
+    return (url, info.get('password'))
+
+
+def _megabytes(value):
+    """ Convert a cli size such as '4G' into megabytes """
+    match = re.match(r'^(\d+(?:\.\d+)?)([MGTP]?)$', str(value))
+    if not match:
+        raise ValueError("Invalid size: {v}".format(v=value))
+    size, suffix = match.groups()
+    multiplier = {'': 1, 'M': 1, 'G': 1024, 'T': 1024 ** 2, 'P': 1024 ** 3}
+    return int(float(size) * multiplier[suffix])
+
 
-#     def received_message(self, m):
-#         json.loads(m.data.decode('utf-8'))
+def api_constraints(constraints):
+    """ Convert cli style constraints into the api's constraint values
 
-#     @property
-#     def juju_pass(self):
-#         return self._juju_pass
+    :param dict constraints: constraints in the form of { 'mem': '4G' }
+    :returns: constraints as understood by the api server
+    :rtype: dict
+    """
+    values = {}
+    for k, v in constraints.items():
+        if k in ['mem', 'root-disk']:
+            values[k] = _megabytes(v)
+        elif k in ['cpu-cores', 'cpu-power']:
+            values[k] = int(v)
+        elif k == 'tags':
+            values[k] = v.split(',') if isinstance(v, str) else list(v)
+        else:
+            values[k] = v
+    return values
 
-#     @juju_pass.setter
-#     def juju_pass(self, password):
-#         self._juju_pass = password
+
+class _PendingCall:
+    """ A request waiting for its response """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class JujuWS(WebSocketClient):
+    """ Websocket connection handing messages back to a JujuClient """
+
+    def __init__(self, url, client):
+        WebSocketClient.__init__(self, url, protocols=['https-only'])
+        self.client = client
+
+    def received_message(self, m):
+        self.client._dispatch(json.loads(m.data.decode('utf-8')))
+
+    def closed(self, code, reason=None):
+        self.client._disconnected(code, reason)
 
 
 class JujuClient:
-    """ Juju client class """
-
-    def __init__(self, url='wss://juju-bootstrap.maas:17070/'):
-        "Constructor. url param is a websocket url, currently unused."
-        #     self.conn = JujuWS(url, protocols=['https-only'])
-        #     self._request_id = 1
-        #     self.is_connected = False
-
-    # def login(self, password):
-    #     """ Login to juju
-
-    #     :param password: password of juju websocket api server
-    #     """
-    #     self.conn.daemon = False
-    #     self.conn.juju_pass = password
-    #     if not self.is_connected:
-    #         self.conn.connect()
-    #     time.sleep(1)
-    #     self.is_connected = True
-
-    # def close(self):
-    #     """ Closes connection to juju websocket """
-    #     self.conn.close()
-
-    # def call(self, params):
-    #     """ Get json data from juju api daemon
-
-    #     :params params: Additional params to be passed into request
-    #     :type params: dict
-    #     """
-    #     self._request_id = self._request_id + 1
-    #     params['RequestId'] = self._request_id
-    #     self.conn.send(json.dumps(params))
-
-    # def info(self):
-    #     """ Returns Juju environment state """
-    #     return self.call(dict(Type="Client",
-    #                           Request="EnvironmentInfo"))
-
-    # def add_charm(self, charm_url):
-    #     """ Adds charm """
-    #     return self.call(dict(Type="Client",
-    #                           Request="AddCharm",
-    #                           Params=dict(URL=charm_url)))
-
-    # def get_charm(self, charm_url):
-    #     """ Get charm """
-    #     return self.call(dict(Type='Client',
-    #                           Request='CharmInfo',
-    #                           Params=dict(CharmURL=charm_url)))
-
-    # def get_env_constraints(self):
-    #     """ Get environment constraints """
-    #     return self.call(dict(Type="Client",
-    #                           Request="GetEnvironmentConstraints"))
-
-    # def set_env_constraints(self, constraints):
-    #     """ Set environment constraints """
-    #     return self.call(dict(Type="Client",
-    #                           Request="SetEnvironmentConstraints",
-    #                           Params=constraints))
-
-    # def get_env_config(self):
-    #     """ Get environment config """
-    #     return self.call(dict(Type="Client",
-    #                           Request="EnvironmentGet"))
-
-    # def set_env_config(self, config):
-    #     """ Sets environment config variables """
-    #     return self.call(dict(Type="Client",
-    #                           Request="EnvironmentSet",
-    #                           Params=dict(Config=config)))
+    """ Juju client class
+
+    Calls are made over a single persistent websocket connection to the
+    juju api server. Requests are multiplexed over the connection by
+    request id, so several threads can share one client. If the api
+    server can not be reached the `juju` cli is used instead.
+    """
+
+    def __init__(self, url=None, password=None):
+        """ Constructor
+
+        :param str url: (optional) websocket url of the api server,
+                        read from the environment's .jenv when omitted
+        :param str password: (optional) admin password of the api server
+        """
+        self.url = url
+        self.password = password
+        self.conn = None
+        self.is_connected = False
+        self._request_ids = count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._last_failure = 0
+
+    def login(self, password=None):
+        """ Connect and login to the juju api server
+
+        A closed connection is re-established by the next call, so this
+        only needs to be called once.
+
+        :param str password: (optional) password of juju websocket api server
+        """
+        if password:
+            self.password = password
+        with self._connect_lock:
+            if self.is_connected:
+                return
+            if self.url is None or self.password is None:
+                creds = api_credentials()
+                if creds is None:
+                    raise JujuError("No api credentials found, "
+                                    "is the environment bootstrapped?")
+                self.url = self.url or creds[0]
+                self.password = self.password or creds[1]
+            log.debug("Connecting to juju api at {url}".format(url=self.url))
+            try:
+                self.conn = JujuWS(self.url, self)
+                self.conn.daemon = True
+                self.conn.connect()
+                self.is_connected = True
+                self._call(dict(Type='Admin',
+                                Request='Login',
+                                Params=dict(AuthTag='user-admin',
+                                            Password=self.password)))
+            except Exception as e:
+                self.close()
+                raise JujuConnectionError("Login to {url} failed: "
+                                          "{e}".format(url=self.url, e=e))
+
+    def close(self):
+        """ Closes connection to juju websocket """
+        self.is_connected = False
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    @property
+    def api_available(self):
+        """ Can calls currently be made through the api server?
+
+        Connects on first use and after the connection was lost, but
+        waits RECONNECT_DELAY seconds between failed attempts.
+
+        :rtype: bool
+        """
+        if self.is_connected:
+            return True
+        if time.time() - self._last_failure < RECONNECT_DELAY:
+            return False
+        try:
+            self.login()
+        except Exception as e:
+            log.debug("Juju api unavailable, using cli: {e}".format(e=e))
+            self._last_failure = time.time()
+            return False
+        return True
+
+    def call(self, params, timeout=CALL_TIMEOUT):
+        """ Get json data from juju api daemon
+
+        :params params: Additional params to be passed into request
+        :type params: dict
+        :param int timeout: (optional) seconds to wait for a response
+        :returns: response of the api server
+        :rtype: dict
+        """
+        if not self.is_connected:
+            self.login()
+        return self._call(params, timeout)
+
+    def _call(self, params, timeout=CALL_TIMEOUT):
+        pending = _PendingCall()
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = pending
+        params['RequestId'] = request_id
+        try:
+            with self._send_lock:
+                self.conn.send(json.dumps(params))
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            self._disconnected(None, str(e))
+            raise JujuConnectionError("Sending {r} failed: {e}".format(
+                r=params['Request'], e=e))
+
+        if not pending.event.wait(timeout):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise JujuError("Timed out waiting for {r}".format(
+                r=params['Request']))
+        if pending.error:
+            raise JujuError(pending.error)
+        return pending.response
+
+    def _dispatch(self, msg):
+        """ Hand a response to the caller waiting on its request id """
+        with self._lock:
+            pending = self._pending.pop(msg.get('RequestId'), None)
+        if pending is None:
+            log.debug("Dropping unexpected juju api message: "
+                      "{msg}".format(msg=msg))
+            return
+        if msg.get('Error'):
+            pending.error = msg['Error']
+        else:
+            pending.response = msg.get('Response') or {}
+        pending.event.set()
+
+    def _disconnected(self, code, reason):
+        """ Fail everything still in flight, next call reconnects """
+        if self.is_connected:
+            log.debug("Juju api connection closed ({code}): "
+                      "{reason}".format(code=code, reason=reason))
+        self.is_connected = False
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for p in pending.values():
+            p.error = "Connection closed: {r}".format(r=reason)
+            p.event.set()
+
+    def _try_call(self, params):
+        """ Make an api call if the api server is available
+
+        Only a request that never reached the api server falls back to
+        the cli; one that was sent may have been applied even if it
+        failed or timed out, and repeating it could apply it twice.
+
+        :returns: response, or None if the cli should be used instead
+        :raises JujuError: if the request was sent and failed
+        """
+        if not self.api_available:
+            return None
+        try:
+            return self.call(params)
+        except JujuConnectionError as e:
+            log.warning("Juju api {r} failed, falling back to "
+                        "cli: {e}".format(r=params['Request'], e=e))
+            return None
+
+    def info(self):
+        """ Returns Juju environment state """
+        return self.call(dict(Type="Client",
+                              Request="EnvironmentInfo"))
+
+    def add_charm(self, charm_url):
+        """ Adds charm """
+        return self.call(dict(Type="Client",
+                              Request="AddCharm",
+                              Params=dict(URL=charm_url)))
+
+    def resolve_charm(self, charm):
+        """ Resolve a charm name into a fully qualified charm url
+
+        :param str charm: charm name, e.g. 'mysql'
+        :returns: charm url, e.g. 'cs:trusty/mysql-3'
+        :rtype: str
+        """
+        res = self.call(dict(Type="Client",
+                             Request="ResolveCharms",
+                             Params=dict(References=[charm])))
+        url = res['URLs'][0]
+        if url.get('Error'):
+            raise JujuError(url['Error'])
+        return url['URL']
+
+    def watch_all(self):
+        """ Start an AllWatcher on the environment
+
+        :returns: id of the new watcher
+        :rtype: str
+        """
+        res = self.call(dict(Type="Client",
+                             Request="WatchAll"))
+        return res['AllWatcherId']
+
+    def watcher_next(self, watcher_id):
+        """ Wait for the next batch of changes from an AllWatcher
+
+        Blocks until something in the environment changes.
+
+        :param str watcher_id: id returned by watch_all()
+        :returns: [entity, 'change' or 'remove', info] triples
+        :rtype: list
+        """
+        res = self.call(dict(Type="AllWatcher",
+                             Request="Next",
+                             Id=watcher_id),
+                        timeout=None)
+        return res.get('Deltas', [])
+
+    def get_env_constraints(self):
+        """ Get environment constraints """
+        return self.call(dict(Type="Client",
+                              Request="GetEnvironmentConstraints"))
+
+    def get_env_config(self):
+        """ Get environment config """
+        return self.call(dict(Type="Client",
+                              Request="EnvironmentGet"))
 
     def add_machine(self, constraints=None):
         """ Allocate new machine
@@ -129,6 +398,16 @@ class JujuClient:
         :returns: True on success, False on fail
         :rtype: bool
         """
+        params = dict(Jobs=['JobHostUnits'])
+        if constraints:
+            params['Constraints'] = api_constraints(constraints)
+        res = self._try_call(dict(Type="Client",
+                                  Request="AddMachines",
+                                  Params=dict(MachineParams=[params])))
+        if res is not None:
+            log.debug("Machine added: {res}".format(res=res))
+            return res
+
         cmd = "juju add-machine"
         opts = []
         if constraints:
@@ -143,45 +422,22 @@ class JujuClient:
         log.debug("Machine added: {cmd} ({out})".format(cmd=cmd, out=out))
         return out
 
-    # def add_machines(self, machines):
-    #     """ Add machines """
-    #     return self.call(dict(Type="Client",
-    #                           Request="AddMachines",
-    #                           Params=dict(MachineParams=machines)))
-
-    # def add_relation(self, endpoint_a, endpoint_b):
-    #     """ Adds relation between units """
-    #     return self.call(dict(Type="Client",
-    #                           Request="AddRelation",
-    #                           Params=dict(Endpoints=[endpoint_a,
-    #                                                  endpoint_b])))
     def add_relation(self, endpoint_a, endpoint_b):
         """ Add relation between services """
-        cmd = "juju add-relation {a} {b}".format(a=endpoint_a,
-                                                 b=endpoint_b)
         log.debug("Adding relation {a} <-> {b}".format(a=endpoint_a,
                                                        b=endpoint_b))
+        res = self._try_call(dict(Type="Client",
+                                  Request="AddRelation",
+                                  Params=dict(Endpoints=[endpoint_a,
+                                                         endpoint_b])))
+        if res is not None:
+            return res
+
+        cmd = "juju add-relation {a} {b}".format(a=endpoint_a,
+                                                 b=endpoint_b)
         ret, out, _, _ = get_command_output(cmd)
         return out
 
-    # def remove_relation(self, endpoint_a, endpoint_b):
-    #     """ Removes relation """
-    #     return self.call(dict(Type="Client",
-    #                           Request="DestroyRelaiton",
-    #                           Params=dict(Endpoints=[endpoint_a,
-    #                                                  endpoint_b])))
-
-    # def deploy(self, service_name, charm_url,
-    #            num_units=1, config=None,
-    #            constraints=None, machine_spec=None):
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceDeploy",
-    #                           Params=dict(ServiceName=service_name,
-    #                                       CharmURL=charm_url,
-    #                                       NumUnits=num_units,
-    #                                       Config=config,
-    #                                       Constraints=constraints,
-    #                                       ToMachineSpec=machine_spec)))
     def deploy(self, charm, settings):
         """ Deploy a charm to an instance
 
@@ -190,6 +446,13 @@ class JujuClient:
         :param str instances: (optional) number of instances to deploy
         :param dict constraints: (optional) machine constraints
         """
+        if self.api_available:
+            try:
+                return self._deploy_api(charm, settings)
+            except JujuConnectionError as e:
+                log.warning("Juju api deploy of {charm} failed, falling "
+                            "back to cli: {e}".format(charm=charm, e=e))
+
         cmd = "juju deploy"
         if 'machine_id' in settings and settings['machine_id']:
             cmd += " --to {mid}".format(mid=settings['machine_id'])
@@ -216,14 +479,33 @@ class JujuClient:
             log.warning("Deploy error ({cmd}): {out}".format(cmd=cmd,
                                                              out=out))
 
-    # def set_config(self, service_name, config_keys):
-    #     """ Sets machine config """
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceSet",
-    #                           Params=dict(ServiceName=service_name,
-    #                                       Options=config_keys)))
+    def _deploy_api(self, charm, settings):
+        """ Deploy a charm through the api server, see deploy() """
+        charm_url = self.resolve_charm(charm)
+        self.add_charm(charm_url)
+
+        params = dict(ServiceName=charm,
+                      CharmUrl=charm_url,
+                      NumUnits=int(settings.get('instances', 1)))
+        if settings.get('machine_id'):
+            params['ToMachineSpec'] = str(settings['machine_id'])
+        if 'configfile' in settings:
+            with open(settings['configfile']) as f:
+                params['ConfigYAML'] = f.read()
+        if settings.get('constraints'):
+            params['Constraints'] = api_constraints(settings['constraints'])
+
+        log.debug("Deploying {charm} -> {params}".format(charm=charm,
+                                                         params=params))
+        return self.call(dict(Type="Client",
+                              Request="ServiceDeploy",
+                              Params=params))
+
     def set_config(self, service_name, config_keys):
-        """ Set configuration item on service
+        """ Set configuration items on service
+
+        All keys are applied in a single operation, so the service is
+        only reconfigured once.
 
         :param str service_name: name of service/charm
         :param dict config_keys: config parameters in the
@@ -231,99 +513,48 @@ class JujuClient:
         """
         log.debug("Setting config variables for "
                   "{name}".format(name=service_name))
-        for k, v in config_keys.items():
-            cmd = "juju set {service} {k}={v}".format(service=service_name,
-                                                      k=k, v=v)
-            ret, out, _, _ = get_command_output(cmd)
-            if ret:
-                log.warning("Problem setting config: "
-                            "{out}".format(out=out))
-
-    # def unset_config(self, service_name, config_keys):
-    #     """ Unsets machine config """
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceUnset",
-    #                           Params=dict(ServiceName=service_name,
-    #                                       Options=config_keys)))
-
-    # def set_charm(self, service_name, charm_url, force=0):
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceSetCharm",
-    #                           Params=dict(ServiceName=service_name,
-    #                                       CharmUrl=charm_url,
-    #                                       Force=force)))
-
-    # def get_service(self, service_name):
-    #     """ Get charm, config, constraits for srevice"""
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceGet",
-    #                           Params=dict(ServiceName=service_name)))
-
-    # def get_config(self, service_name):
-    #     """ Get service configuration """
-    #     svc = self.get_service(service_name)
-    #     return svc['Config']
-
-    # def get_constraints(self, service_name):
-    #     """ Get service constraints """
-    #     return self.call(dict(Type="Client",
-    #                           Request="GetServiceConstraints",
-    #                           Params=dict(ServiceName=service_name)))
-
-    # def set_constraints(self, service_name, constraints):
-    #     """ Sets service level constraints """
-    #     return self.call(dict(Type="Client",
-    #                           Request="SetServiceConstraints",
-    #                           Params=dict(ServiceName=service_name,
-    #                                       Constraints=constraints)))
-
-    # def update_service(self, service_name, charm_url, force_charm_url=0,
-    #                    min_units=1, settings={}, constraints={}):
-    #     """ Update service """
-    #     return self.call(dict(Type="Client",
-    #                           Request="SetServiceConstraints",
-    #                           Params=dict(ServiceName=service_name,
-    #                                       CharmUrl=charm_url,
-    #                                       MinUnits=min_units,
-    #                                       SettingsStrings=settings,
-    #                                       Constraints=constraints)))
-
-    # def destroy_service(self, service_name):
-    #     """ Destroy a service """
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceDestroy",
-    #                           Params=dict(ServiceName=service_name)))
-
-    # def expose(self, service_name):
-    #     """ Expose a service """
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceExpose",
-    #                           Params=dict(ServiceName=service_name)))
-
-    # def unexpose(self, service_name):
-    #     """ Unexpose service """
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceUnexpose",
-    #                           Params=dict(ServiceName=service_name)))
-
-    # def valid_relation_name(self, service_name):
-    #     """ All possible relation names for service """
-    #     return self.call(dict(Type="Client",
-    #                           Request="ServiceCharmRelations",
-    #                           Params=dict(ServiceName=service_name)))
-
-    # def add_units(self, service_name, num_units=1):
-    #     """ Add units """
-    #     return self.call(dict(Type="Client",
-    #                           Request="AddServiceUnits",
-    #                           Params=dict(ServiceName=service_name,
-    #                                       NumUnits=num_units)))
-
-    # def add_unit(self, service_name, machine_spec=0):
-    #     """ Add unit """
-    #     return self.call(dict(Type="Client",
-    #                           Request="AddServiceUnits",
-    #                           Params=dict(MachineSpec=machine_spec)))
+        options = {k: str(v) for k, v in config_keys.items()}
+        res = self._try_call(dict(Type="Client",
+                                  Request="ServiceSet",
+                                  Params=dict(ServiceName=service_name,
+                                              Options=options)))
+        if res is not None or not config_keys:
+            return
+
+        # All keys in one go so config-changed only fires once
+        opts = ["{k}={v}".format(k=k, v=quote(str(v)))
+                for k, v in sorted(config_keys.items())]
+        cmd = "juju set {service} {opts}".format(service=service_name,
+                                                 opts=" ".join(opts))
+        ret, out, _, _ = get_command_output(cmd)
+        if ret:
+            log.warning("Problem setting config: "
+                        "{out}".format(out=out))
+
+    def get_service(self, service_name):
+        """ Get charm, config, constraints for service """
+        return self.call(dict(Type="Client",
+                              Request="ServiceGet",
+                              Params=dict(ServiceName=service_name)))
+
+    def destroy_service(self, service_name):
+        """ Destroy a service """
+        return self.call(dict(Type="Client",
+                              Request="ServiceDestroy",
+                              Params=dict(ServiceName=service_name)))
+
+    def expose(self, service_name):
+        """ Expose a service """
+        return self.call(dict(Type="Client",
+                              Request="ServiceExpose",
+                              Params=dict(ServiceName=service_name)))
+
+    def unexpose(self, service_name):
+        """ Unexpose service """
+        return self.call(dict(Type="Client",
+                              Request="ServiceUnexpose",
+                              Params=dict(ServiceName=service_name)))
+
     def add_unit(self, service_name, machine_id=None, count=1):
         """ Add unit to machine
 
@@ -331,6 +562,15 @@ class JujuClient:
         :param str machine_id: machine id
         :param int count: number of units to add
         """
+        params = dict(ServiceName=service_name, NumUnits=count)
+        if machine_id:
+            params['ToMachineSpec'] = str(machine_id)
+        res = self._try_call(dict(Type="Client",
+                                  Request="AddServiceUnits",
+                                  Params=params))
+        if res is not None:
+            return res
+
         cmd = "juju add-unit {name}".format(name=service_name)
         if machine_id:
             cmd = "{cmd} --to {_id}".format(cmd=cmd, _id=machine_id)
@@ -344,35 +584,15 @@ class JujuClient:
                         "{out}".format(name=service_name,
                                        out=out))
 
-    # def remove_unit(self, unit_names):
-    #     """ Removes unit """
-    #     return self.call(dict(Type="Client",
-    #                           Request="DestroyServiceUnits",
-    #                           Params=dict(UnitNames=unit_names)))
-
-    # def resolved(self, unit_name, retry=0):
-    #     """ Resolved """
-    #     return self.call(dict(Type="Client",
-    #                           Request="Resolved",
-    #                           Params=dict(UnitName=unit_name,
-    #                                       Retry=retry)))
-
-    # def get_public_address(self, target):
-    #     """ Gets public address of instance """
-    #     return self.call(dict(Type="Client",
-    #                           Request="PublicAddress",
-    #                           Params=dict(Target=target)))
-
-    # def set_annontation(self, entity, entity_type, annotation):
-    #     """ Sets annontation """
-    #     return self.call(dict(Type="Client",
-    #                           Request="SetAnnotations",
-    #                           Params=dict(Tag="%-%s" % (entity_type, entity),
-    #                                       Pairs=annotation)))
-
-    # def get_annotation(self, entity, entity_type):
-    #     """ Gets annotation """
-    #     return self.call(dict(Type="Client",
-    #                           Request="GetAnnotation",
-    #                           Params=dict(Tag="%-s%" % (entity_type,
-    #                                                     entity))))
+    def remove_unit(self, unit_names):
+        """ Removes unit """
+        return self.call(dict(Type="Client",
+                              Request="DestroyServiceUnits",
+                              Params=dict(UnitNames=unit_names)))
+
+    def resolved(self, unit_name, retry=False):
+        """ Mark a unit's error as resolved """
+        return self.call(dict(Type="Client",
+                              Request="Resolved",
+                              Params=dict(UnitName=unit_name,
+                                          Retry=retry)))
@@ -0,0 +1,120 @@
+#
+# watcher.py - Juju AllWatcher
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Keeps a JujuState current from the AllWatcher delta stream """
+
+from copy import deepcopy
+import logging
+import threading
+import time
+
+from cloudinstall.juju import JujuState
+from cloudinstall.juju.client import JujuError, RECONNECT_DELAY
+
+log = logging.getLogger(__name__)
+
+# Seconds before restarting a failed watcher, doubled up to
+# MAX_WATCH_RETRY_DELAY while it keeps failing without any deltas
+WATCH_RETRY_DELAY = 1
+MAX_WATCH_RETRY_DELAY = 60
+
+
+class JujuWatcher:
+    """ Live juju state fed by an AllWatcher
+
+    A background thread applies machine, service, unit and relation
+    deltas to a single mutable JujuState as juju reports them, so
+    reading the state never needs a `juju status`.
+    """
+
+    def __init__(self, client):
+        """ Constructor
+
+        :param client: :class:JujuClient used for the watcher calls
+        """
+        self.client = client
+        self.state = None
+        self.changed = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        """ Has the initial state been received?
+
+        :rtype: bool
+        """
+        return self.state is not None
+
+    def start(self):
+        """ Start watching in a background thread """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def snapshot(self):
+        """ Copy of the current state, safe to use while deltas arrive
+
+        :returns: current state or None until the watcher is ready
+        :rtype: JujuState
+        """
+        with self._lock:
+            if self.state is None:
+                return None
+            return JujuState(deepcopy(self.state._yaml))
+
+    def _run(self):
+        delay = WATCH_RETRY_DELAY
+        while True:
+            if not self.client.api_available:
+                time.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                self._watch()
+            except Exception as e:
+                if isinstance(e, JujuError):
+                    log.debug("AllWatcher stopped, restarting: "
+                              "{e}".format(e=e))
+                else:
+                    log.exception("AllWatcher failed, restarting")
+                    # start over on a fresh connection
+                    self.client.close()
+                # Anything removed while disconnected would linger,
+                # start over from the full state of a new watcher;
+                # until then callers fall back to `juju status`.
+                with self._lock:
+                    received = self.state is not None
+                    self.state = None
+                if received:
+                    delay = WATCH_RETRY_DELAY
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_WATCH_RETRY_DELAY)
+
+    def _watch(self):
+        watcher_id = self.client.watch_all()
+        log.debug("Started AllWatcher {id}".format(id=watcher_id))
+        while True:
+            deltas = self.client.watcher_next(watcher_id)
+            with self._lock:
+                if self.state is None:
+                    self.state = JujuState({'machines': {},
+                                            'services': {}})
+                self.state.apply_deltas(deltas)
+            self.changed.set()
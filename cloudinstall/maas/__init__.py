@@ -22,6 +22,15 @@ from cloudinstall.machine import Machine
 class MaasMachine(Machine):
     """ Single maas machine """
 
+    __slots__ = ()
+
+    # Node fields read by MaasMachine, MaasState and the tagging
+    # routines; enough for MaasClient.nodes_list(fields=...)
+    FIELDS = ['hostname', 'status', 'zone', 'cpu_count', 'storage',
+              'architecture', 'memory', 'power_type', 'resource_uri',
+              'system_id', 'ip_addresses', 'macaddress_set', 'tag_names',
+              'tag', 'owner']
+
     @property
     def hostname(self):
         """ Query hostname reported by MaaS
@@ -201,9 +210,58 @@ class MaasState:
     RETIRED = 7
 
     def __init__(self, maas):
-        self.maas = maas
+        """ Constructor
+
+        :param maas: node dicts or MaasMachine objects, either a list or
+                     an iterator such as MaasClient.nodes_iter(), which
+                     is only consumed as machines are asked for
+        """
+        self.maas = []
+        self._source = iter(maas)
+        self._machines = []
+        self._by_system_id = {}
+        self._by_resource_uri = {}
+        self._by_hostname = {}
+        self._by_mac = {}
+        self._by_status = {}
+
+    def _read_next(self):
+        """ Read and index one more node from the source
+
+        Machines are indexed by system_id, resource_uri, hostname and
+        MAC, and counted per status.
+
+        :returns: False once the source is exhausted
+        :rtype: bool
+        """
+        node = next(self._source, None)
+        if node is None:
+            return False
+        if isinstance(node, MaasMachine):
+            m, node = node, node.machine
+        else:
+            m = None
+        self.maas.append(node)
+        if 'juju-bootstrap.maas' in node.get('hostname', ''):
+            return True
+        if m is None:
+            m = MaasMachine(-1, node)
+        self._machines.append(m)
+        self._by_system_id[m.system_id] = m
+        self._by_resource_uri[m.instance_id] = m
+        self._by_hostname[m.hostname] = m
+        for mac in m.mac_address:
+            self._by_mac[mac['mac_address']] = m
+        self._by_status.setdefault(int(m.status), []).append(m)
+        return True
+
+    def _load(self):
+        """ Read and index whatever is left of the source """
+        while self._read_next():
+            pass
 
     def __iter__(self):
+        self._load()
         return iter(self.maas)
 
     def machine(self, instance_id):
@@ -213,21 +271,53 @@ class MaasState:
         :returns: machine
         :rtype: cloudinstall.maas.MaasMachine
         """
-        for m in self.machines():
-            if m.instance_id == instance_id:
-                return m
-        return None
+        self._load()
+        return self._by_resource_uri.get(instance_id)
+
+    def machine_by_system_id(self, system_id):
+        """ Return single machine state
+
+        :param str system_id: machine system_id
+        :returns: machine or None
+        :rtype: cloudinstall.maas.MaasMachine
+        """
+        self._load()
+        return self._by_system_id.get(system_id)
+
+    def machine_by_hostname(self, hostname):
+        """ Return single machine state
+
+        :param str hostname: machine hostname
+        :returns: machine or None
+        :rtype: cloudinstall.maas.MaasMachine
+        """
+        self._load()
+        return self._by_hostname.get(hostname)
+
+    def machine_by_mac(self, mac_address):
+        """ Return single machine state
+
+        :param str mac_address: MAC address of one of the machine's NICs
+        :returns: machine or None
+        :rtype: cloudinstall.maas.MaasMachine
+        """
+        self._load()
+        return self._by_mac.get(mac_address)
 
     def machines(self):
         """ Maas Machines
 
+        Machines not read from the source yet are read as the
+        iteration reaches them.
+
         :returns: machines known to maas
-        :rtype: generator
+        :rtype: iter
         """
-        for machine in self.maas:
-            if 'juju-bootstrap.maas' in machine['hostname']:
-                continue
-            yield MaasMachine(-1, machine)
+        i = 0
+        while i < len(self._machines) or self._read_next():
+            if i < len(self._machines):
+                yield self._machines[i]
+                i += 1
 
     def machines_allocated(self):
         """ Maas machines in an allocated(ready) state
@@ -235,8 +325,8 @@ class MaasState:
         :returns: all machines in an allocated(ready) state
         :rtype: iter:
         """
-        return [m for m in self.machines()
-                if m.status == self.READY]
+        self._load()
+        return list(self._by_status.get(self.READY, []))
 
     def num_in_state(self, state):
         """ Number of machines in a particular state
@@ -245,5 +335,16 @@ class MaasState:
         :returns: number of machines in `status`
         :rtype: int
         """
-        return len(list(filter(lambda m: int(m.status) == state,
-                               self.machines())))
+        self._load()
+        return len(self._by_status.get(state, []))
+
+    @property
+    def status_counts(self):
+        """ Number of machines in each state
+
+        :returns: { status: count }
+        :rtype: dict
+        """
+        self._load()
+        return {status: len(machines)
+                for status, machines in self._by_status.items()}
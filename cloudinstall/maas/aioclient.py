@@ -0,0 +1,644 @@
+#
+# aioclient.py - asyncio client routines for MAAS API
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" MAAS client for asyncio event loops
+
+Mirrors MaasClient, but every call is a coroutine, so a single event
+loop can keep many MAAS requests in flight without a thread for each.
+HTTP is spoken directly over asyncio streams, with idle connections
+kept for reuse.
+"""
+
+from urllib.parse import urlencode, urlsplit
+import asyncio
+import json
+import logging
+import time
+
+from oauthlib import oauth1
+
+from cloudinstall.maas.client import (DEFAULT_TIMEOUT, POOL_SIZE,
+                                      nodes_list_params, filter_nodes)
+
+log = logging.getLogger(__name__)
+
+
+class Response:
+    """ Status, headers and body of a MAAS reply, named like
+    requests.Response
+    """
+
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+
+class AsyncMaasClient:
+    """ Client Class for asyncio
+
+    Methods have the same names and results as MaasClient's, and are
+    called with `yield from`. Listings MaasClient offers as properties
+    (nodes, nodegroups, tags, users, zones) are coroutine methods here.
+    """
+
+    def __init__(self, auth, timeout=DEFAULT_TIMEOUT,
+                 max_connections=POOL_SIZE):
+        """ Entry point to client routines for interfacing
+        with MAAS api.
+
+        :param auth: MAAS Authorization class (required)
+        :param float timeout: (optional) seconds to wait for a response
+        :param int max_connections: (optional) requests in flight at once,
+                                    also the most connections kept open
+        """
+        self.auth = auth
+        self.timeout = timeout
+        url = urlsplit(auth.api_url)
+        self._host = url.hostname
+        self._port = url.port or 80
+        if self._port == 80:
+            self._host_header = self._host
+        else:
+            self._host_header = "{host}:{port}".format(host=self._host,
+                                                       port=self._port)
+        self._path = url.path.rstrip('/')
+        self._limit = asyncio.Semaphore(max_connections)
+        self._idle = []
+        self._signer = None
+        self._signer_key = None
+
+    def _sign(self, method, path):
+        """ Sign `path` with OAuth PLAINTEXT in the query string
+
+        :returns: signed path
+        :rtype: str
+        """
+        if self._signer is None or self._signer_key != self.auth.api_key:
+            self._signer = oauth1.Client(
+                self.auth.consumer_key,
+                client_secret=self.auth.consumer_secret,
+                resource_owner_key=self.auth.token_key,
+                resource_owner_secret=self.auth.token_secret,
+                signature_method=oauth1.SIGNATURE_PLAINTEXT,
+                signature_type=oauth1.SIGNATURE_TYPE_QUERY)
+            self._signer_key = self.auth.api_key
+        uri, _, _ = self._signer.sign('http://{host}{path}'.format(
+            host=self._host_header, path=path), http_method=method)
+        uri = urlsplit(uri)
+        return uri.path + '?' + uri.query
+
+    @asyncio.coroutine
+    def _connection(self):
+        """ An idle connection, or a new one if none are left
+
+        :returns: (reader, writer, reused)
+        """
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = yield from asyncio.open_connection(self._host,
+                                                            self._port)
+        return reader, writer, False
+
+    @staticmethod
+    @asyncio.coroutine
+    def _read_response(reader, method='GET'):
+        """ Read one HTTP/1.1 response
+
+        :param str method: method of the request, HEAD responses have no
+                           body
+        :returns: (Response, keep the connection open)
+        """
+        status_line = yield from reader.readline()
+        if not status_line:
+            raise ConnectionError("MAAS closed the connection")
+        status_code = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = (yield from reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if method == 'HEAD' or status_code in (204, 304) or \
+           100 <= status_code < 200:
+            # no body, whatever the headers say
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = yield from reader.readline()
+                size = int(size.split(b';')[0], 16)
+                if size == 0:
+                    break
+                chunks.append((yield from reader.readexactly(size)))
+                yield from reader.readexactly(2)
+            while (yield from reader.readline()).strip():
+                pass
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = yield from reader.readexactly(
+                int(headers['content-length']))
+        else:
+            body = yield from reader.read()
+            headers['connection'] = 'close'
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        return (Response(status_code, headers, body.decode('utf-8')),
+                keep_alive)
+
+    @asyncio.coroutine
+    def _exchange(self, method, request):
+        """ Send a raw request and read its response, retrying once on a
+        fresh connection if a reused one turns out to be closed
+        """
+        while True:
+            reader, writer, reused = yield from self._connection()
+            try:
+                writer.write(request)
+                res, keep_alive = yield from self._read_response(reader,
+                                                                 method)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return res
+
+    @asyncio.coroutine
+    def _request(self, method, url, params=None):
+        """ Perform a request, at most max_connections at a time
+
+        :param str method: HTTP method
+        :param str url: MAAS endpoint
+        :param dict params: query for GET and DELETE, form data for POST
+        :rtype: Response
+        """
+        path = self._path + url
+        body = b''
+        if params and method == 'POST':
+            body = urlencode(params, doseq=True).encode('ascii')
+        elif params:
+            path += '?' + urlencode(params, doseq=True)
+        path = self._sign(method, path)
+
+        head = ["{method} {path} HTTP/1.1".format(method=method, path=path),
+                "Host: {host}".format(host=self._host_header),
+                "Accept: application/json",
+                "Content-Length: {n}".format(n=len(body))]
+        if body:
+            head.append("Content-Type: application/x-www-form-urlencoded")
+        request = ('\r\n'.join(head) + '\r\n\r\n').encode('ascii') + body
+
+        yield from self._limit.acquire()
+        try:
+            res = yield from asyncio.wait_for(
+                self._exchange(method, request), self.timeout)
+        finally:
+            self._limit.release()
+        log.debug("{method} {url}: {status}".format(
+            method=method, url=url, status=res.status_code))
+        return res
+
+    @asyncio.coroutine
+    def get(self, url, params=None):
+        """ Performs a authenticated GET against a MAAS endpoint
+
+        :param url: MAAS endpoint
+        :param params: extra data sent with the HTTP request
+        """
+        return (yield from self._request('GET', url, params))
+
+    @asyncio.coroutine
+    def post(self, url, params=None):
+        """ Performs a authenticated POST against a MAAS endpoint
+
+        :param url: MAAS endpoint
+        :param params: extra data sent with the HTTP request
+        """
+        return (yield from self._request('POST', url, params))
+
+    @asyncio.coroutine
+    def delete(self, url, params=None):
+        """ Performs a authenticated DELETE against a MAAS endpoint
+
+        :param url: MAAS endpoint
+        :param params: extra data sent with the HTTP request
+        """
+        return (yield from self._request('DELETE', url))
+
+    @asyncio.coroutine
+    def _get_json(self, url, params=None, default=None):
+        res = yield from self.get(url, params)
+        if res.ok:
+            return json.loads(res.text)
+        return default
+
+    @asyncio.coroutine
+    def _post_ok(self, url, params=None):
+        res = yield from self.post(url, params)
+        return res.ok
+
+    def close(self):
+        """ Close connections kept for reuse """
+        while self._idle:
+            reader, writer = self._idle.pop()
+            writer.close()
+
+    ###########################################################################
+    # Boot Images API
+    ###########################################################################
+    @asyncio.coroutine
+    def boot_images(self, uuid):
+        """ Query boot images list
+
+        :param str uuid: uuid of cluster
+        :returns: list of boot images
+        :rtype: list
+        """
+        _url = "/nodegroups/{uuid}/boot-images/".format(uuid=uuid)
+        return (yield from self._get_json(_url, default=[]))
+
+    @asyncio.coroutine
+    def import_boot_images(self):
+        """ Import boot images on all accepted controllers
+
+        :returns: true on success, false on failure
+        :rtype: bool
+        """
+        return (yield from self._post_ok('/nodegroups/',
+                                         dict(op='import_boot_images')))
+
+    @asyncio.coroutine
+    def report_boot_images(self, uuid):
+        """ Describe imported images
+
+        :param str uuid: uuid of cluster
+        :returns: information on import images
+        :rtype: dict
+        """
+        _url = "/nodegroups/{uuid}/boot-images".format(uuid=uuid)
+        res = yield from self.post(_url, dict(op='report_boot_images'))
+        if res.ok:
+            return json.loads(res.text)
+        return {}
+
+    ###########################################################################
+    # Node API
+    ###########################################################################
+    @asyncio.coroutine
+    def nodes(self):
+        """ Nodes managed by MAAS
+
+        :returns: managed nodes
+        :rtype: list
+        """
+        return (yield from self.nodes_list())
+
+    @asyncio.coroutine
+    def nodes_list(self, hostname=None, mac_address=None, zone=None,
+                   system_ids=None, status=None, tags=None, fields=None):
+        """ Nodes managed by MAAS, optionally filtered
+
+        See MaasClient.nodes_list
+
+        :returns: managed nodes
+        :rtype: list
+        """
+        params = nodes_list_params(hostname, mac_address, zone, system_ids)
+        nodes = yield from self._get_json('/nodes/', params, default=[])
+        return filter_nodes(nodes, status, tags, fields)
+
+    @asyncio.coroutine
+    def nodes_accept_all(self):
+        """ Accept all commissioned nodes
+
+        :returns: Status
+        :rtype: bool
+        """
+        return (yield from self._post_ok('/nodes/', dict(op='accept_all')))
+
+    @asyncio.coroutine
+    def node_commission(self, system_id):
+        """ (Re)commission a node
+
+        :param system_id: machine identification
+        :returns: True on success False on failure
+        """
+        return (yield from self._post_ok('/nodes/%s' % (system_id,),
+                                         dict(op='commission')))
+
+    @asyncio.coroutine
+    def node_start(self, system_id):
+        """ Power up a node
+
+        :param system_id: machine identification
+        :returns: True on success False on failure
+        """
+        return (yield from self._post_ok('/nodes/%s' % (system_id,),
+                                         dict(op='start')))
+
+    @asyncio.coroutine
+    def node_stop(self, system_id):
+        """ Shutdown a node
+
+        :param system_id: machine identification
+        :returns: True on success False on failure
+        """
+        return (yield from self._post_ok('/nodes/%s' % (system_id,),
+                                         dict(op='stop')))
+
+    @asyncio.coroutine
+    def node_remove(self, system_id):
+        """ Delete a node
+
+        :param system_id: machine identification
+        :returns: True and success False on failure
+        """
+        res = yield from self.delete('/nodes/%s' % (system_id,))
+        return res.ok
+
+    @asyncio.coroutine
+    def _bulk(self, op, system_ids):
+        """ Run a single node operation over many nodes concurrently,
+        limited by max_connections
+
+        :returns: { system_id: (success, seconds taken) }
+        :rtype: dict
+        """
+        @asyncio.coroutine
+        def timed_op(system_id):
+            start = time.time()
+            try:
+                ok = yield from op(system_id)
+            except (OSError, asyncio.TimeoutError):
+                log.exception("{op} failed for {id}".format(
+                    op=op.__name__, id=system_id))
+                ok = False
+            return (ok, time.time() - start)
+
+        system_ids = list(system_ids)
+        results = yield from asyncio.gather(
+            *[timed_op(system_id) for system_id in system_ids])
+        return dict(zip(system_ids, results))
+
+    @asyncio.coroutine
+    def _bulk_collection_op(self, op, system_ids):
+        """ Run one of MAAS's multi-node operations on /nodes/
+
+        :returns: { system_id: (success, seconds taken) }
+        :rtype: dict
+        """
+        system_ids = list(system_ids)
+        if not system_ids:
+            return {}
+        start = time.time()
+        ok = yield from self._post_ok('/nodes/', dict(op=op,
+                                                      nodes=system_ids))
+        result = (ok, time.time() - start)
+        return {system_id: result for system_id in system_ids}
+
+    @asyncio.coroutine
+    def nodes_commission(self, system_ids):
+        """ (Re)commission several nodes concurrently
+
+        :param system_ids: machine identifications
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return (yield from self._bulk(self.node_commission, system_ids))
+
+    @asyncio.coroutine
+    def nodes_start(self, system_ids):
+        """ Power up several nodes concurrently
+
+        :param system_ids: machine identifications
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return (yield from self._bulk(self.node_start, system_ids))
+
+    @asyncio.coroutine
+    def nodes_stop(self, system_ids):
+        """ Shutdown several nodes concurrently
+
+        :param system_ids: machine identifications
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return (yield from self._bulk(self.node_stop, system_ids))
+
+    @asyncio.coroutine
+    def nodes_remove(self, system_ids):
+        """ Delete several nodes concurrently
+
+        :param system_ids: machine identifications
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return (yield from self._bulk(self.node_remove, system_ids))
+
+    @asyncio.coroutine
+    def nodes_accept(self, system_ids):
+        """ Accept several declared nodes in one request
+
+        :param system_ids: machine identifications
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return (yield from self._bulk_collection_op('accept', system_ids))
+
+    @asyncio.coroutine
+    def nodes_release(self, system_ids):
+        """ Release several allocated nodes in one request
+
+        :param system_ids: machine identifications
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return (yield from self._bulk_collection_op('release', system_ids))
+
+    ###########################################################################
+    # Nodegroups API
+    ###########################################################################
+    @asyncio.coroutine
+    def nodegroups(self):
+        """ List nodegroups
+
+        :returns: List of nodegroups
+        :rtype list:
+        """
+        return (yield from self._get_json('/nodegroups/', dict(op='list'),
+                                          default=[]))
+
+    @asyncio.coroutine
+    def nodegroups_download_progress(self, uuid):
+        """ Report download progress for a cluster controller
+
+        :param str uuid: uuid of controller
+        :returns: file information
+        :rtype: dict
+        """
+        _url = "/nodegroups/{uuid}/".format(uuid=uuid)
+        res = yield from self.post(_url, dict(op='report_download_progress'))
+        if res.ok:
+            return json.loads(res.text)
+        return {}
+
+    ###########################################################################
+    # Tag API
+    ###########################################################################
+    @asyncio.coroutine
+    def tags(self):
+        """ List tags known to MAAS
+
+        :returns: List of tags or empty list
+        """
+        return (yield from self._get_json('/tags/', dict(op='list'),
+                                          default=[]))
+
+    @asyncio.coroutine
+    def tag_new(self, tag):
+        """ Create tag if it doesn't exist.
+
+        :param tag: Tag name
+        :returns: Success/Fail boolean
+        """
+        tags = yield from self.tags()
+        if tag not in [t['name'] for t in tags]:
+            return (yield from self._post_ok('/tags/', dict(op='new',
+                                                            name=tag)))
+        return False
+
+    @asyncio.coroutine
+    def tag_delete(self, tag):
+        """ Delete a tag
+
+        :param tag: tag id
+        :type tag: str
+        :returns: True on success False on failure
+        :rtype: bool
+        """
+        res = yield from self.delete('/tags/%s' % (tag,))
+        return res.ok
+
+    @asyncio.coroutine
+    def tag_machine(self, tag, system_id):
+        """ Tag the machine with the specified tag.
+
+        :param tag: Tag name
+        :type tag: str
+        :param system_id: ID of node
+        :type system_id: str
+        :returns: Success or Fail
+        :rtype: bool
+        """
+        return (yield from self.tag_machines(tag, [system_id]))
+
+    @asyncio.coroutine
+    def tag_machines(self, tag, system_ids):
+        """ Tag several machines with the specified tag in one request.
+
+        :param tag: Tag name
+        :type tag: str
+        :param system_ids: IDs of nodes
+        :type system_ids: list
+        :returns: Success or Fail
+        :rtype: bool
+        """
+        if not system_ids:
+            return True
+        return (yield from self._post_ok('/tags/%s/' % (tag,),
+                                         dict(op='update_nodes',
+                                              add=list(system_ids))))
+
+    @asyncio.coroutine
+    def tag_nodes(self, tagging):
+        """ Create any missing tags and apply them, the tags concurrently.
+
+        :param tagging: system ids to add to each tag
+        :type tagging: dict { tag: [system_id, ...] }
+        :returns: True if every tag was applied
+        :rtype: bool
+        """
+        tagging = {tag: system_ids for tag, system_ids in tagging.items()
+                   if system_ids}
+        if not tagging:
+            return True
+        known = [t['name'] for t in (yield from self.tags())]
+        yield from asyncio.gather(
+            *[self._post_ok('/tags/', dict(op='new', name=tag))
+              for tag in tagging if tag not in known])
+        results = yield from asyncio.gather(
+            *[self.tag_machines(tag, system_ids)
+              for tag, system_ids in tagging.items()])
+        return all(results)
+
+    ###########################################################################
+    # Users API
+    ###########################################################################
+    @asyncio.coroutine
+    def users(self):
+        """ List users on MAAS
+
+        :returns: List of registered users or an empty list
+        """
+        return (yield from self._get_json('/users/', default=[]))
+
+    ###########################################################################
+    # Zone API
+    ###########################################################################
+    @asyncio.coroutine
+    def zones(self):
+        """ List physical zones
+
+        :returns: List of managed zones or empty list
+        """
+        return (yield from self._get_json('/zones/', default=[]))
+
+    @asyncio.coroutine
+    def zone_new(self, name, description="Zone created by API"):
+        """ Create a physical zone
+
+        :param name: Name of the zone
+        :param description: Description of zone.
+        :returns: True on success False on failure
+        """
+        return (yield from self._post_ok('/zones/',
+                                         dict(name=name,
+                                              description=description)))
+
+    @asyncio.coroutine
+    def zone_delete(self, name):
+        """ Delete a zone.
+
+        :param name: Name of the zone to be deleted
+        :returns True on success & False on failure.
+        """
+        res = yield from self.delete('/zones/{}/'.format(name))
+        return res.ok
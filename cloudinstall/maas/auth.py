@@ -25,16 +25,38 @@ import logging
 
 log = logging.getLogger(__name__)
 
+MAAS_CREDS_FILE = '~/.cloud-install/maas-creds'
+
 
 class MaasAuth:
     """ MAAS Authorization class
     """
+
+    # api keys shared by every MaasAuth in the process, keyed by creds
+    # file (with the mtime they were read at) or by MAAS username
+    _credentials = {}
+
     def __init__(self):
         """ Initialize with optional OAuth credentials
         """
         self.api_url = 'http://localhost/MAAS/api/1.0'
         self.api_key = None
         self.consumer_secret = ''
+        self.creds_file = os.path.expanduser(MAAS_CREDS_FILE)
+
+    @property
+    def api_key(self):
+        """ Maas api key, consumer_key:token_key:token_secret
+
+        :rtype: str
+        """
+        return self._api_key
+
+    @api_key.setter
+    def api_key(self, api_key):
+        self._api_key = api_key
+        parts = api_key.split(':') if api_key else []
+        self._key_parts = (parts + [None] * 3)[:3]
 
     @property
     def is_logged_in(self):
@@ -50,7 +72,7 @@ class MaasAuth:
 
         :rtype: str
         """
-        return self.api_key.split(':')[0] if self.api_key else None
+        return self._key_parts[0]
 
     @property
     def token_key(self):
@@ -58,7 +80,7 @@ class MaasAuth:
 
         :rtype: str
         """
-        return self.api_key.split(':')[1] if self.api_key else None
+        return self._key_parts[1]
 
     @property
     def token_secret(self):
@@ -66,23 +88,40 @@ class MaasAuth:
 
         :rtype: str
         """
-        return self.api_key.split(':')[2] if self.api_key else None
+        return self._key_parts[2]
 
     def get_api_key(self, username='root'):
         """ MAAS api key
 
+        The key is read once per process and only read again when the
+        credentials file changes, so this is cheap to call every poll.
+
         :param username: (optional) MAAS user to query for credentials
         :type username: str
         """
-        maas_creds_file = os.path.expanduser('~/.cloud-install/maas-creds')
-        if os.path.isfile(maas_creds_file):
-            with open(maas_creds_file, 'r') as f:
-                self.api_key = f.read().rstrip('\n')
+        try:
+            mtime = os.stat(self.creds_file).st_mtime
+        except OSError:
+            mtime = None
+
+        if mtime is not None:
+            cached = self._credentials.get(self.creds_file)
+            if cached is None or cached[0] != mtime:
+                with open(self.creds_file, 'r') as f:
+                    cached = (mtime, f.read().rstrip('\n'))
+                self._credentials[self.creds_file] = cached
+            api_key = cached[1]
         else:
-            log.debug("Could not find credentials, attempting to login.")
-            out = check_output(['sudo', 'maas-region-admin', 'apikey',
-                                '--username', username])
-            self.api_key = out.decode('ascii').rstrip('\n')
+            api_key = self._credentials.get(username)
+            if api_key is None:
+                log.debug("Could not find credentials, attempting to login.")
+                out = check_output(['sudo', 'maas-region-admin', 'apikey',
+                                    '--username', username])
+                api_key = out.decode('ascii').rstrip('\n')
+                self._credentials[username] = api_key
+
+        if api_key != self.api_key:
+            self.api_key = api_key
 
     def read_config(self, url, creds):
         """Read cloud-init config from given `url` into `creds` dict.
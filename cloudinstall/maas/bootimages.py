@@ -0,0 +1,285 @@
+#
+# bootimages.py - Import MAAS boot images and follow their progress
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Boot image import across all cluster controllers """
+
+import argparse
+import logging
+import sys
+import threading
+import time
+
+from cloudinstall.maas.auth import MaasAuth
+from cloudinstall.maas.client import MaasClient
+
+log = logging.getLogger(__name__)
+
+# Seconds between progress polls, doubled up to MAX_POLL_INTERVAL while
+# nothing moves
+POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 30
+
+# Seconds to wait for an import before giving up
+IMPORT_TIMEOUT = 3600
+
+# Boot images waited for unless told otherwise
+DEFAULT_RELEASES = ('trusty',)
+DEFAULT_ARCHES = ('amd64',)
+
+# Nodegroup status of an accepted cluster controller
+NODEGROUP_ACCEPTED = 1
+
+
+class BootImageProgress:
+    """ Which of the wanted boot images every cluster controller has """
+
+    def __init__(self, releases=DEFAULT_RELEASES, arches=DEFAULT_ARCHES):
+        """ Constructor
+
+        :param list releases: (optional) ubuntu releases being imported
+        :param list arches: (optional) architectures being imported
+        """
+        self.expected = set((r, a) for r in releases for a in arches)
+        self.nodegroups = {}
+
+    def add(self, uuid, images):
+        """ Record the boot images one cluster controller lists
+
+        Images other than the expected releases and architectures, such
+        as ones left from earlier imports, don't count.
+
+        :param str uuid: uuid of cluster
+        :param list images: boot images the cluster has
+        """
+        have = set()
+        for image in images or []:
+            if isinstance(image, dict):
+                arch = (image.get('architecture') or '').split('/')[0]
+                have.add((image.get('release'), arch))
+        missing = self.expected - have
+        self.nodegroups[uuid] = dict(
+            available=len(self.expected) - len(missing),
+            missing=sorted(missing),
+            done=not missing)
+
+    @property
+    def total(self):
+        """ Images wanted across all clusters
+
+        :rtype: int
+        """
+        return len(self.expected) * len(self.nodegroups)
+
+    @property
+    def available(self):
+        """ Wanted images the clusters have so far
+
+        :rtype: int
+        """
+        return sum(n['available'] for n in self.nodegroups.values())
+
+    @property
+    def done(self):
+        """ Have all clusters finished importing?
+
+        :rtype: bool
+        """
+        return bool(self.nodegroups) and \
+            all(n['done'] for n in self.nodegroups.values())
+
+    @property
+    def percent(self):
+        """ Overall progress, from the wanted images clusters have
+
+        :rtype: int
+        """
+        if self.done:
+            return 100
+        if not self.total:
+            return 0
+        return min(99, 100 * self.available // self.total)
+
+    def __repr__(self):
+        return "<BootImageProgress({percent}%, {available}/{total} images, " \
+            "{n} clusters)>".format(percent=self.percent,
+                                    available=self.available,
+                                    total=self.total, n=len(self.nodegroups))
+
+
+class BootImageSync:
+    """ Starts boot image imports on every cluster controller at once and
+    follows them until they finish
+    """
+
+    def __init__(self, client, releases=DEFAULT_RELEASES,
+                 arches=DEFAULT_ARCHES, interval=POLL_INTERVAL,
+                 max_interval=MAX_POLL_INTERVAL):
+        """ Constructor
+
+        :param client: :class:MaasClient
+        :param list releases: (optional) ubuntu releases to wait for
+        :param list arches: (optional) architectures to wait for
+        :param float interval: (optional) seconds between polls while
+                               images are downloading
+        :param float max_interval: (optional) longest wait between polls
+        """
+        self.client = client
+        self.releases = releases
+        self.arches = arches
+        self.interval = interval
+        self.max_interval = max_interval
+        self.progress = BootImageProgress(releases, arches)
+
+    def nodegroups(self):
+        """ uuids of the accepted cluster controllers
+
+        :rtype: list
+        """
+        return [n['uuid'] for n in self.client.nodegroups
+                if n.get('status', NODEGROUP_ACCEPTED) == NODEGROUP_ACCEPTED]
+
+    def start(self):
+        """ Start importing on all cluster controllers in parallel
+
+        :returns: True if every cluster accepted the request
+        :rtype: bool
+        """
+        results = self.client.bulk(self.client.nodegroup_import_boot_images,
+                                   self.nodegroups())
+        for uuid, (ok, _) in results.items():
+            if not ok:
+                log.error("Cluster {uuid} didn't start importing boot "
+                          "images".format(uuid=uuid))
+        return all(ok for ok, _ in results.values())
+
+    def poll(self):
+        """ List every cluster controller's boot images, in parallel
+
+        :rtype: BootImageProgress
+        """
+        results = self.client.bulk(self.client.boot_images, self.nodegroups())
+        progress = BootImageProgress(self.releases, self.arches)
+        for uuid, (images, _) in results.items():
+            progress.add(uuid, images)
+        self.progress = progress
+        return progress
+
+    def wait(self, callback=None, timeout=IMPORT_TIMEOUT):
+        """ Poll until every cluster has its images or `timeout` passes
+
+        Polls come every `interval` seconds while images are arriving
+        and back off to `max_interval` while nothing changes.
+
+        :param callback: (optional) called with each BootImageProgress
+        :param float timeout: (optional) seconds to wait
+        :returns: the last progress polled
+        :rtype: BootImageProgress
+        """
+        deadline = time.time() + timeout
+        interval = self.interval
+        last = None
+        while True:
+            progress = self.poll()
+            if callback:
+                callback(progress)
+            if progress.done or time.time() >= deadline:
+                return progress
+            if last is not None and progress.available == last:
+                interval = min(interval * 2, self.max_interval)
+            else:
+                interval = self.interval
+            last = progress.available
+            time.sleep(max(0, min(interval, deadline - time.time())))
+
+    def wait_in_background(self, callback=None, timeout=IMPORT_TIMEOUT):
+        """ wait() on a background thread, self.progress follows along
+
+        :returns: the thread
+        :rtype: threading.Thread
+        """
+        thread = threading.Thread(target=self.wait,
+                                  args=(callback, timeout))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def gauge_prompt(percent, text):
+    """ Progress in the format of share/display.sh dialogGaugePrompt
+
+    :rtype: str
+    """
+    return "XXX\n{percent}\n{text}\nXXX".format(percent=percent, text=text)
+
+
+def main(argv=None):
+    """ Command line entry point, see maas-boot-images --help
+
+    :returns: exit status, 0 once all images are imported
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        description="Import MAAS boot images on every cluster controller "
+        "and report progress until they are available.")
+    parser.add_argument('--api-key', help="MAAS api key, read from "
+                        "~/.cloud-install/maas-creds when not given")
+    parser.add_argument('--no-start', action='store_true',
+                        help="only follow imports already running")
+    parser.add_argument('--release', action='append', dest='releases',
+                        help="ubuntu release to wait for, may be repeated "
+                        "(default: {d})".format(
+                            d=", ".join(DEFAULT_RELEASES)))
+    parser.add_argument('--arch', action='append', dest='arches',
+                        help="architecture to wait for, may be repeated "
+                        "(default: {d})".format(d=", ".join(DEFAULT_ARCHES)))
+    parser.add_argument('--timeout', type=float, default=IMPORT_TIMEOUT,
+                        help="seconds to wait (default: %(default)s)")
+    parser.add_argument('--gauge', nargs=2, type=int,
+                        metavar=('START', 'RANGE'),
+                        help="print dialog gauge prompts going from START "
+                        "to START + RANGE percent")
+    parser.add_argument('--text', default="Importing MAAS boot images",
+                        help="gauge prompt text")
+    args = parser.parse_args(argv)
+
+    auth = MaasAuth()
+    if args.api_key:
+        auth.api_key = args.api_key
+    else:
+        auth.get_api_key('root')
+    sync = BootImageSync(MaasClient(auth),
+                         releases=args.releases or DEFAULT_RELEASES,
+                         arches=args.arches or DEFAULT_ARCHES)
+
+    def report(progress):
+        if args.gauge:
+            start, span = args.gauge
+            print(gauge_prompt(start + span * progress.percent // 100,
+                               "{text} ({percent}%)".format(
+                                   text=args.text,
+                                   percent=progress.percent)))
+        else:
+            print("{percent}% {available}/{total} images".format(
+                percent=progress.percent, available=progress.available,
+                total=progress.total))
+        sys.stdout.flush()
+
+    if not args.no_start and not sync.start():
+        return 1
+    progress = sync.wait(report, args.timeout)
+    return 0 if progress.done else 1
@@ -16,36 +16,291 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from cloudinstall.maas import MaasState
+from concurrent.futures import ThreadPoolExecutor
+from cloudinstall.maas import MaasState, MaasMachine
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import ConnectTimeoutError
 from requests_oauthlib import OAuth1
 import requests
+import codecs
+import hashlib
 import json
+import logging
+import socket
+import time
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait for MAAS to answer a request
+DEFAULT_TIMEOUT = 60
+
+# Connections kept open to the region controller
+POOL_SIZE = 10
+
+# Seconds to trust the cached list of tag names
+TAG_CACHE_TTL = 60
+
+# Seconds a listing is served from memory before MAAS is asked again.
+# Nodes stay below the GUI poll interval so every poll revalidates them.
+RESPONSE_CACHE_TTL = {
+    '/nodes/': 5,
+    '/nodegroups/': 30,
+    '/tags/': 60,
+    '/users/': 60,
+    '/zones/': 60,
+    'boot-images': 30,
+}
+
+# Cached listings that writes to another resource change too, nodes
+# list their tags and zone
+RESPONSE_CACHE_RELATED = {
+    '/tags/': ('/nodes/',),
+    '/zones/': ('/nodes/',),
+}
+
+# Bytes read from MAAS at a time when streaming a node listing
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Tag making MAAS install nodes with the fast path installer
+FPI_TAG = 'use-fastpath-installer'
+
+
+def fpi_untagged(maas):
+    """ DECLARED nodes still missing the FPI tag
+
+    :param maas: MaasState of all managed nodes
+    :returns: system ids
+    :rtype: list
+    """
+    return [node['system_id'] for node in maas
+            if node['status'] == MaasState.DECLARED and
+            FPI_TAG not in node.get('tag_names', [])]
+
+
+def hostname_untagged(maas):
+    """ Nodes not yet tagged with their hostname tag, see
+    MaasClient.tag_name
+
+    :param maas: MaasState of all managed nodes
+    :returns: system ids
+    :rtype: list
+    """
+    return [machine.system_id for machine in maas.machines()
+            if machine.system_id not in machine.tag_names]
+
+
+def nodes_list_params(hostname=None, mac_address=None, zone=None,
+                      system_ids=None):
+    """ Query for a node listing filtered by MAAS, see
+    MaasClient.nodes_list
+
+    :rtype: dict
+    """
+    params = dict(op='list')
+    if hostname:
+        params['hostname'] = hostname
+    if mac_address:
+        params['mac_address'] = mac_address
+    if zone:
+        params['zone'] = zone
+    if system_ids:
+        params['id'] = list(system_ids)
+    return params
+
+
+def filter_nodes(nodes, status=None, tags=None, fields=None):
+    """ Apply the filters MAAS can't to a node listing, see
+    MaasClient.nodes_list
+
+    :returns: matching nodes
+    :rtype: list
+    """
+    if status is not None or tags:
+        nodes = [n for n in nodes if node_matches(n, status, tags)]
+    if fields:
+        nodes = [{f: n[f] for f in fields if f in n} for n in nodes]
+    return nodes
+
+
+def node_matches(node, status=None, tags=None):
+    """ Does a node pass the filters MAAS can't apply?
+
+    :param status: status or list of statuses, see MaasState
+    :param list tags: tags the node must carry
+    :rtype: bool
+    """
+    if status is not None:
+        if isinstance(status, int):
+            status = [status]
+        if node.get('status') not in status:
+            return False
+    if tags and not set(tags).issubset(node.get('tag_names', [])):
+        return False
+    return True
+
+
+def iter_json_array(chunks):
+    """ Decode a JSON array incrementally
+
+    Elements are yielded as soon as their text has arrived, so neither
+    the whole text nor the whole decoded array is held at once.
+
+    :param chunks: iterable of utf-8 encoded pieces of the array
+    :returns: decoded elements
+    :rtype: generator
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buf = buf[pos:] + text.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Element not complete yet, wait for more text
+                break
+            if end == len(buf) and not isinstance(element,
+                                                  (dict, list, str)):
+                # A number or literal may continue in the next chunk
+                break
+            yield element
+            pos = end
+    raise ValueError("JSON array ended early")
+
+
+def resource(url):
+    """ Top level MAAS resource of an endpoint
+
+    :param str url: MAAS endpoint, e.g. '/nodes/node-1/'
+    :returns: e.g. '/nodes/'
+    :rtype: str
+    """
+    return '/' + url.strip('/').split('/')[0] + '/'
+
+
+def never_sent(e):
+    """ Did a failed request die while connecting, before MAAS got it?
+
+    Only then can a POST be repeated without risking it being run twice.
+    A connection aborted or timed out after sending doesn't count.
+
+    :param e: exception raised by requests
+    :rtype: bool
+    """
+    connect_errors = (ConnectionRefusedError, socket.gaierror,
+                      ConnectTimeoutError)
+    connect_timeout = getattr(requests.exceptions, 'ConnectTimeout', None)
+    if connect_timeout and isinstance(e, connect_timeout):
+        return True
+    while isinstance(e, Exception):
+        if isinstance(e, connect_errors):
+            return True
+        # requests and urllib3 wrap the socket error they ran into
+        e = getattr(e, 'reason', None) or (e.args[0] if e.args else None)
+    return False
 
 
 class MaasClient:
     """ Client Class
     """
 
-    def __init__(self, auth):
+    def __init__(self, auth, timeout=DEFAULT_TIMEOUT, retries=3,
+                 backoff=0.5):
         """ Entry point to client routines for interfacing
         with MAAS api.
 
+        Requests share one session, so connections to MAAS are kept
+        alive and reused.
+
         :param auth: MAAS Authorization class (required)
+        :param float timeout: (optional) seconds to wait for a response
+        :param int retries: (optional) times to retry a request that
+                            failed to reach MAAS
+        :param float backoff: (optional) seconds before the first retry,
+                              doubled for each one after that
         """
         self.auth = auth
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._oauth_signer = None
+        self._oauth_key = None
+        self._tag_cache = None
+        self._tag_cache_time = 0
+        self._response_cache = {}
 
     def _oauth(self):
         """ Generates OAuth attributes for protected resources
 
+        The signer is reused until the api key changes.
+
         :returns: OAuth class
         """
-        oauth = OAuth1(self.auth.consumer_key,
-                       client_secret=self.auth.consumer_secret,
-                       resource_owner_key=self.auth.token_key,
-                       resource_owner_secret=self.auth.token_secret,
-                       signature_method='PLAINTEXT',
-                       signature_type='query')
-        return oauth
+        if self._oauth_signer is None or \
+           self._oauth_key != self.auth.api_key:
+            self._oauth_signer = OAuth1(
+                self.auth.consumer_key,
+                client_secret=self.auth.consumer_secret,
+                resource_owner_key=self.auth.token_key,
+                resource_owner_secret=self.auth.token_secret,
+                signature_method='PLAINTEXT',
+                signature_type='query')
+            self._oauth_key = self.auth.api_key
+        return self._oauth_signer
+
+    def _request(self, method, url, **kwargs):
+        """ Perform a request, retrying with backoff when it fails
+
+        GETs are retried on any connection error, timeout or server
+        error. Other methods are only retried when the connection
+        couldn't be made, see never_sent().
+
+        :param str method: HTTP method
+        :param str url: MAAS endpoint
+        """
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                res = self.session.request(method,
+                                           self.auth.api_url + url,
+                                           auth=self._oauth(),
+                                           timeout=self.timeout,
+                                           **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retry = method == 'GET' or never_sent(e)
+                if last_attempt or not retry:
+                    raise
+                log.debug("{method} {url} failed, retrying in {d}s: "
+                          "{e}".format(method=method, url=url, d=delay, e=e))
+            else:
+                if res.status_code < 500 or method != 'GET' or last_attempt:
+                    return res
+                log.debug("{method} {url} returned {status}, retrying in "
+                          "{d}s".format(method=method, url=url, d=delay,
+                                        status=res.status_code))
+            time.sleep(delay)
+            delay *= 2
 
     def get(self, url, params=None):
         """ Performs a authenticated GET against a MAAS endpoint
@@ -53,9 +308,7 @@ class MaasClient:
         :param url: MAAS endpoint
         :param params: extra data sent with the HTTP request
         """
-        return requests.get(url=self.auth.api_url + url,
-                            auth=self._oauth(),
-                            params=params)
+        return self._request('GET', url, params=params)
 
     def post(self, url, params=None):
         """ Performs a authenticated POST against a MAAS endpoint
@@ -63,9 +316,10 @@ class MaasClient:
         :param url: MAAS endpoint
         :param params: extra data sent with the HTTP request
         """
-        return requests.post(url=self.auth.api_url + url,
-                             auth=self._oauth(),
-                             data=params)
+        res = self._request('POST', url, data=params)
+        if res.ok:
+            self.invalidate_cache(url)
+        return res
 
     def delete(self, url, params=None):
         """ Performs a authenticated DELETE against a MAAS endpoint
@@ -73,8 +327,88 @@ class MaasClient:
         :param url: MAAS endpoint
         :param params: extra data sent with the HTTP request
         """
-        return requests.delete(url=self.auth.api_url + url,
-                               auth=self._oauth())
+        res = self._request('DELETE', url)
+        if res.ok:
+            self.invalidate_cache(url)
+        return res
+
+    def get_json(self, url, params=None, ttl=0, default=None):
+        """ GET a MAAS listing, served from memory while it is fresh
+
+        Within `ttl` seconds the previous result is returned without a
+        request. After that the request carries the ETag and
+        Last-Modified validators MAAS sent, if any, so an unchanged
+        listing costs a 304. A 200 whose body hashes the same as the
+        cached one isn't parsed again.
+
+        The returned data is shared between callers, don't modify it.
+
+        :param str url: MAAS endpoint
+        :param dict params: extra data sent with the HTTP request
+        :param float ttl: (optional) seconds to trust the cached result
+        :param default: returned when MAAS answers with an error
+        :returns: decoded JSON
+        """
+        key = (url, self._cache_key(params))
+        entry = self._response_cache.get(key)
+        now = time.time()
+        if entry is not None and now < entry['expires']:
+            return entry['data']
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        res = self._request('GET', url, params=params, headers=headers)
+
+        if entry is not None and res.status_code == 304:
+            entry['expires'] = now + ttl
+            return entry['data']
+        if not res.ok:
+            return default
+
+        digest = hashlib.sha1(res.text.encode('utf-8')).hexdigest()
+        if entry is not None and entry['digest'] == digest:
+            data = entry['data']
+        else:
+            data = json.loads(res.text)
+        self._response_cache[key] = dict(
+            expires=now + ttl,
+            etag=res.headers.get('ETag'),
+            last_modified=res.headers.get('Last-Modified'),
+            digest=digest,
+            data=data)
+        return data
+
+    @staticmethod
+    def _cache_key(params):
+        """ Hashable form of request parameters """
+        if not params:
+            return ()
+        return tuple(sorted(
+            (k, tuple(v) if isinstance(v, (list, tuple)) else v)
+            for k, v in params.items()))
+
+    def invalidate_cache(self, url=None):
+        """ Forget cached listings, the next reads go to MAAS
+
+        Called after every successful POST or DELETE with its endpoint,
+        which drops the listings of that resource and of those in
+        RESPONSE_CACHE_RELATED. Other listings stay cached.
+
+        :param str url: (optional) endpoint written to, all listings are
+                        forgotten without one
+        """
+        if url is None:
+            self._response_cache.clear()
+            return
+        stale = set(RESPONSE_CACHE_RELATED.get(resource(url), ()))
+        stale.add(resource(url))
+        for key in list(self._response_cache):
+            if resource(key[0]) in stale:
+                self._response_cache.pop(key, None)
 
     ###########################################################################
     # Boot Images API
@@ -87,10 +421,8 @@ class MaasClient:
         :rtype: list
         """
         _url = "/nodegroups/{uuid}/boot-images/".format(uuid=uuid)
-        res = self.get(_url)
-        if res.ok:
-            return json.loads(res.text)
-        return []
+        return self.get_json(_url, ttl=RESPONSE_CACHE_TTL['boot-images'],
+                             default=[])
 
     def import_boot_images(self):
         """ Import boot images on all accepted controllers
@@ -104,6 +436,17 @@ class MaasClient:
             return True
         return False
 
+    def nodegroup_import_boot_images(self, uuid):
+        """ Import boot images on one cluster controller
+
+        :param str uuid: uuid of cluster
+        :returns: true on success, false on failure
+        :rtype: bool
+        """
+        _url = "/nodegroups/{uuid}/".format(uuid=uuid)
+        res = self.post(_url, dict(op='import_boot_images'))
+        return res.ok
+
     def report_boot_images(self, uuid):
         """ Describe imported images
 
@@ -127,10 +470,59 @@ class MaasClient:
         :returns: managed nodes
         :rtype: list
         """
-        res = self.get('/nodes/', dict(op='list'))
-        if res.ok:
-            return json.loads(res.text)
-        return []
+        return self.nodes_list()
+
+    def nodes_list(self, hostname=None, mac_address=None, zone=None,
+                   system_ids=None, status=None, tags=None, fields=None):
+        """ Nodes managed by MAAS, optionally filtered
+
+        hostname, mac_address, zone and system_ids are passed on to MAAS
+        so only matching nodes are sent back. MAAS can't filter on
+        status or tags, those are applied once the list arrives.
+
+        :param hostname: (optional) hostname or list of hostnames
+        :param mac_address: (optional) MAC address or list of them
+        :param str zone: (optional) physical zone name
+        :param list system_ids: (optional) machine identifications
+        :param status: (optional) status or list of statuses,
+                       see MaasState
+        :param list tags: (optional) tags every node must carry
+        :param fields: (optional) only keep these fields of each node,
+                       e.g. MaasMachine.FIELDS
+        :returns: managed nodes
+        :rtype: list
+        """
+        params = nodes_list_params(hostname, mac_address, zone, system_ids)
+        nodes = self.get_json('/nodes/', params,
+                              ttl=RESPONSE_CACHE_TTL['/nodes/'], default=[])
+        return filter_nodes(nodes, status, tags, fields)
+
+    def nodes_iter(self, hostname=None, mac_address=None, zone=None,
+                   system_ids=None, status=None, tags=None, fields=None):
+        """ Stream nodes managed by MAAS, one machine at a time
+
+        Same filters as nodes_list(), but the listing is decoded while
+        it downloads and isn't cached, so memory use stays flat on
+        regions with thousands of nodes. Pass the result to MaasState
+        to index it as it is read.
+
+        :returns: managed nodes
+        :rtype: generator of MaasMachine
+        """
+        params = nodes_list_params(hostname, mac_address, zone, system_ids)
+        res = self._request('GET', '/nodes/', params=params, stream=True)
+        try:
+            if not res.ok:
+                return
+            chunks = res.iter_content(STREAM_CHUNK_SIZE)
+            for node in iter_json_array(chunks):
+                if not node_matches(node, status, tags):
+                    continue
+                if fields:
+                    node = {f: node[f] for f in fields if f in node}
+                yield MaasMachine(-1, node)
+        finally:
+            res.close()
 
     def nodes_accept_all(self):
         """ Accept all commissioned nodes
@@ -188,6 +580,103 @@ class MaasClient:
             return True
         return False
 
+    def bulk(self, op, system_ids, max_workers=POOL_SIZE):
+        """ Run a single operation over many nodes or nodegroups
+        concurrently
+
+        A request that fails counts as False.
+
+        :param op: function taking a system id or uuid and returning
+                   success or its result
+        :param system_ids: machine identifications or nodegroup uuids
+        :param int max_workers: (optional) requests in flight at once
+        :returns: { system_id: (result, seconds taken) }
+        :rtype: dict
+        """
+        def timed_op(system_id):
+            start = time.time()
+            try:
+                ok = op(system_id)
+            except requests.RequestException:
+                log.exception("{op} failed for {id}".format(
+                    op=op.__name__, id=system_id))
+                ok = False
+            return (ok, time.time() - start)
+
+        system_ids = list(system_ids)
+        if not system_ids:
+            return {}
+        workers = max(1, min(max_workers, len(system_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(timed_op, system_ids)
+            return dict(zip(system_ids, results))
+
+    def _bulk_collection_op(self, op, system_ids):
+        """ Run one of MAAS's multi-node operations on /nodes/
+
+        :returns: { system_id: (success, seconds taken) }
+        :rtype: dict
+        """
+        system_ids = list(system_ids)
+        if not system_ids:
+            return {}
+        start = time.time()
+        res = self.post('/nodes/', dict(op=op, nodes=system_ids))
+        result = (res.ok, time.time() - start)
+        return {system_id: result for system_id in system_ids}
+
+    def nodes_commission(self, system_ids, max_workers=POOL_SIZE):
+        """ (Re)commission several nodes concurrently
+
+        :param system_ids: machine identifications
+        :param int max_workers: (optional) requests in flight at once
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return self.bulk(self.node_commission, system_ids, max_workers)
+
+    def nodes_start(self, system_ids, max_workers=POOL_SIZE):
+        """ Power up several nodes concurrently
+
+        :param system_ids: machine identifications
+        :param int max_workers: (optional) requests in flight at once
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return self.bulk(self.node_start, system_ids, max_workers)
+
+    def nodes_stop(self, system_ids, max_workers=POOL_SIZE):
+        """ Shutdown several nodes concurrently
+
+        :param system_ids: machine identifications
+        :param int max_workers: (optional) requests in flight at once
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return self.bulk(self.node_stop, system_ids, max_workers)
+
+    def nodes_remove(self, system_ids, max_workers=POOL_SIZE):
+        """ Delete several nodes concurrently
+
+        :param system_ids: machine identifications
+        :param int max_workers: (optional) requests in flight at once
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return self.bulk(self.node_remove, system_ids, max_workers)
+
+    def nodes_accept(self, system_ids):
+        """ Accept several declared nodes in one request
+
+        :param system_ids: machine identifications
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return self._bulk_collection_op('accept', system_ids)
+
+    def nodes_release(self, system_ids):
+        """ Release several allocated nodes in one request
+
+        :param system_ids: machine identifications
+        :returns: { system_id: (success, seconds taken) }
+        """
+        return self._bulk_collection_op('release', system_ids)
+
     ###########################################################################
     # Nodegroups API
     ###########################################################################
@@ -198,10 +687,9 @@ class MaasClient:
         :returns: List of nodegroups
         :rtype list:
         """
-        res = self.get('/nodegroups/', dict(op='list'))
-        if res.ok:
-            return json.loads(res.text)
-        return []
+        return self.get_json('/nodegroups/', dict(op='list'),
+                             ttl=RESPONSE_CACHE_TTL['/nodegroups/'],
+                             default=[])
 
     def nodegroups_download_progress(self, uuid):
         """ Report download progress for a cluster controller
@@ -225,10 +713,27 @@ class MaasClient:
 
         :returns: List of tags or empty list
         """
-        res = self.get('/tags/', dict(op='list'))
-        if res.ok:
-            return json.loads(res.text)
-        return []
+        return self.get_json('/tags/', dict(op='list'),
+                             ttl=RESPONSE_CACHE_TTL['/tags/'], default=[])
+
+    def tag_names(self):
+        """ Names of the tags known to MAAS
+
+        Cached for TAG_CACHE_TTL seconds and kept up to date with tags
+        created or deleted through this client.
+
+        :returns: tag names
+        :rtype: set
+        """
+        if self._tag_cache is None or \
+           time.time() - self._tag_cache_time > TAG_CACHE_TTL:
+            self._tag_cache = {tagmd['name'] for tagmd in self.tags}
+            self._tag_cache_time = time.time()
+        return self._tag_cache
+
+    def invalidate_tags(self):
+        """ Forget cached tag names, the next lookup re-lists them """
+        self._tag_cache = None
 
     def tag_new(self, tag):
         """ Create tag if it doesn't exist.
@@ -236,9 +741,12 @@ class MaasClient:
         :param tag: Tag name
         :returns: Success/Fail boolean
         """
-        tags = {tagmd['name'] for tagmd in self.tags}
-        if tag not in tags:
+        if tag not in self.tag_names():
             res = self.post('/tags/', dict(op='new', name=tag))
+            # invalidate_tags() may have dropped the cache meanwhile
+            tag_cache = self._tag_cache
+            if res.ok and tag_cache is not None:
+                tag_cache.add(tag)
             return res.ok
         return False
 
@@ -252,6 +760,9 @@ class MaasClient:
         """
         res = self.delete('/tags/%s' % (tag,))
         if res.ok:
+            tag_cache = self._tag_cache
+            if tag_cache is not None:
+                tag_cache.discard(tag)
             return True
         return False
 
@@ -265,15 +776,45 @@ class MaasClient:
         :returns: Success or Fail
         :rtype: bool
         """
+        return self.tag_machines(tag, [system_id])
+
+    def tag_machines(self, tag, system_ids):
+        """ Tag several machines with the specified tag in one request.
+
+        :param tag: Tag name
+        :type tag: str
+        :param system_ids: IDs of nodes
+        :type system_ids: list
+        :returns: Success or Fail
+        :rtype: bool
+        """
+        if not system_ids:
+            return True
 
         # Make use of rest api
         res = self.post('/tags/%s/' % (tag,),
                         dict(op='update_nodes',
-                             add=system_id))
+                             add=list(system_ids)))
         if res.ok:
             return True
         return False
 
+    def tag_nodes(self, tagging):
+        """ Create any missing tags and apply them, one request per tag.
+
+        :param tagging: system ids to add to each tag
+        :type tagging: dict { tag: [system_id, ...] }
+        :returns: True if every tag was applied
+        :rtype: bool
+        """
+        ok = True
+        for tag, system_ids in tagging.items():
+            if not system_ids:
+                continue
+            self.tag_new(tag)
+            ok = self.tag_machines(tag, system_ids) and ok
+        return ok
+
     def tag_name(self, maas):
         """ Tag each node as its hostname.
 
@@ -284,14 +825,14 @@ class MaasClient:
         its hostname for now so that we can pass that tag as a
         constraint to juju.
 
+        Nodes already carrying their tag are skipped.
+
         :param maas: MAAS object representing all managed nodes
+        :returns: True if every tag was applied
+        :rtype: bool
         """
-        for machine in maas.machines():
-            tag = machine.system_id
-            if 'tag_names' not in machine.tag_names or \
-               tag not in machine.tag_names:
-                self.tag_new(tag)
-                self.tag_machine(tag, tag)
+        return self.tag_nodes({system_id: [system_id]
+                               for system_id in hostname_untagged(maas)})
 
     def tag_fpi(self, maas):
         """ Tag each DECLARED host with the FPI tag.
@@ -304,12 +845,10 @@ class MaasClient:
         re-tagging things that have already been tagged).
 
         :param maas: MAAS object representing all managed nodes
+        :returns: True if every tag was applied
+        :rtype: bool
         """
-        FPI_TAG = 'use-fastpath-installer'
-        self.tag_new(FPI_TAG)
-        for machine in maas:
-            if machine['status'] == MaasState.DECLARED:
-                self.tag_machine(FPI_TAG, machine['system_id'])
+        return self.tag_nodes({FPI_TAG: fpi_untagged(maas)})
 
     ###########################################################################
     # Users API
@@ -320,10 +859,8 @@ class MaasClient:
 
         :returns: List of registered users or an empty list
         """
-        res = self.get('/users/')
-        if res.ok:
-            return json.loads(res.text)
-        return []
+        return self.get_json('/users/', ttl=RESPONSE_CACHE_TTL['/users/'],
+                             default=[])
 
     ###########################################################################
     # Zone API
@@ -334,10 +871,8 @@ class MaasClient:
 
         :returns: List of managed zones or empty list
         """
-        res = self.get('/zones/')
-        if res.ok:
-            return json.loads(res.text)
-        return []
+        return self.get_json('/zones/', ttl=RESPONSE_CACHE_TTL['/zones/'],
+                             default=[])
 
     def zone_new(self, name, description="Zone created by API"):
         """ Create a physical zone
@@ -0,0 +1,159 @@
+#
+# reconciler.py - Bring MAAS nodes into the shape the installer needs
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tags and accepts MAAS nodes outside of the status poll """
+
+import logging
+import threading
+import time
+
+import requests
+
+from cloudinstall.maas import MaasState
+from cloudinstall.maas.client import fpi_untagged, hostname_untagged
+
+log = logging.getLogger(__name__)
+
+# Minimum seconds between two reconciliation runs
+RECONCILE_INTERVAL = 30
+
+
+class MaasReconciler:
+    """ Applies the FPI tag, accepts declared nodes and tags every node
+    with its hostname
+
+    Polls only report the MAAS state they observed through notify().
+    A background thread does the writes, and only when that state has
+    nodes still needing them.
+    """
+
+    def __init__(self, client, interval=RECONCILE_INTERVAL):
+        """ Constructor
+
+        :param client: :class:MaasClient used for the writes
+        :param float interval: (optional) minimum seconds between runs
+        """
+        self.client = client
+        self.interval = interval
+        self.metrics = dict(runs=0, skipped=0, errors=0, accepted=0,
+                            tagged=0, last_run=None, last_duration=0.0)
+        self._pending = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def declared(maas):
+        """ Nodes waiting to be tagged FPI and accepted
+
+        :param maas: MaasState of all managed nodes
+        :rtype: list
+        """
+        return [node for node in maas
+                if node['status'] == MaasState.DECLARED]
+
+    def needs_work(self, maas):
+        """ Does this state have nodes left to reconcile?
+
+        :param maas: MaasState of all managed nodes
+        :rtype: bool
+        """
+        return bool(self.declared(maas) or hostname_untagged(maas))
+
+    def notify(self, maas):
+        """ Report a freshly polled state, waking the reconciler if it
+        needs work
+
+        :param maas: MaasState of all managed nodes
+        :returns: whether a run was scheduled
+        :rtype: bool
+        """
+        if not self.needs_work(maas):
+            self.metrics['skipped'] += 1
+            return False
+        with self._lock:
+            self._pending = maas
+        self.start()
+        self._wakeup.set()
+        return True
+
+    def start(self):
+        """ Start reconciling in a background thread """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            last_run = self.metrics['last_run']
+            if last_run is not None:
+                time.sleep(max(0, last_run + self.interval - time.time()))
+            with self._lock:
+                maas, self._pending = self._pending, None
+            if maas is None:
+                continue
+            try:
+                self.reconcile(maas)
+            except Exception:
+                # keep the thread alive, the next notify() retries
+                log.exception("Reconciling MAAS nodes failed")
+                self.metrics['errors'] += 1
+                self.metrics['last_run'] = time.time()
+
+    def reconcile(self, maas):
+        """ Tag and accept nodes in `maas` that need it
+
+        Declared nodes are tagged FPI before they are accepted, as
+        MAAS would otherwise start commissioning them without it.
+
+        :param maas: MaasState of all managed nodes
+        :returns: True if every write succeeded
+        :rtype: bool
+        """
+        start = time.time()
+        declared = self.declared(maas)
+        untagged = hostname_untagged(maas)
+        ok = True
+        try:
+            if fpi_untagged(maas):
+                ok = self.client.tag_fpi(maas)
+            if declared:
+                if self.client.nodes_accept_all():
+                    self.metrics['accepted'] += len(declared)
+                else:
+                    ok = False
+            if untagged:
+                tagged = self.client.tag_name(maas)
+                if tagged:
+                    self.metrics['tagged'] += len(untagged)
+                ok = tagged and ok
+        except requests.RequestException:
+            log.exception("Reconciling MAAS nodes failed")
+            ok = False
+        if not ok:
+            self.metrics['errors'] += 1
+        self.metrics['runs'] += 1
+        self.metrics['last_run'] = time.time()
+        self.metrics['last_duration'] = self.metrics['last_run'] - start
+        log.debug("Reconciled MAAS in {d:.2f}s: {m}".format(
+            d=self.metrics['last_duration'], m=self.metrics))
+        return ok
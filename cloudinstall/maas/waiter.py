@@ -0,0 +1,198 @@
+#
+# waiter.py - Wait for MAAS nodes and clusters to reach a state
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Waits on MAAS node statuses and cluster registration """
+
+import argparse
+import logging
+import time
+
+from cloudinstall.maas import MaasState
+from cloudinstall.maas.auth import MaasAuth
+from cloudinstall.maas.client import MaasClient
+
+log = logging.getLogger(__name__)
+
+# Seconds between polls, stretched by BACKOFF up to MAX_POLL_INTERVAL
+# while nothing changes
+POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 15
+BACKOFF = 1.5
+
+# Seconds to wait before giving up
+WAIT_TIMEOUT = 1800
+
+
+class NodeWaiter:
+    """ Polls MAAS until nodes reach the statuses asked for
+
+    All nodes are checked with a single listing per poll. Polls come
+    quickly while statuses are changing and slow down while they
+    aren't.
+    """
+
+    def __init__(self, client, interval=POLL_INTERVAL,
+                 max_interval=MAX_POLL_INTERVAL):
+        """ Constructor
+
+        :param client: :class:MaasClient
+        :param float interval: (optional) seconds between polls after a
+                               change
+        :param float max_interval: (optional) longest wait between polls
+        """
+        self.client = client
+        self.interval = interval
+        self.max_interval = max_interval
+        self.statuses = {}
+
+    def _poll_until(self, poll, timeout):
+        """ Call poll() until it returns something other than None, or
+        `timeout` seconds pass
+
+        poll() is passed whether the previous call saw a change.
+
+        :returns: poll()'s result, None on timeout
+        """
+        deadline = time.time() + timeout
+        interval = self.interval
+        while True:
+            # Always ask MAAS, not the client's cache
+            self.client.invalidate_cache()
+            result, changed = poll()
+            if result is not None:
+                return result
+            if time.time() >= deadline:
+                return None
+            if changed:
+                interval = self.interval
+            else:
+                interval = min(interval * BACKOFF, self.max_interval)
+            time.sleep(max(0, min(interval, deadline - time.time())))
+
+    def wait_for_nodes(self, targets, timeout=WAIT_TIMEOUT):
+        """ Wait for nodes to reach their target statuses
+
+        :param targets: { system_id: status or list of statuses }
+        :param float timeout: (optional) seconds to wait
+        :returns: True if every node got there before the deadline
+        :rtype: bool
+        """
+        targets = {system_id: [status] if isinstance(status, int)
+                   else list(status)
+                   for system_id, status in targets.items()}
+
+        def poll():
+            nodes = self.client.nodes_list(system_ids=list(targets),
+                                           fields=['system_id', 'status'])
+            statuses = {n['system_id']: n['status'] for n in nodes}
+            changed = statuses != self.statuses
+            if changed:
+                log.debug("Node statuses: {s}".format(s=statuses))
+            self.statuses = statuses
+            if all(statuses.get(system_id) in wanted
+                   for system_id, wanted in targets.items()):
+                return True, changed
+            return None, changed
+
+        return bool(self._poll_until(poll, timeout))
+
+    def wait_for_status(self, system_ids, status, timeout=WAIT_TIMEOUT):
+        """ Wait for several nodes to reach the same status
+
+        :param list system_ids: machine identifications
+        :param status: status or list of statuses, see MaasState
+        :param float timeout: (optional) seconds to wait
+        :returns: True if every node got there before the deadline
+        :rtype: bool
+        """
+        return self.wait_for_nodes({system_id: status
+                                    for system_id in system_ids}, timeout)
+
+    def wait_for_cluster_registration(self, timeout=WAIT_TIMEOUT):
+        """ Wait for the cluster controller to register with the region
+
+        :param float timeout: (optional) seconds to wait
+        :returns: uuid of the cluster, None on timeout
+        :rtype: str
+        """
+        def poll():
+            nodegroups = self.client.nodegroups
+            uuid = nodegroups[0]['uuid'] if nodegroups else None
+            if uuid is not None and uuid != 'master':
+                return uuid, True
+            return None, False
+
+        return self._poll_until(poll, timeout)
+
+
+def parse_status(status):
+    """ MAAS node status from a number or a name such as 'allocated'
+
+    :rtype: int
+    """
+    if status.isdigit():
+        return int(status)
+    try:
+        return getattr(MaasState, status.upper().replace('-', '_'))
+    except AttributeError:
+        raise argparse.ArgumentTypeError(
+            "unknown node status {s}".format(s=status))
+
+
+def main(argv=None):
+    """ Command line entry point, see maas-wait --help
+
+    :returns: exit status, 0 once the wait is over, 1 on timeout
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        description="Wait for MAAS nodes or the cluster controller.")
+    parser.add_argument('--api-key', help="MAAS api key, read from "
+                        "~/.cloud-install/maas-creds when not given")
+    parser.add_argument('--timeout', type=float, default=WAIT_TIMEOUT,
+                        help="seconds to wait (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest='command')
+    node = subparsers.add_parser(
+        'node', help="wait for nodes to reach a status")
+    node.add_argument('system_ids', nargs='+', metavar='SYSTEM_ID')
+    node.add_argument('--status', type=parse_status, required=True,
+                      action='append',
+                      help="status number or name, may be repeated")
+    subparsers.add_parser(
+        'cluster', help="wait for the cluster controller to register, "
+        "then print its uuid")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("a command is required")
+
+    auth = MaasAuth()
+    if args.api_key:
+        auth.api_key = args.api_key
+    else:
+        auth.get_api_key('root')
+    waiter = NodeWaiter(MaasClient(auth))
+
+    if args.command == 'node':
+        return 0 if waiter.wait_for_status(args.system_ids, args.status,
+                                           args.timeout) else 1
+
+    uuid = waiter.wait_for_cluster_registration(args.timeout)
+    if uuid is None:
+        return 1
+    print(uuid)
+    return 0
@@ -16,16 +16,56 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from functools import lru_cache
+
+# Hardware lookups kept, most machines share a handful of hardware
+# strings
+HARDWARE_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=HARDWARE_CACHE_SIZE)
+def _hardware_spec(hardware, spec):
+    """ Value of `spec` in a hardware string like 'arch=amd64 cpu-cores=1'
+
+    Shared by every machine with the same hardware string.
+
+    :rtype: str
+    """
+    if hardware:
+        for item in hardware.split(' '):
+            k, v = item.split('=')
+            if k in spec:
+                return v
+    return "N/A"
+
+
+@lru_cache(maxsize=HARDWARE_CACHE_SIZE)
+def _format_storage(storage):
+    """ Root disk size in gigabytes, e.g. '20.0G' for '20480M'
+
+    :rtype: str
+    """
+    try:
+        return "{size}G".format(size=str(int(storage[:-1]) / 1024))
+    except (TypeError, ValueError):
+        return "N/A"
+
 
 class Machine:
-    """ Base machine class """
+    """ Base machine class
+
+    Hardware fields are looked up on access, see _hardware_spec().
+    """
+
+    __slots__ = ('machine_id', 'machine', 'agent_state', 'dns_name',
+                 '_cpu_cores', '_storage', '_mem')
 
     def __init__(self, machine_id, machine):
         self.machine_id = machine_id
         self.machine = machine
-        self._cpu_cores = self.hardware('cpu-cores')
-        self._storage = self.hardware('root-disk')
-        self._mem = self.hardware('memory')
+        self._cpu_cores = None
+        self._storage = None
+        self._mem = None
         self.agent_state = self.machine.get('agent-state', '')
         self.dns_name = self.machine.get('dns-name', '')
 
@@ -36,6 +76,8 @@ class Machine:
         :returns: number of cpus
         :rtype: str
         """
+        if self._cpu_cores is None:
+            return self.hardware('cpu-cores')
         return self._cpu_cores
 
     @cpu_cores.setter
@@ -58,11 +100,9 @@ class Machine:
         :returns: storage size
         :rtype: str
         """
-        try:
-            self._storage = int(self._storage[:-1]) / 1024
-            return "{size}G".format(size=str(self._storage))
-        except:
-            return "N/A"
+        if self._storage is None:
+            return _format_storage(self.hardware('root-disk'))
+        return _format_storage(self._storage)
 
     @storage.setter
     def storage(self, val):
@@ -75,7 +115,9 @@ class Machine:
         :returns: memory size
         :rtype: str
         """
-        return "{size}".format(size=str(self._mem))
+        if self._mem is None:
+            return self.hardware('memory')
+        return str(self._mem)
 
     @mem.setter
     def mem(self, val):
@@ -89,14 +131,7 @@ class Machine:
         :returns: hardware of spec
         :rtype: str
         """
-        _machine = self.machine.get('hardware', None)
-        if _machine:
-            _hardware_list = _machine.split(' ')
-            for item in _hardware_list:
-                k, v = item.split('=')
-                if k in spec:
-                    return v
-        return "N/A"
+        return _hardware_spec(self.machine.get('hardware', None), spec)
 
     @property
     def instance_id(self):
@@ -16,15 +16,20 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from os.path import expanduser, exists
 from subprocess import check_call
+import time
 
 from cloudinstall import utils
-from cloudinstall.maas import MaasState
+from cloudinstall.maas import MaasState, MaasMachine
 from cloudinstall.maas.auth import MaasAuth
 from cloudinstall.juju import JujuState
+from cloudinstall.juju.client import JujuClient
+from cloudinstall.juju.watcher import JujuWatcher
 from cloudinstall.maas.client import MaasClient
+from cloudinstall.maas.reconciler import MaasReconciler
 
 log = logging.getLogger('cloudinstall.pegasus')
 
@@ -73,17 +78,61 @@ except IOError:
 SINGLE_SYSTEM = exists(expanduser('~/.cloud-install/single'))
 MULTI_SYSTEM = exists(expanduser('~/.cloud-install/multi'))
 
+# Shared AllWatcher, see juju_watcher()
+_juju_watcher = None
 
-def poll_state():
-    """ Polls current state of Juju and MAAS
+# Shared MaasClient, see maas_client()
+_maas_client = None
 
-    :returns: list of Machine() and the Juju state
-    :rtype: tuple (JujuState(), MaasState())
+# Shared MaasReconciler, see maas_reconciler()
+_maas_reconciler = None
+
+# Juju and MAAS are polled side by side
+_poll_executor = ThreadPoolExecutor(max_workers=2)
+
+# Seconds taken by each source ('juju', 'maas') and in 'total' by the
+# last poll_state()
+poll_timings = {}
+
+
+def juju_watcher():
+    """ AllWatcher keeping a live juju state, started on first use
+
+    :rtype: cloudinstall.juju.watcher.JujuWatcher
     """
-    # Capture Juju state
+    global _juju_watcher
+    if _juju_watcher is None:
+        _juju_watcher = JujuWatcher(JujuClient())
+        _juju_watcher.start()
+    return _juju_watcher
+
+
+def juju_state_changed():
+    """ Has the juju state changed since the last time we asked?
+
+    :rtype: bool
+    """
+    if _juju_watcher is None or not _juju_watcher.changed.is_set():
+        return False
+    _juju_watcher.changed.clear()
+    return True
+
+
+def poll_juju_state():
+    """ Current juju state
+
+    Taken from the AllWatcher once it is running, otherwise parsed from
+    `juju status`.
+
+    :rtype: JujuState()
+    """
+    juju = juju_watcher().snapshot()
+    if juju is not None:
+        return juju
+
     (ret, juju_stdout,
-     juju_stderr, _) = utils.get_command_output('juju status',
-                                                combine_output=False)
+     juju_stderr, _) = utils.get_command_output(
+        'juju status --format=json', combine_output=False)
     if ret:
         log.debug("Juju state unknown, will re-poll in "
                   "case bootstrap is taking a little longer to come up.")
@@ -97,22 +146,79 @@ def poll_state():
         except:
             log.exception("Ignoring exception in parsing juju state.")
             juju = JujuState('environment: local\nmachines:')
+    return juju
 
-    maas = None
-    if MULTI_SYSTEM:
-        # Login to MAAS
-        auth = MaasAuth()
-        auth.get_api_key('root')
-        # auth.login()
 
+def maas_client():
+    """ MAAS client shared by every poll, so its connections are reused
+
+    :rtype: MaasClient()
+    """
+    global _maas_client
+    if _maas_client is None:
         # Load Client routines
-        c = MaasClient(auth)
+        _maas_client = MaasClient(MaasAuth())
+
+    # Login to MAAS, only re-reads the key when the creds file changed
+    _maas_client.auth.get_api_key('root')
+    return _maas_client
+
+
+def maas_reconciler():
+    """ Shared reconciler tagging and accepting MAAS nodes
+
+    :rtype: MaasReconciler()
+    """
+    global _maas_reconciler
+    if _maas_reconciler is None:
+        _maas_reconciler = MaasReconciler(maas_client())
+    return _maas_reconciler
+
+
+def poll_maas_state():
+    """ Current MAAS state
+
+    :rtype: MaasState()
+    """
+    c = maas_client()
+
+    # Capture Maas state
+    maas = MaasState(c.nodes_list(fields=MaasMachine.FIELDS))
+    maas_reconciler().notify(maas)
+    return maas
+
+
+def _timed(source, f):
+    """ Wrap f to record how long it took in poll_timings """
+    def timed_f():
+        start = time.time()
+        try:
+            return f()
+        finally:
+            poll_timings[source] = time.time() - start
+    return timed_f
+
+
+def poll_state():
+    """ Polls current state of Juju and MAAS
+
+    Juju and MAAS are queried concurrently, the time each took is kept
+    in poll_timings.
+
+    :returns: list of Machine() and the Juju state
+    :rtype: tuple (JujuState(), MaasState())
+    """
+    start = time.time()
+    juju_future = _poll_executor.submit(_timed('juju', poll_juju_state))
+    maas_future = None
+    if MULTI_SYSTEM:
+        maas_future = _poll_executor.submit(_timed('maas', poll_maas_state))
 
-        # Capture Maas state
-        maas = MaasState(c.nodes)
-        c.tag_fpi(maas)
-        c.nodes_accept_all()
-        c.tag_name(maas)
+    juju = juju_future.result()
+    maas = maas_future.result() if maas_future else None
+    poll_timings['total'] = time.time() - start
+    log.debug("Polled state in {total:.2f}s: {timings}".format(
+        total=poll_timings['total'], timings=poll_timings))
 
     update_machine_info(juju, maas)
     return (juju, maas)
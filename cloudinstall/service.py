@@ -26,6 +26,8 @@ log = logging.getLogger('c.service')
 class Unit:
     """ Unit class """
 
+    __slots__ = ('unit_name', 'unit')
+
     def __init__(self, unit_name, unit):
         self.unit_name = unit_name
         self.unit = unit
@@ -112,6 +114,8 @@ class Unit:
 class Relation:
     """ Relation class """
 
+    __slots__ = ('relation_name', 'charms')
+
     def __init__(self, relation_name, charms):
         self.relation_name = relation_name
         self.charms = charms
@@ -128,9 +132,13 @@ class Relation:
 class Service:
     """ Service class """
 
+    __slots__ = ('service_name', 'service', '_units', '_relations')
+
     def __init__(self, service_name, service):
         self.service_name = service_name
         self.service = service
+        self._units = None
+        self._relations = None
 
     @property
     def charm(self):
@@ -164,7 +172,7 @@ class Service:
         try:
             return next(filter(_match, self.units))
         except StopIteration:
-            return Unit('unknown', [])
+            return Unit('unknown', {})
 
     @property
     def units(self):
@@ -173,8 +181,10 @@ class Service:
         :returns: iterator of associated units for service
         :rtype: Unit()
         """
-        for unit_name, units in self.service.get('units', {}).items():
-            yield Unit(unit_name, units)
+        if self._units is None:
+            self._units = [Unit(unit_name, unit) for unit_name, unit
+                           in self.service.get('units', {}).items()]
+        return iter(self._units)
 
     def relation(self, name):
         """ Single relation entry
@@ -195,9 +205,11 @@ class Service:
         :returns: iterator of relations for service
         :rtype: Relation()
         """
-        relations = self.service.get('relations', {})
-        for relation_name, relation in relations.items():
-            yield Relation(relation_name, relation)
+        if self._relations is None:
+            self._relations = [Relation(relation_name, relation)
+                               for relation_name, relation
+                               in self.service.get('relations', {}).items()]
+        return iter(self._relations)
 
     def __repr__(self):
         return "<Service: {name} " \
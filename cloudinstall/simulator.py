@@ -0,0 +1,537 @@
+#
+# simulator.py - Dry runs of the charm deployment
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Runs ControllerOverlay and the charms against a simulated juju
+
+Nothing is deployed: a fake JujuClient updates a synthetic juju status
+that evolves with the simulated time, following a latency model. By
+default the simulated time only moves when every thread waits on it,
+so a run takes as long as the code does and gives the same times every
+time. A clock running `scale` times faster than the wall clock is
+available too.
+"""
+
+from collections import Counter
+import argparse
+import heapq
+import threading
+import time
+
+from urwid import Text
+
+from cloudinstall import gui
+from cloudinstall.charms.registry import registry
+from cloudinstall.charms.relations import RelationPlan
+from cloudinstall.deploy import DEPLOY_WORKERS
+from cloudinstall.juju import JujuState
+from cloudinstall.juju.client import JujuError
+from cloudinstall.maas import MaasState
+
+# Simulated seconds taken by each operation. Juju calls cost `call`
+# plus their own latency, units become started `container` or
+# `provision` seconds after being placed, plus `install`. An operation
+# can be tuned for a single charm as 'op:charm', e.g. 'install:mysql'.
+LATENCIES = {
+    'call': 0.5,
+    'deploy': 5,
+    'add_relation': 1,
+    'add_unit': 2,
+    'add_machine': 2,
+    'set_config': 1,
+    'container': 30,
+    'provision': 180,
+    'install': 60,
+}
+
+# Simulated seconds between polls of the juju status
+POLL_INTERVAL = 5
+
+# Simulated seconds per wall clock second, with --scale
+SCALE = 1000
+
+# Wall clock seconds between checks whether the event clock can move
+CLOCK_CHECK_INTERVAL = 0.001
+
+# Simulated seconds before giving up
+SIMULATION_TIMEOUT = 4 * 3600
+
+# The machine cloud-install puts the controller charms on
+CONTROLLER_MACHINE = '1'
+
+
+class SimClock:
+    """ Simulated time, `scale` times faster than the wall clock """
+
+    def __init__(self, scale=SCALE):
+        self.scale = scale
+        self.start = time.time()
+
+    def now(self):
+        """ Simulated seconds since the clock was created
+
+        :rtype: float
+        """
+        return (time.time() - self.start) * self.scale
+
+    def sleep(self, secs):
+        """ Sleep for `secs` simulated seconds """
+        if secs > 0:
+            time.sleep(secs / self.scale)
+
+    def close(self):
+        """ Nothing to release, sleeps end by themselves """
+
+
+class EventClock:
+    """ Simulated time that moves from one wake up to the next
+
+    Time stands still while any of the simulation's threads runs. Once
+    all of them sleep it jumps to the earliest wake up.
+    """
+
+    def __init__(self, threads=lambda: 1):
+        """ Constructor
+
+        :param threads: returns how many threads take part, time moves
+                        once that many are asleep
+        """
+        self.threads = threads
+        self._now = 0
+        self._wakeups = []
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def now(self):
+        """ Simulated seconds since the clock was created
+
+        :rtype: float
+        """
+        return self._now
+
+    def sleep(self, secs):
+        """ Sleep until `secs` simulated seconds from now """
+        if secs <= 0:
+            return
+        with self._cond:
+            wake = self._now + secs
+            heapq.heappush(self._wakeups, wake)
+            try:
+                while self._now < wake and not self._closed:
+                    # Threads woken by the last move have to leave first
+                    if self._wakeups[0] > self._now and \
+                       len(self._wakeups) >= self.threads():
+                        self._now = self._wakeups[0]
+                        self._cond.notify_all()
+                    else:
+                        self._cond.wait(CLOCK_CHECK_INTERVAL)
+            finally:
+                self._wakeups.remove(wake)
+                heapq.heapify(self._wakeups)
+
+    def close(self):
+        """ Wake every sleeper, the simulation is over """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class LatencyModel:
+    """ Simulated seconds taken by juju operations, see LATENCIES """
+
+    def __init__(self, latencies=None):
+        """ Constructor
+
+        :param dict latencies: (optional) overrides of LATENCIES
+        """
+        self.latencies = dict(LATENCIES)
+        self.latencies.update(latencies or {})
+
+    def __call__(self, op, charm=None):
+        """ Seconds taken by `op`, for `charm` when given
+
+        :rtype: float
+        """
+        if charm is not None:
+            key = "{op}:{charm}".format(op=op, charm=charm)
+            if key in self.latencies:
+                return self.latencies[key]
+        return self.latencies.get(op, 0)
+
+
+class SimulatedJuju:
+    """ A juju environment evolving with the simulated time
+
+    Machines and units are pending until the time they are ready at.
+    """
+
+    def __init__(self, clock, latency):
+        """ Constructor
+
+        :param clock: :class:EventClock or :class:SimClock
+        :param latency: :class:LatencyModel
+        """
+        self.clock = clock
+        self.latency = latency
+        self._lock = threading.Lock()
+        # machine id: time ready, containers are 'host/lxc/n'
+        self.machines = {'0': 0, CONTROLLER_MACHINE: 0}
+        # service: {unit name: (machine id, time started)}
+        self.units = {}
+        # service: {relation name: [services]}
+        self.relations = {}
+        self.converged_at = 0
+
+    def _ready(self, when):
+        self.converged_at = max(self.converged_at, when)
+        return when
+
+    def add_machine(self):
+        """ New machine, ready once provisioned
+
+        :returns: machine id
+        :rtype: str
+        """
+        with self._lock:
+            mid = str(len([m for m in self.machines if '/' not in m]))
+            self.machines[mid] = self._ready(
+                self.clock.now() + self.latency('provision'))
+            return mid
+
+    def _place(self, service, machine_id):
+        """ Machine for a new unit, added when needed """
+        if machine_id is None:
+            return self.add_machine()
+        machine_id = str(machine_id)
+        with self._lock:
+            if machine_id.startswith('lxc:'):
+                host = machine_id[len('lxc:'):]
+                n = len([m for m in self.machines
+                         if m.startswith(host + '/lxc/')])
+                container = "{host}/lxc/{n}".format(host=host, n=n)
+                self.machines[container] = self._ready(
+                    max(self.clock.now(), self.machines.get(host, 0)) +
+                    self.latency('container', service))
+                return container
+        if machine_id not in self.machines:
+            raise JujuError("machine {m} not found".format(m=machine_id))
+        return machine_id
+
+    def add_units(self, service, count=1, machine_id=None):
+        """ Place `count` units of a service, creating it when needed """
+        for _ in range(count):
+            mid = self._place(service, machine_id)
+            with self._lock:
+                units = self.units.setdefault(service, {})
+                self.relations.setdefault(service, {})
+                name = "{s}/{n}".format(s=service, n=len(units))
+                units[name] = (mid, self._ready(
+                    max(self.clock.now(), self.machines[mid]) +
+                    self.latency('install', service)))
+
+    def relate(self, endpoint_a, endpoint_b):
+        """ Relate two services, endpoints are 'service[:relation]' """
+        ends = [e.split(':', 1) for e in (endpoint_a, endpoint_b)]
+        with self._lock:
+            for end in ends:
+                if end[0] not in self.units:
+                    raise JujuError("service {s} not found".format(
+                        s=end[0]))
+            for this, other in ((ends[0], ends[1]), (ends[1], ends[0])):
+                relation = this[1] if len(this) > 1 else other[0]
+                related = self.relations[this[0]].setdefault(relation, [])
+                if other[0] not in related:
+                    related.append(other[0])
+            self._ready(self.clock.now())
+
+    def status(self):
+        """ juju status as of now
+
+        :rtype: dict
+        """
+        now = self.clock.now()
+
+        def state(ready):
+            return 'started' if now >= ready else 'pending'
+
+        with self._lock:
+            machines = {}
+            for mid, ready in self.machines.items():
+                if '/' not in mid:
+                    machines[mid] = {'agent-state': state(ready),
+                                     'containers': {}}
+            for mid, ready in self.machines.items():
+                if '/' in mid:
+                    machines[mid.split('/')[0]]['containers'][mid] = {
+                        'agent-state': state(ready)}
+            services = {}
+            for service, units in self.units.items():
+                services[service] = dict(
+                    charm="cs:trusty/{s}".format(s=service),
+                    relations={r: list(s) for r, s in
+                               self.relations[service].items()},
+                    units={name: {'agent-state': state(ready),
+                                  'machine': mid}
+                           for name, (mid, ready) in units.items()})
+        return dict(environment='simulated', machines=machines,
+                    services=services)
+
+    def state(self):
+        """ :rtype: JujuState """
+        return JujuState(self.status())
+
+
+class FakeJujuClient:
+    """ Stands in for JujuClient, recording calls and updating a
+    SimulatedJuju
+    """
+
+    def __init__(self, juju, clock, latency):
+        """ Constructor
+
+        :param juju: :class:SimulatedJuju
+        :param clock: :class:EventClock or :class:SimClock
+        :param latency: :class:LatencyModel
+        """
+        self.juju = juju
+        self.clock = clock
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, op, charm=None):
+        with self._lock:
+            self.calls[op] += 1
+        self.clock.sleep(self.latency('call') + self.latency(op, charm))
+
+    def deploy(self, charm, settings):
+        self._call('deploy', charm)
+        self.juju.add_units(charm, int(settings.get('instances') or 1),
+                            settings.get('machine_id'))
+
+    def add_relation(self, endpoint_a, endpoint_b):
+        self._call('add_relation')
+        self.juju.relate(endpoint_a, endpoint_b)
+
+    def add_unit(self, service_name, machine_id=None, count=1):
+        self._call('add_unit', service_name)
+        self.juju.add_units(service_name, count, machine_id)
+
+    def add_machine(self, constraints=None):
+        self._call('add_machine')
+        return self.juju.add_machine()
+
+    def set_config(self, service_name, config_keys):
+        self._call('set_config', service_name)
+
+    def __getattr__(self, name):
+        """ Any other api call just takes time """
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self._call(name)
+        return call
+
+
+class SimCommandRunner:
+    """ CommandRunner going to a FakeJujuClient """
+
+    def __init__(self, client):
+        self.client = client
+
+    def add_machine(self, constraints=None):
+        return self.client.add_machine(constraints)
+
+    def add_unit(self, service_name, machine_id=None, count=1):
+        return self.client.add_unit(service_name, machine_id, count)
+
+
+class SimulationReport:
+    """ Outcome of a simulated deployment """
+
+    def __init__(self, converged, total_time, converged_at, polls, calls):
+        """ Constructor
+
+        :param bool converged: did everything start before the timeout
+        :param float total_time: simulated seconds until a poll saw the
+                                 deployment done
+        :param float converged_at: simulated seconds until the last
+                                   unit started or relation was added
+        :param int polls: poll cycles run
+        :param calls: Counter of juju calls by operation
+        """
+        self.converged = converged
+        self.total_time = total_time
+        self.converged_at = converged_at
+        self.polls = polls
+        self.calls = calls
+
+    @property
+    def num_calls(self):
+        """ :rtype: int """
+        return sum(self.calls.values())
+
+    def __str__(self):
+        lines = ["{state} after {t:.0f}s (last change at {c:.0f}s), "
+                 "{p} polls, {n} juju calls".format(
+                     state="Converged" if self.converged else "Timed out",
+                     t=self.total_time, c=self.converged_at,
+                     p=self.polls, n=self.num_calls)]
+        for op, n in sorted(self.calls.items()):
+            lines.append("  {op}: {n}".format(op=op, n=n))
+        return "\n".join(lines)
+
+
+class DeploySimulator:
+    """ Drives a ControllerOverlay against a simulated juju until every
+    charm is deployed, started and related
+    """
+
+    def __init__(self, charm_classes=None, latencies=None,
+                 poll_interval=POLL_INTERVAL, workers=DEPLOY_WORKERS,
+                 scale=None, timeout=SIMULATION_TIMEOUT, single=False):
+        """ Constructor
+
+        :param list charm_classes: (optional) charms to deploy, the
+                                   registry's required charms when
+                                   omitted
+        :param dict latencies: (optional) overrides of LATENCIES
+        :param float poll_interval: (optional) simulated seconds between
+                                    polls
+        :param int workers: (optional) charms deployed at once
+        :param float scale: (optional) simulated seconds per wall clock
+                            second, the event clock is used without
+        :param float timeout: (optional) simulated seconds to give up
+                              after
+        :param bool single: (optional) simulate a single system install
+        """
+        if charm_classes is None:
+            charm_classes = registry().required()
+        self.charm_classes = charm_classes
+        self.latency = LatencyModel(latencies)
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.scale = scale
+        self.timeout = timeout
+        self.single = single
+
+    def run(self):
+        """ Simulate a deployment
+
+        :rtype: SimulationReport
+        """
+        def threads():
+            # this loop, plus the scheduler's busy workers
+            if overlay.scheduler is None:
+                return 1
+            return 1 + overlay.scheduler.active
+
+        if self.scale:
+            clock = SimClock(self.scale)
+        else:
+            clock = EventClock(threads)
+        juju = SimulatedJuju(clock, self.latency)
+        client = FakeJujuClient(juju, clock, self.latency)
+        overlay = gui.ControllerOverlay(Text(""), SimCommandRunner(client),
+                                        charm_classes=self.charm_classes,
+                                        deploy_workers=self.workers,
+                                        single=self.single,
+                                        sleep=clock.sleep)
+        # nothing to configure on the host
+        overlay.single_net_configured = True
+        overlay.lxc_root_tarball_configured = True
+        plan = RelationPlan(self.charm_classes)
+        maas_state = MaasState([])
+
+        polls = 0
+        converged = False
+        try:
+            while clock.now() < self.timeout:
+                polls += 1
+                juju_state = juju.state()
+                showing = overlay.process(juju_state, maas_state)
+                if not showing and not plan.diff(juju_state) and \
+                   all(u.agent_state == 'started'
+                       for s in juju_state.services for u in s.units):
+                    converged = True
+                    break
+                clock.sleep(self.poll_interval)
+        finally:
+            clock.close()
+        return SimulationReport(converged, clock.now(), juju.converged_at,
+                                polls, client.calls)
+
+
+def parse_latency(value):
+    """ 'op=seconds' from the command line
+
+    :rtype: tuple
+    """
+    try:
+        op, secs = value.split('=', 1)
+        return (op, float(secs))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected op=seconds, got {v}".format(v=value))
+
+
+def main(argv=None):
+    """ Command line entry point, see cloud-simulate --help
+
+    :returns: exit status, 0 if the deployment converged
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        description="Simulate deploying the OpenStack charms and report "
+        "how long it takes.")
+    parser.add_argument('--latency', type=parse_latency, action='append',
+                        default=[], metavar='OP=SECONDS',
+                        help="simulated seconds for an operation, e.g. "
+                        "provision=300 or install:mysql=90, may be "
+                        "repeated")
+    parser.add_argument('--poll-interval', type=float,
+                        default=POLL_INTERVAL,
+                        help="simulated seconds between polls "
+                        "(default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=DEPLOY_WORKERS,
+                        help="charms deployed at once "
+                        "(default: %(default)s)")
+    parser.add_argument('--scale', type=float, nargs='?', const=SCALE,
+                        help="follow the wall clock, running SCALE "
+                        "simulated seconds per second (default: "
+                        "{scale}), instead of the repeatable event "
+                        "clock".format(scale=SCALE))
+    parser.add_argument('--optional', action='store_true',
+                        help="include optional charms")
+    parser.add_argument('--single', action='store_true',
+                        help="simulate a single system install")
+    args = parser.parse_args(argv)
+
+    if args.optional:
+        charm_classes = registry().by_priority()
+    else:
+        charm_classes = registry().required()
+    simulator = DeploySimulator(charm_classes,
+                                latencies=dict(args.latency),
+                                poll_interval=args.poll_interval,
+                                workers=args.workers,
+                                scale=args.scale,
+                                single=args.single)
+    report = simulator.run()
+    print(report)
+    return 0 if report.converged else 1
@@ -179,4 +179,6 @@ INSTALL_USER=${SUDO_USER:-root}
 # HELPER TOOLS
 configure_landscape=/usr/share/cloud-installer/bin/configure-landscape
 ip_range=/usr/share/cloud-installer/bin/ip_range.py
+maas_boot_images=/usr/share/cloud-installer/bin/maas-boot-images
 maas_report_boot_images=/usr/share/cloud-installer/bin/maas-report-boot-images
+maas_wait=/usr/share/cloud-installer/bin/maas-wait
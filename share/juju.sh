@@ -116,7 +116,10 @@ jujuBootstrap()
 
 	(cd "/home/$INSTALL_USER"; sudo -H -u "$INSTALL_USER" juju --show-log sync-tools)
 	(cd "/home/$INSTALL_USER"; sudo -H -u "$INSTALL_USER" juju bootstrap --upload-tools) &
-	waitForNodeStatus $system_id 6
+	if ! waitForNodeStatus $system_id 6; then
+		kill $! || true
+		return 1
+	fi
 	rm -rf /var/lib/lxc/juju-bootstrap/rootfs/var/lib/cloud/seed/*
 	cp $TMP/maas.creds \
 	    /var/lib/lxc/juju-bootstrap/rootfs/etc/cloud/cloud.cfg.d/91_maas.cfg
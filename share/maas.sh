@@ -210,19 +210,10 @@ nodeSystemId()
 
 waitForClusterRegistration()
 {
-	while true; do
-		uuid=$(maas maas node-groups list \
-		    | python3 -c 'import json; import sys; print(json.load(sys.stdin)[0]["uuid"])')
-		if [ $uuid != master ]; then
-			break
-		fi
-		sleep 5
-	done
+	uuid=$($maas_wait --api-key $maas_creds cluster) || return 1
 }
 
 waitForNodeStatus()
 {
-	while [ $(nodeStatus $1) -ne $2 ]; do
-		sleep 5
-	done
+	$maas_wait --api-key $maas_creds node $1 --status $2 || return 1
 }
@@ -44,7 +44,7 @@ multiInstall()
 		saveMaasCreds $maas_creds
 		maasLogin $maas_creds
 		dialogGaugePrompt 32 "Waiting for MAAS cluster registration"
-		waitForClusterRegistration
+		waitForClusterRegistration || exit 1
 
 		createMaasBridge $interface
 		dialogGaugePrompt 34 "Configuring MAAS networking"
@@ -70,7 +70,7 @@ multiInstall()
 		fi
 
 		if [ -z "$CLOUD_INSTALL_DEBUG" ]; then
-			http_proxy=$MAAS_HTTP_PROXY HTTP_PROXY=$MAAS_HTTP_PROXY maas-import-pxe-files > /dev/null
+			$maas_boot_images --api-key $maas_creds --gauge 40 20
 			$maas_report_boot_images > /dev/null
 		fi
 
@@ -79,7 +79,7 @@ multiInstall()
 		admin_secret=$(pwgen -s 32)
 		configureJuju configMaasEnvironment $address $maas_creds $admin_secret
 		dialogGaugePrompt 75 "Bootstrapping Juju"
-		jujuBootstrap $uuid
+		jujuBootstrap $uuid || exit 1
 		maas maas tags new name=use-fastpath-installer definition="true()"
 		chown $INSTALL_USER:$INSTALL_USER /home/$INSTALL_USER/.maascli.db
 
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#
+# bench_jujustate.py - Parse time of JujuState for the juju status fixtures
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Usage:
+# python3 test/bench_jujustate.py [iterations]
+# python3 test/bench_jujustate.py --synthetic [units]
+
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+sys.path.insert(0, '.')
+
+import yaml
+
+from cloudinstall.juju import JujuState, StatusLoader
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'juju-output')
+
+
+def bench(label, func, number):
+    secs = timeit.timeit(func, number=number) / number
+    print("  {label:<24} {ms:8.3f} ms".format(label=label, ms=secs * 1000))
+
+
+def main(number):
+    print("Loader: {l}".format(l=StatusLoader.__name__))
+    for name in sorted(os.listdir(FIXTURES)):
+        with open(os.path.join(FIXTURES, name)) as f:
+            raw_yaml = f.read()
+        raw_json = json.dumps(yaml.safe_load(raw_yaml))
+        print("{name} ({size} bytes)".format(name=name, size=len(raw_yaml)))
+        bench("yaml.Loader", lambda: yaml.load(raw_yaml, Loader=yaml.Loader),
+              number)
+        bench("JujuState(yaml)", lambda: JujuState(raw_yaml), number)
+        bench("JujuState(json)", lambda: JujuState(raw_json), number)
+
+
+def synthetic_status(num_units, containers_per_machine=5):
+    """ juju status with num_units units, one per lxc container """
+    services = ['service-{n}'.format(n=n) for n in range(10)]
+    status = {'environment': 'maas', 'machines': {}, 'services': {}}
+    for name in services:
+        status['services'][name] = {
+            'charm': 'cs:trusty/{name}-1'.format(name=name),
+            'relations': {'shared-db': [s for s in services if s != name]},
+            'units': {}}
+    for n in range(num_units):
+        machine_id = str(n // containers_per_machine + 1)
+        container_id = '{m}/lxc/{c}'.format(m=machine_id,
+                                            c=n % containers_per_machine)
+        machine = status['machines'].setdefault(machine_id, {
+            'agent-state': 'started',
+            'dns-name': 'node-{m}.maas'.format(m=machine_id),
+            'instance-id': '/MAAS/api/1.0/nodes/node-{m}/'.format(
+                m=machine_id),
+            'hardware': 'arch=amd64 cpu-cores=4 mem=8192M root-disk=20480M',
+            'containers': {}})
+        machine['containers'][container_id] = {
+            'agent-state': 'started',
+            'dns-name': '10.0.{a}.{b}'.format(a=n // 250, b=n % 250),
+            'instance-id': 'juju-machine-{c}'.format(c=container_id),
+            'hardware': 'arch=amd64'}
+        service = services[n % len(services)]
+        status['services'][service]['units'][
+            '{s}/{n}'.format(s=service, n=n)] = {
+                'agent-state': 'started',
+                'machine': container_id,
+                'public-address': '10.0.{a}.{b}'.format(a=n // 250,
+                                                        b=n % 250)}
+    return status
+
+
+def walk(state):
+    """ Read every attribute the gui reads on each poll """
+    for m in state.machines():
+        (m.agent_state, m.dns_name, m.mem, m.storage, m.cpu_cores, m.arch,
+         m.instance_id)
+        for c in m.containers:
+            (c.agent_state, c.dns_name, c.mem, c.storage)
+    for s in state.services:
+        (s.charm, list(s.relations))
+        for u in s.units:
+            (u.agent_state, u.public_address, u.machine_id,
+             u.agent_state_info, u.is_horizon, u.is_jujugui)
+
+
+def main_synthetic(num_units):
+    status = synthetic_status(num_units)
+    print("Synthetic status: {u} units".format(u=num_units))
+
+    tracemalloc.start()
+    state = JujuState(status)
+    walk(state)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("  model memory (held)      {kb:8.1f} KiB".format(kb=current / 1024))
+    print("  model memory (peak)      {kb:8.1f} KiB".format(kb=peak / 1024))
+
+    bench("JujuState + walk", lambda: walk(JujuState(status)), 10)
+    bench("walk again", lambda: walk(state), 10)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--synthetic':
+        main_synthetic(int(sys.argv[2]) if len(sys.argv) > 2 else 5000)
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
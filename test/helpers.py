@@ -1,5 +1,6 @@
 import contextlib
 from cloudinstall import pegasus
+from cloudinstall.charms import CharmBase
 
 def load_status(fname, cons):
     def wrap(f):
@@ -24,3 +25,13 @@ def set_single_system(setting):
     pegasus.SINGLE_SYSTEM = setting
     yield
     pegasus.SINGLE_SYSTEM = old
+
+
+def charm(name, related=(), priority=CharmBase.deploy_priority,
+          estimate=CharmBase.deploy_estimate, isolate=False):
+    """ CharmBase subclass for charm `name`, related to `related` """
+    return type(name, (CharmBase,), dict(charm_name=name,
+                                         related=list(related),
+                                         deploy_priority=priority,
+                                         deploy_estimate=estimate,
+                                         isolate=isolate))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# test_charmbundle.py - Unittests for charm bundles
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import unittest
+import mock
+import yaml
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+from cloudinstall.charms import bundle
+from cloudinstall.charms.registry import CharmRegistry
+
+
+class BundleTest(unittest.TestCase):
+    def setUp(self):
+        self.charm_classes = CharmRegistry(
+            entry_point_group=None).required()
+
+    def services(self, document):
+        return document[bundle.BUNDLE_NAME]['services']
+
+    def test_services(self):
+        services = self.services(bundle.bundle(self.charm_classes,
+                                               machine_id='lxc:1'))
+        self.assertEqual(set(services),
+                         set(c.name() for c in self.charm_classes))
+        self.assertEqual(services['mysql'],
+                         dict(charm='cs:trusty/mysql', num_units=1,
+                              to='lxc:1'))
+        compute = services['nova-compute']
+        self.assertNotIn('to', compute)
+        self.assertEqual(compute['constraints'], 'mem=4G root-disk=10G')
+        self.assertEqual(services['swift-storage']['num_units'], 3)
+
+    def test_relations_once_with_endpoints(self):
+        document = bundle.bundle(self.charm_classes)
+        relations = document[bundle.BUNDLE_NAME]['relations']
+        pairs = [frozenset(r) for r in relations]
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertIn(['keystone', 'mysql'], relations)
+        self.assertIn(['nova-compute:amqp', 'rabbitmq-server:amqp'],
+                      relations)
+        self.assertNotIn(['nova-compute', 'rabbitmq-server'], relations)
+
+    def test_charm_config_options(self):
+        config = {'keystone': {'admin-password': 'secret'}}
+        with mock.patch.dict('cloudinstall.charms.CHARM_CONFIG', config):
+            services = self.services(bundle.bundle(self.charm_classes))
+        self.assertEqual(services['keystone']['options'],
+                         {'admin-password': 'secret'})
+        self.assertNotIn('options', services['mysql'])
+
+    def test_render_round_trip(self):
+        document = bundle.bundle(self.charm_classes)
+        self.assertEqual(yaml.safe_load(bundle.render(document)), document)
+
+    @mock.patch('cloudinstall.charms.bundle.get_command_output')
+    def test_apply_single_deployer_run(self, mock_gco):
+        written = []
+
+        def deployer(cmd, timeout):
+            path = cmd.split()[2]
+            with open(path) as f:
+                written.append(yaml.safe_load(f))
+            return (0, 'done', '', 0)
+        mock_gco.side_effect = deployer
+
+        document = bundle.bundle(self.charm_classes)
+        ok, out = bundle.apply(document)
+        self.assertTrue(ok)
+        self.assertEqual(mock_gco.call_count, 1)
+        cmd = mock_gco.call_args[0][0]
+        self.assertTrue(cmd.startswith('juju-deployer -c '))
+        self.assertTrue(cmd.endswith(' openstack'))
+        self.assertEqual(written, [document])
+        self.assertFalse(os.path.exists(cmd.split()[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+# test_charmregistry.py - Unittests for the charm registry
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import mock
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+from cloudinstall.charms import CharmBase
+from cloudinstall.charms.registry import CharmRegistry
+
+
+class PluginCharm(CharmBase):
+    charm_name = 'plugin'
+    deploy_priority = 0
+    allow_multi_units = True
+
+
+class CharmRegistryTest(unittest.TestCase):
+    def test_discovers_charm_modules(self):
+        registry = CharmRegistry(entry_point_group=None)
+        names = [c.name() for c in registry.charm_classes]
+        self.assertIn('mysql', names)
+        self.assertIn('nova-compute', names)
+        self.assertEqual(names, sorted(names))
+
+    def test_sorted_views(self):
+        registry = CharmRegistry(entry_point_group=None)
+        priorities = [c.deploy_priority for c in registry.by_priority()]
+        self.assertEqual(priorities, sorted(priorities))
+        self.assertTrue(all(not c.optional for c in registry.required()))
+        self.assertTrue(all(c.optional for c in registry.optional()))
+        self.assertEqual(len(registry.required()) + len(registry.optional()),
+                         len(registry.charm_classes))
+        self.assertTrue(all(c.allow_multi_units
+                            for c in registry.multi_units()))
+        self.assertEqual(registry.charm_class('mysql').name(), 'mysql')
+        self.assertIsNone(registry.charm_class('no-such-charm'))
+
+    def test_discovered_once(self):
+        registry = CharmRegistry(entry_point_group=None)
+        with mock.patch.object(registry, '_scan',
+                               wraps=registry._scan) as scan:
+            registry.required()
+            registry.multi_units()
+            registry.by_priority()
+            self.assertEqual(scan.call_count, 1)
+
+    def test_entry_point_plugins(self):
+        ep = mock.Mock()
+        ep.load.return_value = PluginCharm
+        broken = mock.Mock()
+        broken.load.side_effect = ImportError
+        with mock.patch('pkg_resources.iter_entry_points',
+                        return_value=[ep, broken]) as iter_entry_points:
+            registry = CharmRegistry()
+            self.assertIn(PluginCharm, registry.required())
+            self.assertIn(PluginCharm, registry.multi_units())
+        iter_entry_points.assert_called_once_with('cloudinstall.charms')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# test_charmrelations.py - Unittests for charm relation plans
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import mock
+import yaml
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+from cloudinstall.charms.registry import CharmRegistry
+from cloudinstall.charms.relations import RelationPlan, juju_relations
+from cloudinstall.juju import JujuState
+from helpers import charm
+
+
+class RelationPlanTest(unittest.TestCase):
+    def setUp(self):
+        with open('test/juju-output/juju-status-single-install.yaml') as f:
+            self.status = yaml.safe_load(f.read())
+        self.charm_classes = CharmRegistry(
+            entry_point_group=None).by_priority()
+
+    def unrelate(self, a, b):
+        for this, other in ((a, b), (b, a)):
+            relations = self.status['services'][this]['relations']
+            for name, charms in relations.items():
+                if other in charms:
+                    charms.remove(other)
+
+    def test_symmetric_pairs_once(self):
+        plan = RelationPlan([charm('a', ['b', 'c']), charm('b', ['a']),
+                             charm('c', ['c'])])
+        self.assertEqual(plan.relations, [('a', 'b'), ('a', 'c')])
+
+    def test_juju_relations(self):
+        related = juju_relations(JujuState(self.status))
+        self.assertIn(frozenset(('keystone', 'mysql')), related)
+        self.assertNotIn(frozenset(('glance',)), related)
+
+    def test_diff_only_missing(self):
+        plan = RelationPlan(self.charm_classes)
+        self.assertEqual(plan.diff(JujuState(self.status)), [])
+
+        self.unrelate('nova-compute', 'rabbitmq-server')
+        self.unrelate('keystone', 'mysql')
+        self.assertEqual(sorted(plan.diff(JujuState(self.status))),
+                         [('keystone', 'mysql'),
+                          ('nova-compute', 'rabbitmq-server')])
+
+    def test_diff_skips_undeployed_services(self):
+        del self.status['services']['mysql']
+        plan = RelationPlan(self.charm_classes)
+        self.assertEqual(plan.diff(JujuState(self.status)), [])
+
+    def test_apply_missing_through_relate(self):
+        self.unrelate('nova-compute', 'rabbitmq-server')
+        self.unrelate('keystone', 'mysql')
+        client = mock.Mock()
+        results = RelationPlan(self.charm_classes).apply(
+            JujuState(self.status), client)
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(ok for ok, _ in results.values()))
+        calls = sorted(c[0] for c in client.add_relation.call_args_list)
+        self.assertEqual(calls,
+                         [('keystone', 'mysql'),
+                          ('nova-compute:amqp', 'rabbitmq-server:amqp')])
+
+    def test_apply_failure_reported(self):
+        self.unrelate('keystone', 'mysql')
+        client = mock.Mock()
+        client.add_relation.side_effect = Exception("boom")
+        results = RelationPlan(self.charm_classes).apply(
+            JujuState(self.status), client)
+        self.assertFalse(results[('keystone', 'mysql')][0])
+
+    def test_nothing_missing_no_calls(self):
+        client = mock.Mock()
+        self.assertEqual(RelationPlan(self.charm_classes).apply(
+            JujuState(self.status), client), {})
+        self.assertFalse(client.add_relation.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+#
+# test_deploy.py - Unittests for concurrent charm deployment
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+import unittest
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+from cloudinstall.deploy import DeployScheduler
+from helpers import charm
+
+
+GUI = charm('gui', priority=0, estimate=5)
+MYSQL = charm('mysql', estimate=10)
+RABBIT = charm('rabbit', estimate=10)
+KEYSTONE = charm('keystone', ['mysql'], estimate=10)
+GLANCE = charm('glance', ['mysql', 'keystone', 'rabbit'], estimate=10)
+CHARMS = [GLANCE, KEYSTONE, RABBIT, MYSQL, GUI]
+
+
+class DeploySchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def record(self, *event):
+        with self.lock:
+            self.events.append(event)
+
+    def scheduler(self, charms=CHARMS, **kwargs):
+        def deploy(c):
+            self.record('deploy', c.name())
+            time.sleep(0.05)
+            self.record('deployed', c.name())
+
+        def relate(a, b):
+            self.record('relate', a.name(), b.name())
+
+        def finish(c):
+            self.record('finish', c.name())
+
+        return DeployScheduler(charms, deploy, relate, finish, **kwargs)
+
+    def index(self, *event):
+        return self.events.index(event)
+
+    def test_dependency_order(self):
+        s = self.scheduler()
+        self.assertEqual(s.order,
+                         ['gui', 'mysql', 'rabbit', 'keystone', 'glance'])
+        self.assertEqual(s.deps['keystone'], {'gui', 'mysql'})
+
+    def test_critical_path(self):
+        self.assertEqual(self.scheduler().critical_path(),
+                         (35, ['gui', 'mysql', 'keystone', 'glance']))
+
+    def test_independent_charms_concurrent(self):
+        s = self.scheduler()
+        s.run()
+        self.assertTrue(s.done)
+        # mysql and rabbit both start before either is deployed
+        self.assertLess(self.index('deploy', 'rabbit'),
+                        self.index('deployed', 'mysql'))
+        self.assertLess(self.index('deployed', 'gui'),
+                        self.index('deploy', 'mysql'))
+
+    def test_relations_added_once_both_deployed(self):
+        s = self.scheduler()
+        s.run()
+        relations = [e[1:] for e in self.events if e[0] == 'relate']
+        self.assertEqual(sorted(relations),
+                         [('glance', 'keystone'), ('glance', 'mysql'),
+                          ('glance', 'rabbit'), ('keystone', 'mysql')])
+        self.assertLess(self.index('deployed', 'keystone'),
+                        self.index('relate', 'keystone', 'mysql'))
+        self.assertLess(self.index('relate', 'keystone', 'mysql'),
+                        self.index('finish', 'keystone'))
+
+    def test_existing_services_and_relations_skipped(self):
+        s = self.scheduler(deployed=['gui', 'mysql', 'keystone'],
+                           related=[('mysql', 'keystone')])
+        s.run()
+        deployed = set(e[1] for e in self.events if e[0] == 'deploy')
+        self.assertEqual(deployed, {'rabbit', 'glance'})
+        self.assertNotIn(('relate', 'keystone', 'mysql'), self.events)
+        self.assertIn(('finish', 'keystone'), self.events)
+
+    def test_symmetric_relation_once(self):
+        a = charm('a', ['b'])
+        b = charm('b', ['a'])
+        s = self.scheduler([a, b])
+        self.assertEqual(s.relations, [('a', 'b')])
+        self.assertEqual(s.deps, {'a': set(), 'b': {'a'}})
+
+    def test_failed_deploy_blocks_dependents(self):
+        deployed = []
+
+        def deploy(c):
+            if c.name() == 'mysql':
+                raise Exception("boom")
+            deployed.append(c.name())
+        finished = []
+        s = DeployScheduler([MYSQL, KEYSTONE, RABBIT], deploy,
+                            lambda a, b: None, finished.append,
+                            retries=1, retry_delay=0)
+        s.run()
+        self.assertFalse(s.done)
+        self.assertEqual(list(s.failed), [('deploy', 'mysql')])
+        self.assertEqual(deployed, ['rabbit'])
+        self.assertEqual(finished, [RABBIT])
+
+    def test_failed_step_retried(self):
+        failures = ['keystone']
+
+        def deploy(c):
+            if c.name() in failures:
+                failures.remove(c.name())
+                raise Exception("boom")
+        s = DeployScheduler([MYSQL, KEYSTONE], deploy, lambda a, b: None,
+                            retries=1, retry_delay=0)
+        s.run()
+        self.assertTrue(s.done)
+        self.assertEqual(s.failed, {})
+
+    def test_retry_waits_on_injected_sleep(self):
+        failures = ['mysql']
+        slept = []
+
+        def deploy(c):
+            if c.name() in failures:
+                failures.remove(c.name())
+                raise Exception("boom")
+        s = DeployScheduler([MYSQL], deploy, lambda a, b: None,
+                            retries=1, retry_delay=10, sleep=slept.append)
+        start = time.time()
+        s.run()
+        self.assertTrue(s.done)
+        self.assertEqual(slept, [10])
+        self.assertLess(time.time() - start, 5)
+
+    def test_failed_relation_not_finished(self):
+        def relate(a, b):
+            raise Exception("boom")
+        s = DeployScheduler([MYSQL, KEYSTONE], lambda c: None, relate,
+                            retries=0)
+        s.run()
+        self.assertEqual(list(s.failed), [('relate', ('keystone', 'mysql'))])
+        self.assertEqual(s.finished, set())
+
+    def test_wait_for_services(self):
+        s = self.scheduler([MYSQL, KEYSTONE], wait_for_services=True)
+        s.start()
+        s.wait()
+        self.assertEqual(s.deployed, set())
+        self.assertNotIn(('deploy', 'keystone'), self.events)
+
+        s.observe(['mysql', 'unrelated'])
+        s.wait()
+        self.assertEqual(s.deployed, {'mysql'})
+        self.assertIn(('deploy', 'keystone'), self.events)
+        self.assertNotIn(('relate', 'keystone', 'mysql'), self.events)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,12 +21,15 @@
 # juju bootstrap
 # nose test
 
+import json
 import unittest
 import os
 import sys
 sys.path.insert(0, '../cloudinstall')
 
-from cloudinstall.juju.client import JujuClient
+import mock
+
+from cloudinstall.juju.client import JujuClient, JujuError, api_constraints
 from cloudinstall.utils import randomString
 
 JUJU_PASS = os.environ.get('JUJU_PASS', randomString())
@@ -61,5 +64,104 @@ class JujuApiTest(unittest.TestCase):
         ret = self.c.info()
         self.assertTrue(ret)
 
+
+class FakeConnection:
+    """ Answers every request as soon as it is sent """
+
+    def __init__(self, client, error=None):
+        self.client = client
+        self.error = error
+        self.sent = []
+
+    def send(self, data):
+        request = json.loads(data)
+        self.sent.append(request)
+        msg = dict(RequestId=request['RequestId'],
+                   Response=dict(Request=request['Request']))
+        if self.error:
+            msg['Error'] = self.error
+        self.client._dispatch(msg)
+
+    def close(self):
+        pass
+
+
+class JujuClientMultiplexTest(unittest.TestCase):
+    def setUp(self):
+        self.c = JujuClient(url=JUJU_URL, password=JUJU_PASS)
+        self.c.conn = FakeConnection(self.c)
+        self.c.is_connected = True
+
+    def test_request_ids_increase(self):
+        self.c.info()
+        self.c.get_env_config()
+        ids = [r['RequestId'] for r in self.c.conn.sent]
+        self.assertEqual(ids, [1, 2])
+
+    def test_response_routed_to_caller(self):
+        res = self.c.info()
+        self.assertEqual(res['Request'], 'EnvironmentInfo')
+        self.assertEqual(self.c._pending, {})
+
+    def test_error_raises(self):
+        self.c.conn.error = 'permission denied'
+        self.assertRaises(JujuError, self.c.info)
+
+    def test_disconnect_fails_pending(self):
+        self.c.conn.send = lambda data: self.c._disconnected(1006, 'gone')
+        self.assertRaises(JujuError, self.c.info)
+        self.assertFalse(self.c.is_connected)
+
+    def test_set_config_single_call(self):
+        self.c.set_config('keystone', {'a': 1, 'b': 'two'})
+        self.assertEqual(len(self.c.conn.sent), 1)
+        self.assertEqual(self.c.conn.sent[0]['Params']['Options'],
+                         {'a': '1', 'b': 'two'})
+
+    @mock.patch('cloudinstall.juju.client.get_command_output')
+    def test_cli_fallback(self, mock_output):
+        mock_output.return_value = (0, '', '', 0)
+        self.c.is_connected = False
+        self.c._last_failure = float('inf')
+        self.c.add_relation('keystone', 'mysql')
+        mock_output.assert_called_once_with(
+            'juju add-relation keystone mysql')
+
+    @mock.patch('cloudinstall.juju.client.get_command_output')
+    def test_cli_fallback_when_not_sent(self, mock_output):
+        mock_output.return_value = (0, '', '', 0)
+
+        def broken(data):
+            raise IOError("broken pipe")
+        self.c.conn.send = broken
+        self.c.add_relation('keystone', 'mysql')
+        mock_output.assert_called_once_with(
+            'juju add-relation keystone mysql')
+
+    @mock.patch('cloudinstall.juju.client.get_command_output')
+    def test_no_cli_fallback_once_sent(self, mock_output):
+        self.c.conn.error = 'relation already exists'
+        self.assertRaises(JujuError, self.c.add_relation,
+                          'keystone', 'mysql')
+        self.assertRaises(JujuError, self.c.deploy, 'mysql', {})
+        self.assertFalse(mock_output.called)
+
+    @mock.patch('cloudinstall.juju.client.get_command_output')
+    def test_cli_set_config_single_command(self, mock_output):
+        mock_output.return_value = (0, '', '', 0)
+        self.c.is_connected = False
+        self.c._last_failure = float('inf')
+        self.c.set_config('keystone', {'b': 'two words', 'a': 1})
+        mock_output.assert_called_once_with(
+            "juju set keystone a=1 b='two words'")
+
+
+class JujuConstraintsTest(unittest.TestCase):
+    def test_sizes_in_megabytes(self):
+        c = api_constraints({'mem': '4G', 'root-disk': '512M',
+                             'cpu-cores': '3', 'arch': 'amd64'})
+        self.assertEqual(c, {'mem': 4096, 'root-disk': 512,
+                             'cpu-cores': 3, 'arch': 'amd64'})
+
 if __name__ == '__main__':
     unittest.main()
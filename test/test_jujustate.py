@@ -21,6 +21,8 @@ import unittest
 import sys
 import os
 import ipaddress
+import json
+import yaml
 sys.path.insert(0, '../cloudinstall')
 from cloudinstall.utils import _run
 from cloudinstall.juju import JujuState
@@ -140,3 +142,155 @@ class JujuStateSinglePredeployTest(unittest.TestCase):
         m_one = self.juju.machines_allocated()[0]
         cl = list(m_one.containers)
         self.assertEqual(0, len(cl))
+
+
+class JujuStateJsonTest(unittest.TestCase):
+    "Read 'juju status --format=json'"
+
+    def setUp(self):
+        with open('test/juju-output/juju-status-single-install.yaml') as f:
+            raw_yaml = f.read()
+        self.yaml_state = JujuState(raw_yaml)
+        self.json_state = JujuState(json.dumps(yaml.safe_load(raw_yaml)))
+
+    def test_same_as_yaml(self):
+        self.assertEqual(self.json_state._yaml, self.yaml_state._yaml)
+
+    def test_services(self):
+        self.assertEqual(len(list(self.json_state.services)), 8)
+
+
+class JujuStateDeltaTest(unittest.TestCase):
+    "Build a state from AllWatcher deltas"
+
+    def setUp(self):
+        self.juju = JujuState({'machines': {}, 'services': {}})
+        self.juju.apply_deltas([
+            ['machine', 'change',
+             {'Id': '1', 'Status': 'started', 'InstanceId': 'node-1',
+              'Addresses': [{'Value': '10.0.0.2', 'NetworkScope': 'local'},
+                            {'Value': 'node-1.maas',
+                             'NetworkScope': 'public'}],
+              'HardwareCharacteristics': {'Arch': 'amd64', 'CpuCores': 4,
+                                          'Mem': 8192, 'RootDisk': 20480}}],
+            ['machine', 'change',
+             {'Id': '1/lxc/0', 'Status': 'pending', 'InstanceId': ''}],
+            ['service', 'change',
+             {'Name': 'mysql', 'CharmURL': 'cs:trusty/mysql-1'}],
+            ['service', 'change',
+             {'Name': 'keystone', 'CharmURL': 'cs:trusty/keystone-2'}],
+            ['unit', 'change',
+             {'Name': 'mysql/0', 'Service': 'mysql', 'Status': 'started',
+              'MachineId': '1/lxc/0', 'PublicAddress': '10.0.3.4'}],
+            ['relation', 'change',
+             {'Key': 'keystone:shared-db mysql:shared-db',
+              'Endpoints': [
+                  {'ServiceName': 'keystone',
+                   'Relation': {'Name': 'shared-db'}},
+                  {'ServiceName': 'mysql',
+                   'Relation': {'Name': 'shared-db'}}]}],
+        ])
+
+    def test_machine_from_delta(self):
+        m = self.juju.machine('1')
+        self.assertEqual(m.agent_state, 'started')
+        self.assertEqual(m.dns_name, 'node-1.maas')
+        self.assertEqual(m.cpu_cores, '4')
+        self.assertEqual(m.storage, '20.0G')
+
+    def test_container_nested_under_host(self):
+        c = self.juju.machine('1').container('1/lxc/0')
+        self.assertEqual(c.agent_state, 'pending')
+
+    def test_unit_from_delta(self):
+        u = self.juju.service('mysql').unit('mysql/0')
+        self.assertEqual(u.machine_id, '1/lxc/0')
+        self.assertEqual(u.public_address, '10.0.3.4')
+
+    def test_relations_from_delta(self):
+        rel = self.juju.service('keystone').relation('shared-db')
+        self.assertEqual(rel.charms, ['mysql'])
+
+    def test_remove_deltas(self):
+        self.juju.apply_deltas([
+            ['unit', 'remove', {'Name': 'mysql/0', 'Service': 'mysql'}],
+            ['relation', 'remove',
+             {'Key': 'keystone:shared-db mysql:shared-db'}],
+            ['machine', 'remove', {'Id': '1/lxc/0'}],
+        ])
+        self.assertEqual(list(self.juju.service('mysql').units), [])
+        self.assertEqual(list(self.juju.service('keystone').relations), [])
+        self.assertEqual(list(self.juju.machine('1').containers), [])
+
+
+class JujuStateIndexTest(unittest.TestCase):
+    "Indexed lookups"
+
+    def setUp(self):
+        with open('test/juju-output/juju-status-single-install.yaml') as f:
+            self.juju = JujuState(f.read())
+
+    def test_lookups_reuse_wrappers(self):
+        self.assertIs(self.juju.machine("1"), self.juju.machine("1"))
+        self.assertIs(self.juju.service("mysql"),
+                      self.juju.service("mysql"))
+
+    def test_bogus_machine(self):
+        self.assertEqual(self.juju.machine("42").machine_id, -1)
+
+    def test_unit(self):
+        u = self.juju.unit("mysql/0")
+        self.assertEqual(u.unit_name, "mysql/0")
+        self.assertEqual(None, self.juju.unit("mysql/42"))
+
+    def test_units_on_machine(self):
+        u = self.juju.unit("mysql/0")
+        self.assertIn(u, self.juju.units_on_machine(u.machine_id))
+        self.assertEqual([], self.juju.units_on_machine("42"))
+
+    def test_deltas_refresh_indexes(self):
+        self.juju.apply_deltas([['service', 'remove', {'Name': 'mysql'}]])
+        self.assertEqual(None, self.juju.service("mysql"))
+        self.assertEqual(None, self.juju.unit("mysql/0"))
+
+
+class JujuStateDiffTest(unittest.TestCase):
+    "Differences between two states"
+
+    def setUp(self):
+        with open('test/juju-output/juju-status-single-pre-deploy.yaml') as f:
+            self.before = JujuState(f.read())
+        with open('test/juju-output/juju-status-single-install.yaml') as f:
+            self.after = JujuState(f.read())
+
+    def test_no_changes(self):
+        self.assertFalse(self.after.diff(self.after))
+
+    def test_added(self):
+        diff = self.after.diff(self.before)
+        self.assertIn('mysql', diff.added['services'])
+        self.assertIn('mysql/0', diff.added['units'])
+        self.assertIn('1/lxc/0', diff.added['machines'])
+        self.assertIn(('keystone', 'shared-db', 'mysql'),
+                      diff.added['relations'])
+
+    def test_removed(self):
+        diff = self.before.diff(self.after)
+        self.assertIn('mysql', diff.removed['services'])
+        self.assertEqual(diff.added['services'], [])
+
+    def test_changed_fields(self):
+        self.after.apply_deltas([
+            ['unit', 'change', {'Name': 'mysql/0', 'Service': 'mysql',
+                                'Status': 'started',
+                                'MachineId': '1/lxc/5'}]])
+        with open('test/juju-output/juju-status-single-install.yaml') as f:
+            diff = self.after.diff(JujuState(f.read()))
+        self.assertEqual(diff.changed['units'],
+                         {'mysql/0': {'agent-state': ('pending',
+                                                      'started')}})
+        self.assertEqual(diff.services_touched(), {'mysql'})
+
+    def test_diff_from_nothing(self):
+        diff = self.after.diff(None)
+        self.assertEqual(len(diff.added['services']), 8)
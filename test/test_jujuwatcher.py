@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# test_jujuwatcher.py - Unittests for the juju AllWatcher state
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import unittest
+import mock
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+from cloudinstall.juju.client import JujuError
+from cloudinstall.juju import watcher
+
+
+class JujuWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.api_available = True
+        self.client.watch_all.return_value = 'w'
+        self.released = threading.Event()
+        self.sleeps = []
+        patcher = mock.patch('cloudinstall.juju.watcher.time.sleep',
+                             self.sleeps.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.released.set)
+
+    def watch(self, failures):
+        """ Deltas fail with `failures`, then one empty batch arrives
+        and the stream blocks
+        """
+        failures = list(failures)
+        delivered = threading.Event()
+
+        def watcher_next(watcher_id):
+            if failures:
+                raise failures.pop(0)
+            if not delivered.is_set():
+                delivered.set()
+                return []
+            self.released.wait()
+            raise JujuError("done")
+        self.client.watcher_next.side_effect = watcher_next
+        w = watcher.JujuWatcher(self.client)
+        w.start()
+        self.assertTrue(delivered.wait(5))
+        for _ in range(100):
+            if w.ready:
+                break
+            self.released.wait(0.01)
+        return w
+
+    def test_unexpected_error_restarts(self):
+        w = self.watch([KeyError('Relation')])
+        self.assertTrue(w.ready)
+        self.assertTrue(w._thread.is_alive())
+        self.assertEqual(self.client.close.call_count, 1)
+        self.assertEqual(self.client.watch_all.call_count, 2)
+
+    def test_repeated_errors_back_off(self):
+        w = self.watch([JujuError("a"), JujuError("b"), JujuError("c")])
+        self.assertTrue(w.ready)
+        self.assertEqual(self.sleeps, [1, 2, 4])
+        self.assertFalse(self.client.close.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+#
+# test_maasaioclient.py - Unittests for the asyncio MaaS client
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from urllib.parse import urlsplit, parse_qs
+import asyncio
+import json
+import unittest
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+from cloudinstall.maas import MaasState
+from cloudinstall.maas.auth import MaasAuth
+from cloudinstall.maas.aioclient import AsyncMaasClient
+
+
+class FakeMaas:
+    """ Answers every request with `body`, keeping connections open """
+
+    def __init__(self, body, chunked=False, delay=0, status=200):
+        self.body = body.encode('utf-8')
+        self.chunked = chunked
+        self.delay = delay
+        self.status = status
+        self.requests = []
+        self.headers = []
+        self.connections = 0
+        self.active = 0
+        self.most_active = 0
+
+    @asyncio.coroutine
+    def handle(self, reader, writer):
+        self.connections += 1
+        while True:
+            request_line = yield from reader.readline()
+            if not request_line:
+                break
+            length = 0
+            headers = {}
+            while True:
+                line = (yield from reader.readline()).strip()
+                if not line:
+                    break
+                name, _, value = line.decode().partition(':')
+                headers[name.lower()] = value.strip()
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            body = yield from reader.readexactly(length)
+            self.requests.append((request_line.decode().split(), body))
+            self.headers.append(headers)
+
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+            yield from asyncio.sleep(self.delay)
+            self.active -= 1
+
+            if self.status == 204:
+                # no body and no Content-Length, connection kept open
+                writer.write(b'HTTP/1.1 204 No Content\r\n\r\n')
+            elif self.chunked:
+                half = len(self.body) // 2
+                payload = b''.join(
+                    '{:x}\r\n'.format(len(c)).encode() + c + b'\r\n'
+                    for c in (self.body[:half], self.body[half:]))
+                writer.write(b'HTTP/1.1 200 OK\r\n'
+                             b'Transfer-Encoding: chunked\r\n\r\n' +
+                             payload + b'0\r\n\r\n')
+            else:
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: ' +
+                             str(len(self.body)).encode() + b'\r\n\r\n' +
+                             self.body)
+        writer.close()
+
+
+class AsyncMaasClientTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        with open('test/maas-output/twonodes.out') as f:
+            self.nodes = f.read()
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_client(self, maas, coro_func, max_connections=10, timeout=5):
+        @asyncio.coroutine
+        def run():
+            server = yield from asyncio.start_server(maas.handle,
+                                                     '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            auth = MaasAuth()
+            auth.api_url = 'http://127.0.0.1:{}/MAAS/api/1.0'.format(port)
+            auth.api_key = 'consumer:token:secret'
+            client = AsyncMaasClient(auth, timeout=timeout,
+                                     max_connections=max_connections)
+            try:
+                return (yield from coro_func(client))
+            finally:
+                client.close()
+                # let the handlers see the connections close
+                yield from asyncio.sleep(0.01)
+                server.close()
+                yield from server.wait_closed()
+        return self.loop.run_until_complete(run())
+
+    def test_nodes_list_signed_and_filtered(self):
+        maas = FakeMaas(self.nodes)
+        nodes = self.run_client(
+            maas, lambda c: c.nodes_list(zone='default',
+                                         status=MaasState.ALLOCATED))
+        self.assertEqual([n['status'] for n in nodes],
+                         [MaasState.ALLOCATED])
+        method, target, _ = maas.requests[0][0]
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        self.assertEqual((method, url.path), ('GET', '/MAAS/api/1.0/nodes/'))
+        self.assertEqual(query['op'], ['list'])
+        self.assertEqual(query['zone'], ['default'])
+        self.assertEqual(query['oauth_signature_method'], ['PLAINTEXT'])
+        self.assertEqual(query['oauth_token'], ['token'])
+
+    def test_chunked_response(self):
+        maas = FakeMaas(self.nodes, chunked=True)
+        nodes = self.run_client(maas, lambda c: c.nodes())
+        self.assertEqual(nodes, json.loads(self.nodes))
+
+    def test_connection_reused(self):
+        maas = FakeMaas('[]')
+
+        @asyncio.coroutine
+        def three_polls(client):
+            for _ in range(3):
+                yield from client.zones()
+        self.run_client(maas, three_polls)
+        self.assertEqual(len(maas.requests), 3)
+        self.assertEqual(maas.connections, 1)
+
+    def test_no_content_delete_keep_alive(self):
+        maas = FakeMaas('', status=204)
+
+        @asyncio.coroutine
+        def two_deletes(client):
+            return [(yield from client.node_remove('node-1')),
+                    (yield from client.tag_delete('t'))]
+        self.assertEqual(self.run_client(maas, two_deletes, timeout=1),
+                         [True, True])
+        self.assertEqual([r[0][0] for r in maas.requests],
+                         ['DELETE', 'DELETE'])
+        self.assertEqual(maas.connections, 1)
+
+    def test_host_header_port(self):
+        maas = FakeMaas('[]')
+        self.run_client(maas, lambda c: c.zones())
+        host, port = maas.headers[0]['host'].split(':')
+        self.assertEqual(host, '127.0.0.1')
+        self.assertTrue(port.isdigit())
+
+    def test_post_form_body(self):
+        maas = FakeMaas('')
+        ok = self.run_client(maas, lambda c: c.tag_machines('t', ['a', 'b']))
+        self.assertTrue(ok)
+        (method, target, _), body = maas.requests[0]
+        self.assertEqual((method, urlsplit(target).path),
+                         ('POST', '/MAAS/api/1.0/tags/t/'))
+        self.assertEqual(parse_qs(body.decode()),
+                         dict(op=['update_nodes'], add=['a', 'b']))
+
+    def test_bulk_concurrency_limited(self):
+        maas = FakeMaas('', delay=0.05)
+        ids = ['node-{}'.format(i) for i in range(6)]
+        results = self.run_client(maas, lambda c: c.nodes_start(ids),
+                                  max_connections=2)
+        self.assertEqual(set(results), set(ids))
+        self.assertTrue(all(ok for ok, _ in results.values()))
+        self.assertEqual(maas.most_active, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# test_maasbootimages.py - Unittests for MAAS boot image imports
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+import mock
+
+from cloudinstall.maas import bootimages
+from cloudinstall.maas.bootimages import BootImageProgress, BootImageSync
+
+
+TRUSTY = dict(release='trusty', architecture='amd64/generic')
+PRECISE = dict(release='precise', architecture='amd64/generic')
+
+
+class BootImageProgressTest(unittest.TestCase):
+    def test_images_aggregated(self):
+        p = BootImageProgress(releases=['trusty', 'utopic'], arches=['amd64'])
+        p.add('a', [TRUSTY])
+        p.add('b', [])
+        self.assertEqual((p.available, p.total, p.percent), (1, 4, 25))
+        self.assertFalse(p.done)
+
+    def test_done_once_expected_images_present(self):
+        p = BootImageProgress()
+        p.add('a', [TRUSTY])
+        p.add('b', [PRECISE, TRUSTY])
+        self.assertTrue(p.done)
+        self.assertEqual(p.percent, 100)
+
+    def test_other_images_not_done(self):
+        p = BootImageProgress()
+        p.add('a', [PRECISE])
+        self.assertFalse(p.done)
+        self.assertEqual(p.percent, 0)
+        self.assertEqual(p.nodegroups['a']['missing'], [('trusty', 'amd64')])
+
+
+class BootImageSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.nodegroups = [dict(uuid='a', status=1),
+                                  dict(uuid='b', status=1),
+                                  dict(uuid='master', status=0)]
+        self.client.bulk.side_effect = lambda op, ids: {
+            i: (op(i), 0) for i in ids}
+        self.client.nodegroup_import_boot_images.return_value = True
+        self.sync = BootImageSync(self.client, interval=0, max_interval=0)
+
+    def test_start_on_accepted_clusters(self):
+        self.assertTrue(self.sync.start())
+        self.assertEqual(
+            sorted(c[0][0] for c in
+                   self.client.nodegroup_import_boot_images.call_args_list),
+            ['a', 'b'])
+
+    def test_wait_until_done(self):
+        listings = iter([[PRECISE], [TRUSTY], [TRUSTY], [TRUSTY]])
+        self.client.boot_images.side_effect = lambda uuid: next(listings)
+        seen = []
+        progress = self.sync.wait(lambda p: seen.append(p.percent))
+        self.assertTrue(progress.done)
+        self.assertEqual(seen, [50, 100])
+
+    def test_progress_only_reads(self):
+        self.client.boot_images.return_value = [TRUSTY]
+        self.sync.poll()
+        self.assertFalse(self.client.post.called)
+        self.assertFalse(self.client.nodegroups_download_progress.called)
+
+    def test_wait_times_out(self):
+        self.client.boot_images.return_value = []
+        progress = self.sync.wait(timeout=0)
+        self.assertFalse(progress.done)
+
+    def test_gauge_prompt(self):
+        self.assertEqual(bootimages.gauge_prompt(45, "Importing"),
+                         "XXX\n45\nImporting\nXXX")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,13 +17,20 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import unittest
 import os
 import sys
+import tempfile
 sys.path.insert(0, '../cloudinstall')
 
+import mock
+import requests
+from requests.packages.urllib3.exceptions import MaxRetryError
+
+from cloudinstall.maas import MaasState
 from cloudinstall.maas.auth import MaasAuth
-from cloudinstall.maas.client import MaasClient
+from cloudinstall.maas.client import MaasClient, iter_json_array
 from cloudinstall.utils import randomString
 
 ROOT_USER = os.environ['CI_USER'] if 'CI_USER' in os.environ else 'admin'
@@ -37,6 +44,57 @@ class MaasAuthTest(unittest.TestCase):
         AUTH.get_api_key(ROOT_USER)
         self.assertEquals(3, len(AUTH.api_key.split(':')))
 
+
+class MaasAuthCacheTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.creds = tempfile.mkstemp()
+        os.close(fd)
+        self.write_key('consumer:token:secret', 1000)
+        self.addCleanup(os.remove, self.creds)
+        self.addCleanup(MaasAuth._credentials.pop, self.creds, None)
+
+    def write_key(self, api_key, mtime):
+        with open(self.creds, 'w') as f:
+            f.write(api_key + '\n')
+        os.utime(self.creds, (mtime, mtime))
+
+    def auth(self):
+        auth = MaasAuth()
+        auth.creds_file = self.creds
+        auth.get_api_key()
+        return auth
+
+    def test_key_parts(self):
+        auth = self.auth()
+        self.assertEqual((auth.consumer_key, auth.token_key,
+                          auth.token_secret),
+                         ('consumer', 'token', 'secret'))
+
+    def test_read_once_per_process(self):
+        self.auth()
+        with mock.patch('builtins.open') as m_open:
+            auth = self.auth()
+        self.assertFalse(m_open.called)
+        self.assertEqual(auth.api_key, 'consumer:token:secret')
+
+    def test_reloaded_when_file_changes(self):
+        auth = self.auth()
+        self.write_key('other:token:secret', 2000)
+        auth.get_api_key()
+        self.assertEqual(auth.consumer_key, 'other')
+
+    @mock.patch('cloudinstall.maas.auth.check_output')
+    def test_apikey_command_run_once(self, m_check_output):
+        self.addCleanup(MaasAuth._credentials.pop, 'someone', None)
+        m_check_output.return_value = b'a:b:c\n'
+        auth = MaasAuth()
+        auth.creds_file = self.creds + '.missing'
+        auth.get_api_key('someone')
+        auth.get_api_key('someone')
+        self.assertEqual(m_check_output.call_count, 1)
+        self.assertEqual(auth.token_secret, 'c')
+
+
 @unittest.skipIf(not MAAS_INSTALLED, "Maas is not installed")
 class MaasClientTest(unittest.TestCase):
     def setUp(self):
@@ -70,5 +128,275 @@ class MaasClientZoneTest(unittest.TestCase):
         self.assertTrue(self.zone_name in [z['name'] for z in self.c.zones])
 
 
+class MaasClientSessionTest(unittest.TestCase):
+    def setUp(self):
+        auth = MaasAuth()
+        auth.api_key = 'consumer:token:secret'
+        self.c = MaasClient(auth, backoff=0)
+        self.c.session = mock.Mock()
+        self.ok = mock.Mock(ok=True, status_code=200, text='[]')
+
+    def test_oauth_signer_reused(self):
+        self.assertIs(self.c._oauth(), self.c._oauth())
+        signer = self.c._oauth()
+        self.c.auth.api_key = 'other:token:secret'
+        self.assertIsNot(self.c._oauth(), signer)
+
+    def test_retry_connection_error(self):
+        self.c.session.request.side_effect = [requests.ConnectionError(),
+                                              self.ok]
+        self.assertEqual(self.c.nodes, [])
+        self.assertEqual(self.c.session.request.call_count, 2)
+
+    def test_post_retried_when_refused(self):
+        refused = requests.ConnectionError(MaxRetryError(
+            None, '/nodes/', ConnectionRefusedError(111, 'refused')))
+        self.c.session.request.side_effect = [refused, self.ok]
+        self.assertTrue(self.c.nodes_accept_all())
+        self.assertEqual(self.c.session.request.call_count, 2)
+
+    def test_post_not_retried_once_sent(self):
+        aborted = requests.ConnectionError(MaxRetryError(
+            None, '/nodes/', ConnectionResetError(104, 'reset')))
+        self.c.session.request.side_effect = [aborted, self.ok]
+        self.assertRaises(requests.ConnectionError, self.c.nodes_accept_all)
+        self.assertEqual(self.c.session.request.call_count, 1)
+
+    def test_post_not_retried_on_timeout(self):
+        self.c.session.request.side_effect = [requests.Timeout(), self.ok]
+        self.assertRaises(requests.Timeout, self.c.nodes_accept_all)
+        self.assertEqual(self.c.session.request.call_count, 1)
+
+    def test_retries_exhausted(self):
+        self.c.session.request.side_effect = requests.ConnectionError()
+        self.assertRaises(requests.ConnectionError, self.c.get, '/nodes/')
+        self.assertEqual(self.c.session.request.call_count, 4)
+
+    def test_get_retried_on_server_error(self):
+        error = mock.Mock(ok=False, status_code=503)
+        self.c.session.request.side_effect = [error, self.ok]
+        self.assertEqual(self.c.nodes, [])
+
+    def test_post_not_retried_on_server_error(self):
+        error = mock.Mock(ok=False, status_code=503)
+        self.c.session.request.side_effect = [error, self.ok]
+        self.assertFalse(self.c.nodes_accept_all())
+
+
+class MaasClientTagTest(unittest.TestCase):
+    def setUp(self):
+        auth = MaasAuth()
+        auth.api_key = 'consumer:token:secret'
+        self.c = MaasClient(auth)
+        self.c.session = mock.Mock()
+        self.c.session.request.return_value = mock.Mock(
+            ok=True, status_code=200,
+            text=json.dumps([{'name': 'use-fastpath-installer'}]))
+        with open('test/maas-output/twonodes.out') as f:
+            self.nodes = json.load(f)
+
+    def requests_made(self, method):
+        return [c for c in self.c.session.request.call_args_list
+                if c[0][0] == method]
+
+    def test_tag_list_cached(self):
+        self.c.tag_new('a')
+        self.c.tag_new('b')
+        self.c.tag_new('a')
+        self.assertEqual(len(self.requests_made('GET')), 1)
+        self.assertEqual(len(self.requests_made('POST')), 2)
+
+    def test_tag_new_after_invalidation(self):
+        post = self.c.post
+
+        def invalidating_post(*args, **kwargs):
+            self.c.invalidate_tags()
+            return post(*args, **kwargs)
+        self.c.post = invalidating_post
+        self.assertTrue(self.c.tag_new('a'))
+        self.c.tag_names()
+        self.assertEqual(len(self.requests_made('GET')), 2)
+
+    def test_tagged_nodes_skipped(self):
+        maas = MaasState(self.nodes)
+        self.c.tag_name(maas)
+        self.c.tag_fpi(maas)
+        self.assertEqual(self.c.session.request.call_count, 0)
+
+    def test_untagged_nodes_grouped(self):
+        for node in self.nodes:
+            node['tag_names'] = []
+            node['status'] = MaasState.DECLARED
+        self.c.tag_fpi(MaasState(self.nodes))
+        posts = self.requests_made('POST')
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(sorted(posts[0][1]['data']['add']),
+                         sorted(n['system_id'] for n in self.nodes))
+
+
+class MaasClientBulkTest(unittest.TestCase):
+    def setUp(self):
+        auth = MaasAuth()
+        auth.api_key = 'consumer:token:secret'
+        self.c = MaasClient(auth, retries=0)
+        self.c.session = mock.Mock()
+
+    def test_per_node_results(self):
+        def request(method, url, **kwargs):
+            return mock.Mock(ok='node-2' not in url, status_code=200)
+        self.c.session.request.side_effect = request
+        res = self.c.nodes_start(['node-1', 'node-2', 'node-3'])
+        self.assertEqual({k: v[0] for k, v in res.items()},
+                         {'node-1': True, 'node-2': False, 'node-3': True})
+
+    def test_failed_request_reported(self):
+        self.c.session.request.side_effect = requests.ConnectionError()
+        res = self.c.nodes_stop(['node-1'])
+        self.assertFalse(res['node-1'][0])
+
+    def test_accept_single_request(self):
+        self.c.session.request.return_value = mock.Mock(ok=True,
+                                                        status_code=200)
+        res = self.c.nodes_accept(['node-1', 'node-2'])
+        self.assertEqual(self.c.session.request.call_count, 1)
+        self.assertEqual(set(res), {'node-1', 'node-2'})
+
+
+class MaasClientNodeFilterTest(unittest.TestCase):
+    def setUp(self):
+        auth = MaasAuth()
+        auth.api_key = 'consumer:token:secret'
+        self.c = MaasClient(auth)
+        self.c.session = mock.Mock()
+        with open('test/maas-output/twonodes.out') as f:
+            self.c.session.request.return_value = mock.Mock(
+                ok=True, status_code=200, text=f.read())
+
+    def test_filters_in_query(self):
+        self.c.nodes_list(hostname='node1.maas', zone='default')
+        params = self.c.session.request.call_args[1]['params']
+        self.assertEqual(params, dict(op='list', hostname='node1.maas',
+                                      zone='default'))
+
+    def test_status_filter(self):
+        nodes = self.c.nodes_list(status=MaasState.ALLOCATED)
+        self.assertEqual([n['status'] for n in nodes],
+                         [MaasState.ALLOCATED])
+
+    def test_projection(self):
+        nodes = self.c.nodes_list(fields=['system_id', 'status'])
+        self.assertEqual(set(nodes[0]), {'system_id', 'status'})
+
+
+class MaasClientResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        auth = MaasAuth()
+        auth.api_key = 'consumer:token:secret'
+        self.c = MaasClient(auth)
+        self.c.session = mock.Mock()
+        self.listing = mock.Mock(ok=True, status_code=200, text='[{"a": 1}]',
+                                 headers={'ETag': '"v1"'})
+        self.c.session.request.return_value = self.listing
+
+    def expire(self):
+        for entry in self.c._response_cache.values():
+            entry['expires'] = 0
+
+    def test_fresh_listing_served_from_memory(self):
+        self.assertIs(self.c.zones, self.c.zones)
+        self.assertEqual(self.c.session.request.call_count, 1)
+
+    def test_revalidated_with_etag(self):
+        zones = self.c.zones
+        self.expire()
+        self.c.session.request.return_value = mock.Mock(
+            ok=True, status_code=304, text='', headers={})
+        self.assertIs(self.c.zones, zones)
+        headers = self.c.session.request.call_args[1]['headers']
+        self.assertEqual(headers, {'If-None-Match': '"v1"'})
+
+    def test_identical_body_not_parsed(self):
+        zones = self.c.zones
+        self.expire()
+        self.assertIs(self.c.zones, zones)
+        self.assertEqual(self.c.session.request.call_count, 2)
+
+    def test_changed_body_parsed(self):
+        self.c.zones
+        self.expire()
+        self.listing.text = '[{"a": 2}]'
+        self.assertEqual(self.c.zones, [{'a': 2}])
+
+    def test_write_invalidates(self):
+        self.c.zones
+        self.c.zone_new('z')
+        self.c.zones
+        self.assertEqual(self.c.session.request.call_count, 3)
+
+    def test_write_keeps_other_listings(self):
+        self.c.zones
+        self.c.users
+        self.c.nodes_accept_all()
+        self.c.zones
+        self.c.users
+        self.assertEqual(self.c.session.request.call_count, 3)
+
+    def test_tag_write_invalidates_nodes(self):
+        self.c.nodes
+        self.c.zones
+        self.c.post('/tags/t/', dict(op='update_nodes', add='node-1'))
+        self.c.nodes
+        self.c.zones
+        self.assertEqual(self.c.session.request.call_count, 4)
+
+    def test_params_cached_separately(self):
+        self.c.nodes_list(zone='a')
+        self.c.nodes_list(zone='b')
+        self.c.nodes_list(zone='a')
+        self.assertEqual(self.c.session.request.call_count, 2)
+
+
+class MaasClientStreamTest(unittest.TestCase):
+    def setUp(self):
+        auth = MaasAuth()
+        auth.api_key = 'consumer:token:secret'
+        self.c = MaasClient(auth)
+        self.c.session = mock.Mock()
+        with open('test/maas-output/twonodes.out', 'rb') as f:
+            self.body = f.read()
+
+    def test_iter_json_array_bytewise(self):
+        body = '[{"name": "caf\u00e9"}, 12, [1, 2], "x"]'.encode('utf-8')
+        chunks = [body[i:i + 1] for i in range(len(body))]
+        self.assertEqual(list(iter_json_array(chunks)),
+                         [{'name': 'caf\u00e9'}, 12, [1, 2], 'x'])
+
+    def test_iter_json_array_truncated(self):
+        self.assertRaises(ValueError, list,
+                          iter_json_array([b'[{"a": 1}, {"b"']))
+
+    def test_nodes_iter(self):
+        res = mock.Mock(ok=True, status_code=200)
+        res.iter_content.return_value = [self.body[i:i + 100]
+                                         for i in range(0, len(self.body),
+                                                        100)]
+        self.c.session.request.return_value = res
+        machines = list(self.c.nodes_iter(status=MaasState.COMMISSIONING,
+                                          fields=['hostname', 'status']))
+        self.assertEqual([m.hostname for m in machines], ['4jq9g.maas'])
+        self.assertEqual(set(machines[0].machine), {'hostname', 'status'})
+        self.assertTrue(self.c.session.request.call_args[1]['stream'])
+        self.assertTrue(res.close.called)
+
+    def test_maas_state_reads_lazily(self):
+        nodes = list(reversed(json.loads(self.body.decode('utf-8'))))
+        maas = MaasState(iter(nodes))
+        first = next(maas.machines())
+        self.assertEqual(first.hostname, '4jq9g.maas')
+        self.assertEqual(len(maas.maas), 1)
+        self.assertIs(maas.machine_by_hostname('4jq9g.maas'), first)
+        self.assertEqual(len(maas.maas), 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# test_maasreconciler.py - Unittests for MAAS node reconciliation
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+import unittest
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+import mock
+
+from cloudinstall.maas import MaasState
+from cloudinstall.maas.reconciler import MaasReconciler
+
+NODE = 'node-f63668f6-c05a-11e3-9fc4-52540096c280'
+
+
+class MaasReconcilerTest(unittest.TestCase):
+    def setUp(self):
+        with open('test/maas-output/twonodes.out') as f:
+            self.nodes = json.load(f)
+        self.client = mock.Mock()
+        self.reconciler = MaasReconciler(self.client)
+        self.reconciler.start = mock.Mock()
+
+    def test_reconciled_state_skipped(self):
+        self.assertFalse(self.reconciler.notify(MaasState(self.nodes)))
+        self.assertEqual(self.reconciler.metrics['skipped'], 1)
+        self.assertFalse(self.reconciler.start.called)
+
+    def untag(self):
+        self.nodes[1]['tag_names'].remove(NODE)
+
+    def test_untagged_node_scheduled(self):
+        self.untag()
+        self.assertTrue(self.reconciler.notify(MaasState(self.nodes)))
+        self.assertTrue(self.reconciler.start.called)
+
+    def test_declared_tagged_then_accepted(self):
+        self.nodes[1]['status'] = MaasState.DECLARED
+        self.nodes[1]['tag_names'] = []
+        maas = MaasState(self.nodes)
+        self.assertTrue(self.reconciler.reconcile(maas))
+        self.assertEqual(self.client.method_calls, [
+            mock.call.tag_fpi(maas),
+            mock.call.nodes_accept_all(),
+            mock.call.tag_name(maas)])
+        self.assertEqual(self.reconciler.metrics['accepted'], 1)
+        self.assertEqual(self.reconciler.metrics['tagged'], 1)
+
+    def test_failed_write_counted(self):
+        self.untag()
+        self.client.tag_name.return_value = False
+        self.assertFalse(self.reconciler.reconcile(MaasState(self.nodes)))
+        self.assertEqual(self.reconciler.metrics['errors'], 1)
+        self.assertEqual(self.reconciler.metrics['runs'], 1)
+
+    def test_unexpected_error_keeps_running(self):
+        self.untag()
+        del self.reconciler.start
+        self.reconciler.interval = 0
+        self.client.tag_name.side_effect = [ValueError("bad json"), True]
+        self.reconciler.notify(MaasState(self.nodes))
+        for _ in range(500):
+            if self.reconciler.metrics['errors']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.reconciler.metrics['errors'], 1)
+        self.assertTrue(self.reconciler._thread.is_alive())
+
+        self.reconciler.notify(MaasState(self.nodes))
+        for _ in range(500):
+            if self.reconciler.metrics['runs']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.reconciler.metrics['tagged'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
+import json
 import sys
+import unittest
 sys.path.append('../cloudinstall')
 
 from cloudinstall.pegasus import MaasState
@@ -11,3 +13,39 @@ load_status = lambda f: helpers.load_status(f, MaasState)
 #     assert s.machines == 2
 #     assert s.num_in_state(MaasState.ALLOCATED) == 1
 #     assert s.num_in_state(MaasState.READY) == 1
+
+
+class MaasStateIndexTest(unittest.TestCase):
+    BOOTSTRAP = 'node-8e9debfc-c059-11e3-9fc4-52540096c280'
+    NODE = 'node-f63668f6-c05a-11e3-9fc4-52540096c280'
+
+    def setUp(self):
+        with open('test/maas-output/twonodes.out') as f:
+            self.maas = MaasState(json.load(f))
+
+    def test_bootstrap_node_skipped(self):
+        self.assertEqual([m.system_id for m in self.maas.machines()],
+                         [self.NODE])
+        self.assertIsNone(self.maas.machine_by_system_id(self.BOOTSTRAP))
+
+    def test_lookups_share_one_machine(self):
+        m = self.maas.machine_by_system_id(self.NODE)
+        self.assertIs(self.maas.machine(m.instance_id), m)
+        self.assertIs(self.maas.machine_by_hostname('4jq9g.maas'), m)
+        self.assertIs(self.maas.machine_by_mac('52:54:00:b3:ea:e1'), m)
+        self.assertIs(next(self.maas.machines()), m)
+
+    def test_unknown_machine(self):
+        self.assertIsNone(self.maas.machine('/MAAS/api/1.0/nodes/nope/'))
+
+    def test_projection_without_hostname(self):
+        maas = MaasState([dict(system_id=self.NODE, status=4)])
+        self.assertEqual(maas.machine_by_system_id(self.NODE).status, 4)
+        self.assertEqual(maas.num_in_state(MaasState.READY), 1)
+
+    def test_status_counts(self):
+        self.assertEqual(self.maas.status_counts,
+                         {MaasState.COMMISSIONING: 1})
+        self.assertEqual(self.maas.num_in_state(MaasState.COMMISSIONING), 1)
+        self.assertEqual(self.maas.num_in_state(MaasState.READY), 0)
+        self.assertEqual(self.maas.machines_allocated(), [])
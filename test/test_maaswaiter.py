@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+# test_maaswaiter.py - Unittests for waiting on MAAS nodes
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+import mock
+
+from cloudinstall.maas import MaasState
+from cloudinstall.maas.waiter import NodeWaiter, parse_status
+
+
+def listing(**statuses):
+    return [dict(system_id=system_id, status=status)
+            for system_id, status in statuses.items()]
+
+
+class NodeWaiterTest(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.waiter = NodeWaiter(self.client, interval=0, max_interval=0)
+
+    def test_waits_for_all_nodes(self):
+        self.client.nodes_list.side_effect = [
+            listing(a=MaasState.COMMISSIONING, b=MaasState.READY),
+            listing(a=MaasState.READY, b=MaasState.ALLOCATED),
+            listing(a=MaasState.ALLOCATED, b=MaasState.ALLOCATED)]
+        self.assertTrue(self.waiter.wait_for_status(
+            ['a', 'b'], MaasState.ALLOCATED))
+        self.assertEqual(self.client.nodes_list.call_count, 3)
+        self.assertEqual(self.client.invalidate_cache.call_count, 3)
+        self.assertEqual(
+            sorted(self.client.nodes_list.call_args[1]['system_ids']),
+            ['a', 'b'])
+
+    def test_several_target_statuses(self):
+        self.client.nodes_list.return_value = listing(a=MaasState.READY)
+        self.assertTrue(self.waiter.wait_for_nodes(
+            {'a': [MaasState.READY, MaasState.ALLOCATED]}))
+
+    def test_deadline(self):
+        self.client.nodes_list.return_value = listing(a=MaasState.READY)
+        self.assertFalse(self.waiter.wait_for_status(
+            ['a'], MaasState.ALLOCATED, timeout=0))
+
+    def test_cluster_registration(self):
+        type(self.client).nodegroups = mock.PropertyMock(side_effect=[
+            [dict(uuid='master')], [dict(uuid='1234')]])
+        self.assertEqual(self.waiter.wait_for_cluster_registration(), '1234')
+
+    @mock.patch('time.sleep')
+    def test_backoff_while_unchanged(self, m_sleep):
+        waiter = NodeWaiter(self.client, interval=1, max_interval=2)
+        self.client.nodes_list.side_effect = [
+            listing(a=MaasState.READY)] * 4 + [
+            listing(a=MaasState.ALLOCATED)]
+        self.assertTrue(waiter.wait_for_status(['a'], MaasState.ALLOCATED))
+        self.assertEqual([c[0][0] for c in m_sleep.call_args_list],
+                         [1, 1.5, 2, 2])
+
+    def test_parse_status(self):
+        self.assertEqual(parse_status('6'), MaasState.ALLOCATED)
+        self.assertEqual(parse_status('ready'), MaasState.READY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,13 @@
 import sys
+import threading
 import unittest
 import json
 
 sys.path.insert(0, '../cloudinstall')
 
+import mock
+
+from cloudinstall import pegasus
 from cloudinstall.pegasus import update_machine_info, NOVA_CLOUD_CONTROLLER
 from cloudinstall.juju import JujuState
 from cloudinstall.maas import MaasState
@@ -31,6 +35,28 @@ def test_parse_state():
             #assert machines[1]['storage'] == "100.0"
 
 
+def test_poll_state_concurrent():
+    # Each poll only returns once the other one has started, polled one
+    # after the other the barrier times out and breaks
+    both_polling = threading.Barrier(2, timeout=5)
+
+    def slow_juju():
+        both_polling.wait()
+        return JujuState({'machines': {}, 'services': {}})
+
+    def slow_maas():
+        both_polling.wait()
+        return MaasState([])
+
+    with mock.patch('cloudinstall.pegasus.poll_juju_state', slow_juju), \
+            mock.patch('cloudinstall.pegasus.poll_maas_state', slow_maas), \
+            mock.patch('cloudinstall.pegasus.MULTI_SYSTEM', True):
+        pegasus.poll_state()
+
+    assert not both_polling.broken
+    assert set(pegasus.poll_timings) >= {'juju', 'maas', 'total'}
+
+
 @unittest.skip
 def test_lxc():
     with open('test/juju-output/lxc.out') as js:
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+#
+# test_simulator.py - Unittests for the deployment simulator
+#
+# Copyright 2014 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+import sys
+sys.path.insert(0, '../cloudinstall')
+
+from cloudinstall.deploy import DEPLOY_RETRY_DELAY
+from cloudinstall.juju.client import JujuError
+from cloudinstall.simulator import (DeploySimulator, FakeJujuClient,
+                                    LatencyModel, SimulatedJuju)
+from helpers import charm
+
+
+class ManualClock:
+    def __init__(self):
+        self.time = 0
+
+    def now(self):
+        return self.time
+
+    def sleep(self, secs):
+        self.time += secs
+
+
+class SimulatedJujuTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = ManualClock()
+        self.latency = LatencyModel(dict(call=0, deploy=10, container=20,
+                                         provision=100, install=30))
+        self.juju = SimulatedJuju(self.clock, self.latency)
+        self.client = FakeJujuClient(self.juju, self.clock, self.latency)
+
+    def agent_state(self, unit):
+        return self.juju.state().unit(unit).agent_state
+
+    def test_latency_per_charm(self):
+        latency = LatencyModel({'install:mysql': 90})
+        self.assertEqual(latency('install', 'mysql'), 90)
+        self.assertEqual(latency('install', 'keystone'),
+                         latency('install'))
+
+    def test_container_unit_starts_after_latency(self):
+        self.client.deploy('mysql', dict(machine_id='lxc:1'))
+        self.assertEqual(self.clock.now(), 10)
+        self.assertEqual(self.agent_state('mysql/0'), 'pending')
+        self.clock.time = 60
+        self.assertEqual(self.agent_state('mysql/0'), 'started')
+        self.assertEqual(self.juju.state().unit('mysql/0').machine_id,
+                         '1/lxc/0')
+
+    def test_isolated_units_get_machines(self):
+        self.client.deploy('nova-compute', dict(machine_id=None,
+                                                instances=2))
+        machines = set(u.machine_id for u in
+                       self.juju.state().service('nova-compute').units)
+        self.assertEqual(machines, {'2', '3'})
+        self.clock.time = 139
+        self.assertEqual(self.agent_state('nova-compute/1'), 'pending')
+        self.clock.time = 140
+        self.assertEqual(self.agent_state('nova-compute/1'), 'started')
+
+    def test_relations_in_status(self):
+        self.client.deploy('nova-compute', dict(machine_id='lxc:1'))
+        self.client.deploy('rabbitmq-server', dict(machine_id='lxc:1'))
+        self.client.add_relation('nova-compute:amqp', 'rabbitmq-server:amqp')
+        service = self.juju.state().service('rabbitmq-server')
+        self.assertEqual(service.relation('amqp').charms, ['nova-compute'])
+        self.assertEqual(self.client.calls,
+                         dict(deploy=2, add_relation=1))
+
+    def test_relation_needs_services(self):
+        self.assertRaises(JujuError, self.client.add_relation,
+                          'keystone', 'mysql')
+
+
+class DeploySimulatorTest(unittest.TestCase):
+    CHARMS = [charm('mysql', priority=1),
+              charm('keystone', ['mysql'], priority=2),
+              charm('compute', ['mysql', 'keystone'], priority=3,
+                    isolate=True)]
+    LATENCIES = dict(call=0, deploy=5, add_relation=1, container=20,
+                     provision=100, install=30)
+
+    def simulate(self, charms=CHARMS, **kwargs):
+        return DeploySimulator(charms, latencies=self.LATENCIES,
+                               poll_interval=5, **kwargs).run()
+
+    def test_converges(self):
+        report = self.simulate()
+        self.assertTrue(report.converged)
+        self.assertEqual(report.calls, dict(deploy=3, add_relation=3))
+        self.assertEqual(report.num_calls, 6)
+        # mysql, keystone, then compute on a new machine, one after
+        # another by priority
+        self.assertGreaterEqual(report.converged_at, 5 + 5 + 5 + 130)
+        self.assertGreaterEqual(report.total_time, report.converged_at)
+        self.assertGreater(report.polls, 1)
+
+    def test_repeatable(self):
+        first = self.simulate()
+        second = self.simulate()
+        self.assertEqual((first.total_time, first.converged_at, first.polls),
+                         (second.total_time, second.converged_at,
+                          second.polls))
+
+    def test_wall_clock(self):
+        report = self.simulate(scale=2000)
+        self.assertTrue(report.converged)
+        self.assertGreaterEqual(report.converged_at, 5 + 5 + 5 + 130)
+
+    def test_install_mode_passed_to_charms(self):
+        for single, modes in ((True, (True, False)), (False, (False, True))):
+            seen = []
+
+            class Recording(charm('mysql')):
+                def setup(self, _id=None):
+                    seen.append((self.is_single, self.is_multi))
+                    super().setup(_id)
+
+            self.assertTrue(self.simulate([Recording],
+                                          single=single).converged)
+            self.assertEqual(seen, [modes])
+
+    def test_retry_on_simulated_clock(self):
+        failures = ['mysql']
+
+        class Flaky(charm('mysql')):
+            def setup(self, _id=None):
+                if failures:
+                    failures.pop()
+                    raise JujuError("boom")
+                super().setup(_id)
+
+        start = time.time()
+        report = self.simulate([Flaky])
+        self.assertLess(time.time() - start, DEPLOY_RETRY_DELAY)
+        self.assertTrue(report.converged)
+        self.assertGreaterEqual(report.converged_at, DEPLOY_RETRY_DELAY)
+
+    def test_timeout(self):
+        report = self.simulate(timeout=50)
+        self.assertFalse(report.converged)
+
+
+if __name__ == '__main__':
+    unittest.main()